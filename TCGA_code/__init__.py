@@ -1 +1,21 @@
-__all__ = ["match_computation"]
+__all__ = [
+    "match_computation",
+    "correlation",
+    "normalization",
+    "gene_dictionary",
+    "gene_panel",
+    "sparse",
+    "shared_cohort",
+    "significance",
+    "streaming",
+    "synthetic",
+    "instrumentation",
+    "service",
+    "client",
+    "pipeline",
+    "cohort",
+    "cohort_store",
+    "gdc",
+    "match_index",
+    "cli",
+]
@@ -0,0 +1,406 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store
+from TCGA_code import gdc
+from TCGA_code import gene_panel
+from TCGA_code import instrumentation
+from TCGA_code import service
+from TCGA_code import shared_cohort
+from TCGA_code import significance
+from TCGA_code import sparse
+from TCGA_code import streaming
+from TCGA_code import client as match_client
+from TCGA_code.pipeline import MatchPipeline
+
+
+def main(argv = None):
+    '''
+    Entry point of the tcga-matchmaker command.
+    '''
+    parser = argparse.ArgumentParser(prog = "tcga-matchmaker", description = "Match gene expression profiles against TCGA samples.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    common = argparse.ArgumentParser(add_help = False)
+    common.add_argument("--profile", metavar = "REPORT", help = "write a run report (wall and CPU time and rows of every "
+                                                                "stage) to this .json file and print its summary")
+    common.add_argument("--trace-memory", action = "store_true", help = "add the tracemalloc memory peak of every stage "
+                                                                        "to the run report (slows the run down)")
+
+    match = commands.add_parser("match", help = "score reference profiles against a TCGA "
+                                                "cohort (N x M correlation matrix)", parents = [common])
+    match.add_argument("references", nargs = "+", help = "reference profiles: files, directories or glob patterns")
+    match.add_argument("--cohort", nargs = "+", required = True, help = "cohort store directory, or TCGA sample "
+                                                                        "files / directories / glob patterns")
+    match.add_argument("-o", "--output", default = ".", help = "output directory (default: current directory)")
+    match.add_argument("--add-missing", action = "store_true", help = "add missing genes with zero expression levels instead of dropping them")
+    match.add_argument("--method", default = "z-score", help = "normalization method for the similiar genes: z-score, "
+                                                               "mean, min-max, log1p, cpm, quantile or raw")
+    match.add_argument("--threshold", type = float, default = 0.05, help = "sensitivity threshold for similiar genes (default 0.05)")
+    match.add_argument("--correlation", choices = ["pearson", "spearman"], default = "pearson", help = "correlation of the match scores (default pearson, see match_cohort)")
+    match.add_argument("--panel", help = "gene panel to restrict the matching to: a gene list "
+                                         "(one symbol per line or .csv) or a .gmt file")
+    match.add_argument("--panel-set", help = "gene set of a .gmt panel file")
+    match.add_argument("--no-genes", action = "store_true", help = "only write the correlation matrix")
+    match.add_argument("--workers", type = int, default = os.cpu_count(), help = "number of worker processes (default: all cores)")
+    match.add_argument("--block-size", type = int, default = 256, help = "number of TCGA samples per work unit (default 256)")
+    match.add_argument("--quiet", action = "store_true", help = "do not report progress")
+
+    compare = commands.add_parser("compare", help = "compare one reference profile with one TCGA sample", parents = [common])
+    compare.add_argument("reference", help = "reference profile file")
+    compare.add_argument("sample", help = "TCGA sample file")
+    compare.add_argument("--add-missing", action = "store_true", help = "add missing genes with zero expression levels instead of dropping them")
+    compare.add_argument("--method", default = "z-score", help = "normalization method: z-score, mean, "
+                                                                 "min-max, log1p, cpm, quantile or raw")
+    compare.add_argument("--threshold", type = float, default = 0.05, help = "sensitivity threshold for similiar genes (default 0.05)")
+    compare.add_argument("--panel", help = "gene panel to restrict the comparison to (gene list or .gmt file)")
+    compare.add_argument("--panel-set", help = "gene set of a .gmt panel file")
+
+    top = commands.add_parser("top", help = "stream a cohort block by block and report the "
+                                            "k best matches of one reference profile", parents = [common])
+    top.add_argument("reference", help = "reference profile file")
+    top.add_argument("--cohort", nargs = "+", required = True, help = "cohort store directory, or TCGA sample "
+                                                                      "files / directories / glob patterns")
+    top.add_argument("-k", type = int, default = 10, help = "number of best matches (default 10)")
+    top.add_argument("--add-missing", action = "store_true", help = "add missing genes with zero expression levels instead of dropping them")
+    top.add_argument("--block-size", type = int, default = 256, help = "number of TCGA samples read at once (default 256)")
+    top.add_argument("-o", "--output", help = "write the best matches to this .csv file instead of printing them")
+
+    significant = commands.add_parser("significance", help = "permutation p-values and FDR of the match "
+                                                             "scores of one reference profile", parents = [common])
+    significant.add_argument("reference", help = "reference profile file")
+    significant.add_argument("--cohort", nargs = "+", required = True, help = "cohort store directory, or TCGA sample "
+                                                                              "files / directories / glob patterns")
+    significant.add_argument("--permutations", type = int, default = 1000, help = "maximum number of permutations per sample (default 1000)")
+    significant.add_argument("--seed", type = int, default = None, help = "seed of the permutations")
+    significant.add_argument("--add-missing", action = "store_true", help = "add missing genes with zero expression levels instead of dropping them")
+    significant.add_argument("-o", "--output", help = "write the table to this .csv file instead "
+                                                      "of printing the significant matches")
+
+    serve = commands.add_parser("serve", help = "keep a cohort in memory and answer match queries (see the query command)", parents = [common])
+    serve.add_argument("--cohort", nargs = "+", required = True, help = "cohort store directory, or TCGA sample "
+                                                                        "files / directories / glob patterns")
+    serve.add_argument("--host", default = service.DEFAULT_HOST, help = f"address to listen on (default {service.DEFAULT_HOST}, this host only)")
+    serve.add_argument("--port", type = int, default = service.DEFAULT_PORT, help = f"port to listen on (default {service.DEFAULT_PORT})")
+    serve.add_argument("--socket", help = "listen on this Unix socket instead of a TCP port")
+    serve.add_argument("--normalization", choices = service.NORMALIZATIONS, default = "raw", help = "normalization of the cohort and of every profile (default raw)")
+    serve.add_argument("--spearman", action = "store_true", help = "also keep the sample ranks warm for spearman queries")
+    serve.add_argument("--workers", type = int, default = 4, help = "number of scoring threads (default 4)")
+    serve.add_argument("--batch-window", type = float, default = service.BATCH_WINDOW * 1000, help = "milliseconds a query waits for other queries to be scored with "
+                                                                                                     f"(default {service.BATCH_WINDOW * 1000:g}, 0: no batching)")
+    serve.add_argument("--max-batch", type = int, default = service.MAX_BATCH, help = "largest number of queries scored with one matrix "
+                                                                                      f"product (default {service.MAX_BATCH})")
+    serve.add_argument("--file-root", help = "only read profile files named by queries inside "
+                                             "this directory (default: file queries are refused, "
+                                             "clients send the profile itself)")
+
+    query = commands.add_parser("query", help = "score one reference profile on a running match server", parents = [common])
+    query.add_argument("reference", help = "reference profile file (read by the server, inside its --file-root)")
+    query.add_argument("--server", default = match_client.DEFAULT_ADDRESS, help = "address of the server: http://host:port or unix://path "
+                                                                                  f"(default {match_client.DEFAULT_ADDRESS})")
+    query.add_argument("-k", type = int, default = 10, help = "number of best matches (default 10)")
+    query.add_argument("--add-missing", action = "store_true", help = "add missing genes with zero expression levels instead of dropping them")
+    query.add_argument("--correlation", choices = ["pearson", "spearman"], default = "pearson", help = "correlation of the match scores (default pearson)")
+    query.add_argument("-o", "--output", help = "write the best matches to this .csv file instead of printing them")
+
+    ingest = commands.add_parser("ingest", help = "consolidate TCGA sample files into a cohort store", parents = [common])
+    ingest.add_argument("store", help = "directory of the cohort store")
+    ingest.add_argument("files", nargs = "+", help = "TCGA sample files or directories that contain them")
+
+    ingest_gdc = commands.add_parser("ingest-gdc", help = "build or update a cohort store from a GDC download tree", parents = [common])
+    ingest_gdc.add_argument("root", help = "directory of the GDC download tree")
+    ingest_gdc.add_argument("store", help = "directory of the cohort store")
+    ingest_gdc.add_argument("--workers", type = int, default = None, help = "number of worker processes (default: all cores)")
+    ingest_gdc.add_argument("--no-verify", action = "store_true", help = "do not check md5 sums and sizes")
+    ingest_gdc.add_argument("--value-column", default = "unstranded", help = "count column of the GDC .tsv files")
+    ingest_gdc.add_argument("--rebuild", action = "store_true", help = "parse all files again instead of only new or changed ones")
+
+    args = parser.parse_args(argv)
+    with instrumentation.profiling(args.trace_memory) if args.profile else nullcontext() as report:
+        run_command(args)
+    if args.profile:
+        report.to_json(args.profile)
+        print(report.format(), file = sys.stderr)
+
+
+def run_command(args):
+    '''
+    Run the subcommand of the parsed command line arguments.
+    '''
+    if args.command == "match":
+        run_match(args)
+    elif args.command == "compare":
+        panel = gene_panel.read_gene_panel(args.panel, args.panel_set) if args.panel else None
+        results = MatchPipeline(args.reference, args.sample, args.add_missing, args.method, args.threshold, panel = panel).run()
+        print(f"Match score (pearson correlation): {results['distance']}")
+        print(f"Similiar genes: {len(results['similiar_genes'])}")
+        print(f"Genes missing in the TCGA sample: {len(results['missing_TCGA'])}")
+        print("Genes missing in the reference profile: "
+              f"{len(results['missing_reference'])}")
+    elif args.command == "top":
+        ranking, summary = streaming.stream_match(m.read_expr_profile(args.reference), args.cohort, args.k, args.add_missing, args.block_size)
+        if args.output:
+            ranking.to_csv(args.output, index = False)
+        else:
+            print(ranking[["rank", "sample", "score"]].to_string(index = False))
+        print(", ".join(f"{name}: {value:.4g}" for name, value in summary.items()))
+    elif args.command == "significance":
+        cohort = load_cohort(args.cohort)[1]
+        ranking = significance.permutation_test(m.read_expr_profile(args.reference), cohort, args.permutations, seed = args.seed, add_missing = args.add_missing)
+        if args.output:
+            ranking.to_csv(args.output, index = False)
+        else:
+            print(ranking[ranking["q_value"] <= 0.05][["rank", "sample", "score", "p_value", "q_value", "adjusted_score"]].to_string(index = False))
+    elif args.command == "serve":
+        match_service = service.MatchService(load_cohort(args.cohort)[1], args.normalization, args.spearman, args.file_root)
+        service.serve(match_service, args.host, args.port, args.socket, args.workers, batch_window = args.batch_window / 1000, max_batch = args.max_batch)
+    elif args.command == "query":
+        with match_client.MatchClient(args.server) as client:
+            ranking = pd.DataFrame(client.score(args.reference, args.k, args.add_missing, args.correlation))
+        if args.output:
+            ranking.to_csv(args.output, index = False)
+        else:
+            print(ranking[["rank", "sample", "score"]].to_string(index = False))
+    elif args.command == "ingest":
+        cohort = cohort_store.ingest_cohort_store(args.files, args.store)
+        print(f"Wrote {cohort} to {args.store}")
+    elif args.command == "ingest-gdc":
+        cohort = gdc.ingest_gdc_tree(args.root, args.store, args.workers, not args.no_verify, args.value_column, incremental = not args.rebuild)
+        print(f"Wrote {cohort} to {args.store}")
+
+
+def run_match(args):
+    '''
+    Many-vs-many matching: every reference profile against every cohort sample.
+
+    Writes to the output directory:
+        correlations.csv: references x samples pearson (or spearman) correlations.
+        <reference>/missing_genes.csv: genes of the reference missing in the cohort
+            (missing_in = 'TCGA') and cohort genes missing in the reference
+            (missing_in = 'reference').
+        <reference>/similiar_genes.csv: sample, symbol and ratio of every gene with
+            similiar expression levels.
+
+    The work is split into (reference, block of samples) units that are scored in a
+    process pool.
+    '''
+    started = time.time()
+    report = (lambda text: None) if args.quiet else (lambda text: print(text, file = sys.stderr, flush = True))
+
+    reference_files = cohort_store.find_sample_files(expand_patterns(args.references))
+    cohort_source, cohort = load_cohort(args.cohort)
+    panel = None
+    if args.panel:
+        # The panel slice of the cohort is small, so the workers get it as it is instead
+        # of opening the store.
+        panel = gene_panel.read_gene_panel(args.panel, args.panel_set)
+        cohort = cohort.panel(panel)
+        cohort_source = cohort
+    report(f"{len(reference_files)} reference profile(s) x {cohort}")
+
+    names = _unique_names(reference_files)
+    profiles = [m.read_expr_profile(file_name) for file_name in reference_files]
+    if panel is not None:
+        profiles = [gene_panel.restrict_profile(profile, panel) for profile in profiles]
+    references = [prepare_reference(profile, cohort.genes, args.add_missing, args.correlation) for profile in profiles]
+    if args.correlation == "spearman" and isinstance(cohort_source, c.Cohort):
+        # Rank the samples once here rather than in every worker (a store has them on
+        # disk).
+        cohort.ranks()
+
+    output = Path(args.output)
+    output.mkdir(parents = True, exist_ok = True)
+    similiar_files = {}
+    if not args.no_genes:
+        for name, reference in zip(names, references):
+            (output / name).mkdir(exist_ok = True)
+            reference["missing"].to_csv(output / name / "missing_genes.csv", index = False)
+            similiar_files[name] = open(output / name / "similiar_genes.csv", "w")
+            similiar_files[name].write("sample,symbol,ratio\n")
+
+    tasks = []
+    for i, reference in enumerate(references):
+        for start in range(0, cohort.n_samples, args.block_size):
+            stop = min(start + args.block_size, cohort.n_samples)
+            tasks.append((i, reference["aligned"], reference["extra"], start, stop, args.method, args.threshold, not args.no_genes, reference["ranks"]))
+
+    correlations = np.full((len(references), cohort.n_samples), np.nan)
+    sample_names = cohort.samples["sample"].astype(str).to_numpy()
+    # The work units run in other processes: the run report only has the time of the
+    # whole scoring loop.
+    try:
+        with instrumentation.stage("cli.score_blocks", len(references) * cohort.n_samples) as record:
+            for done, (i, start, scores, genes, columns, ratios) in enumerate(_imap_blocks(tasks, cohort_source, args.workers)):
+                correlations[i, start:start + len(scores)] = scores
+                if not args.no_genes and len(genes) > 0:
+                    similiar = pd.DataFrame({"sample": sample_names[columns], "symbol": references[i]["genes"][genes], "ratio": ratios})
+                    similiar.to_csv(similiar_files[names[i]], header = False, index = False)
+                report(f"[{done + 1}/{len(tasks)}] {names[i]}: samples "
+                       f"{start + 1}-{start + len(scores)} ({time.time() - started:.1f}s)")
+            record["rows_out"] = correlations.size
+    finally:
+        for f in similiar_files.values():
+            f.close()
+
+    pd.DataFrame(correlations, index = names, columns = sample_names).to_csv(output / "correlations.csv")
+    report(f"Wrote {output / 'correlations.csv'} in {time.time() - started:.1f}s")
+
+
+def expand_patterns(patterns):
+    '''
+    Expand glob patterns (paths without wildcards are kept as they are).
+    '''
+    expanded = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            expanded.extend(sorted(glob.glob(pattern, recursive = True)))
+        else:
+            expanded.append(pattern)
+    return expanded
+
+
+@instrumentation.instrumented
+def load_cohort(paths):
+    '''
+    Open a cohort store (a single directory with a store.json) or read TCGA sample files
+    into a cohort.
+
+    Returns:
+        source (string or Cohort): What worker processes need to load the cohort (the
+                                   store directory or the cohort).
+        cohort (Cohort): The cohort.
+    '''
+    paths = expand_patterns(paths)
+    if len(paths) == 1 and (Path(paths[0]) / "store.json").exists():
+        return str(paths[0]), cohort_store.open_cohort_store(paths[0])
+    files = cohort_store.find_sample_files(paths)
+    cohort = c.read_cohort(files, [Path(file_name).stem for file_name in files])
+    return cohort, cohort
+
+
+@instrumentation.instrumented
+def prepare_reference(profile, genes, add_missing = False, correlation = "pearson"):
+    '''
+    Align a reference profile to the genes of a cohort once, so that work units only
+    carry numbers.
+
+    Returns a dict with:
+        aligned: the aligned profile (see cohort._align_profile).
+        ranks: for correlation = "spearman", the aligned ranks of the profile on all
+               cohort genes, otherwise None.
+        extra: levels of the reference genes that are missing in the cohort (compared
+               with zero levels if add_missing).
+        genes: symbols of the compared genes, in the row order of the similiar gene
+               computation.
+        missing: 'symbol', 'missing_in' dataframe of the genes that are missing in one
+                 of the datasets.
+    '''
+    levels = m._gene_levels(profile)
+    rows = genes.get_indexer(levels.index)
+    aligned = c._align_profile(profile, genes, add_missing)
+
+    missing_TCGA = levels.index[rows < 0]
+    missing_reference = genes[~genes.isin(levels.index)]
+    missing = pd.DataFrame({"symbol": np.concatenate([missing_TCGA.to_numpy(), missing_reference.to_numpy()]),
+                            "missing_in": ["TCGA"] * len(missing_TCGA) + ["reference"] * len(missing_reference)})
+
+    compared = genes if aligned[0] is None else genes[aligned[0]]
+    extra = np.empty(0)
+    if add_missing:
+        extra = levels.to_numpy(dtype = np.float64)[rows < 0]
+        compared = compared.append(missing_TCGA)
+    ranks = c._rank_profile(profile, genes) if correlation == "spearman" else None
+    return {"aligned": aligned, "extra": extra, "genes": compared.to_numpy(), "missing": missing, "ranks": ranks}
+
+
+# Cohort of a worker process, loaded once by _init_worker (and the shared memory blocks
+# it is attached to).
+_worker_cohort = None
+_worker_segments = []
+
+
+def _init_worker(cohort_source):
+    global _worker_cohort, _worker_segments
+    if isinstance(cohort_source, c.Cohort):
+        _worker_cohort = cohort_source
+    elif isinstance(cohort_source, dict):
+        _worker_cohort, _worker_segments = shared_cohort.attach_cohort(cohort_source)
+    else:
+        _worker_cohort = cohort_store.open_cohort_store(cohort_source)
+
+
+def _score_block(task):
+    # Work unit: one reference against the samples start:stop. Returns the scores and
+    # the similiar genes (positions in the compared genes, sample columns and ratios).
+    i, aligned, extra, start, stop, method, threshold, with_genes, ranks = task
+    rows = aligned[0]
+    block = _worker_cohort.matrix[:, start:stop]
+    sample_levels = block if rows is None else block[rows]
+    if ranks is None:
+        scores = c._score_columns((None,) + tuple(aligned[1:]), sample_levels)
+    else:
+        scores = c._score_columns(ranks, _worker_cohort.ranks()[:, start:stop])
+    if not with_genes:
+        empty = np.empty(0, dtype = np.int64)
+        return i, start, scores, empty, empty, np.empty(0)
+
+    # Levels of the compared genes; reference genes missing in the cohort have zero
+    # levels in every sample.
+    x = aligned[1]
+    sample_levels = sparse.dense(sample_levels)
+    if len(extra) > 0:
+        x = np.concatenate([x, extra])
+        sample_levels = np.vstack([sample_levels, np.zeros((len(extra), stop - start), dtype = sample_levels.dtype)])
+
+    ratio = m.expression_ratios(m.normalize_levels(x, method), m.normalize_levels(sample_levels, method))
+    genes, columns = np.nonzero(m.similiar_mask(ratio, threshold))
+    return i, start, scores, genes, columns + start, ratio[genes, columns]
+
+
+def _imap_blocks(tasks, cohort_source, workers):
+    # Results of the work units in the order they finish. One worker runs them in this
+    # process. An in-memory cohort is put into shared memory once instead of being
+    # pickled for every worker process; a cohort store is memory-mapped by the workers.
+    # The tasks only carry the reference and a column range.
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        _init_worker(cohort_source)
+        yield from map(_score_block, tasks)
+        return
+    shared = shared_cohort.SharedCohort(cohort_source) if isinstance(cohort_source, c.Cohort) else None
+    try:
+        handle = cohort_source if shared is None else shared.handle
+        with ProcessPoolExecutor(max_workers = min(workers, len(tasks)), initializer = _init_worker, initargs = (handle,)) as pool:
+            futures = [pool.submit(_score_block, task) for task in tasks]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        if shared is not None:
+            shared.close()
+
+
+def _unique_names(file_names):
+    # Output names of the references: the file names without extension, numbered if they
+    # repeat.
+    names = [Path(file_name).stem for file_name in file_names]
+    counts = pd.Series(names).value_counts()
+    seen = {}
+    unique = []
+    for name in names:
+        if counts[name] > 1:
+            seen[name] = seen.get(name, 0) + 1
+            name = f"{name}_{seen[name]}"
+        unique.append(name)
+    return unique
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import http.client
+import json
+import os
+import socket
+from urllib.parse import urlparse
+
+
+# Thin client of a match server (see service.MatchServer). It only uses the standard
+# library, so a script or notebook that queries a running server does not import numpy,
+# pandas or the cohort.
+DEFAULT_ADDRESS = "http://127.0.0.1:8765"
+
+
+class MatchClient:
+    '''
+    Client of a running match server. The connection is opened once and kept alive
+    between queries; use one client per thread.
+
+        # or MatchClient("unix:///tmp/tcga-matchmaker.sock")
+        client = MatchClient("http://127.0.0.1:8765")
+        ranking = client.score("reference.csv", k = 10)
+        pd.DataFrame(ranking)
+
+    Attributes:
+        address (string): "http://host:port" or "unix://path" of the server.
+    '''
+
+    def __init__(self, address = DEFAULT_ADDRESS, timeout = 60):
+        self.address = address
+        self.timeout = timeout
+        self._connection = None
+
+    def health(self):
+        '''
+        The cohort and the state of the server (see MatchService.info).
+        '''
+        return self._request("GET", "/health")
+
+    def score(self, profile, k = None, add_missing = False, method = "pearson", panel = None):
+        '''
+        Score a reference profile against every sample of the served cohort (see
+        cohort.match_cohort).
+
+        Parameters:
+            profile: A profile file on the server host (string or path, sent as an
+                     absolute path, so the file is read by the server; it has to be
+                     inside the file root of the server), a 'symbol', 'value' dataframe
+                     or a (symbols, values) pair.
+            k (int): Only return the k best matches (default: all samples).
+            add_missing, method, panel: see match_cohort.
+
+        Returns:
+            ranking (list of dicts): One dict per sample (sample metadata, 'score' and
+                                     'rank'), best match first.
+        '''
+        request = {"k": k, "add_missing": add_missing, "method": method, "panel": None if panel is None else list(panel)}
+        request.update(_profile_request(profile))
+        return self._request("POST", "/score", request)["ranking"]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"MatchClient({self.address!r})"
+
+    def _request(self, method, path, payload = None):
+        # One request over the kept-alive connection; a connection the server closed in
+        # the meantime is reopened once.
+        body = None if payload is None else json.dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = _connect(self.address, self.timeout)
+            try:
+                self._connection.request(method, path, body, headers)
+                response = self._connection.getresponse()
+                data = json.loads(response.read())
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt == 1:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"The match server answered {response.status}: "
+                               f"{data.get('error', data)}")
+        return data
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    # HTTP over a Unix socket.
+
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout = timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def _connect(address, timeout):
+    url = urlparse(address)
+    if url.scheme == "unix":
+        return _UnixConnection(url.path, timeout)
+    if url.scheme != "http":
+        raise ValueError(f"Not a valid match server address: {address}")
+    return http.client.HTTPConnection(url.hostname, url.port, timeout = timeout)
+
+
+def _profile_request(profile):
+    # The profile fields of a /score request.
+    if isinstance(profile, (str, os.PathLike)):
+        return {"file": os.path.abspath(profile)}
+    if isinstance(profile, tuple):
+        symbols, values = profile
+    else:
+        # A dataframe: tolist turns the columns into python objects without iterating
+        # over pandas scalars.
+        symbols, values = profile.iloc[:,0].astype(str).tolist(), profile.iloc[:,1].astype(float).tolist()
+    return {"profile": {"symbol": list(map(str, symbols)), "value": list(map(float, values))}}
@@ -0,0 +1,451 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code import correlation
+from TCGA_code import normalization
+from TCGA_code import gene_panel
+from TCGA_code import gene_dictionary
+from TCGA_code import instrumentation
+from TCGA_code import sparse
+
+
+# Number of gene panel slices a cohort keeps (see Cohort.panel).
+PANEL_CACHE_SIZE = 8
+
+
+class Cohort:
+    '''
+    A collection of TCGA samples that share one gene index.
+
+    Attributes:
+        genes (pd.Index): Sorted gene symbols. These are the rows of the matrix.
+        matrix (np.ndarray or scipy.sparse.csc_matrix): Expression levels as a genes x
+            samples matrix, dense or sparse (see to_sparse).
+        samples (pd.DataFrame): Sample metadata, one row per matrix column. Has at least
+                                a 'sample' column.
+    '''
+
+    def __init__(self, genes, matrix, samples = None, ranks = None, stats = None):
+        self.genes = pd.Index(genes)
+        self.matrix = matrix
+        if samples is None:
+            samples = pd.DataFrame({"sample": [f"sample_{i}" for i in range(matrix.shape[1])]})
+        self.samples = samples.reset_index(drop = True)
+        self._stats = stats
+        self._ranks = ranks
+        self._rank_sums = None
+        self._panels = OrderedDict()
+        self._gene_ids = None
+        self._row_lookup = None
+        # The caches above are filled lazily, possibly by several scoring threads at
+        # once (see service.MatchServer).
+        self._lock = threading.RLock()
+
+        assert self.matrix.ndim == 2, "The cohort matrix must be a genes x samples matrix."
+        assert self.matrix.shape[0] == len(self.genes), "The cohort matrix must have one row per gene."
+        assert self.matrix.shape[1] == len(self.samples), "The cohort matrix must have one column per sample."
+        assert self.genes.is_unique, "The gene index of a cohort must not contain duplicates."
+
+    @classmethod
+    def from_frame(cls, cohort_matrix):
+        '''
+        Build a cohort from a pandas df with gene symbols as index and one column per
+        sample.
+        '''
+        cohort_matrix = cohort_matrix.sort_index()
+        samples = pd.DataFrame({"sample": cohort_matrix.columns.astype(str)})
+        return cls(cohort_matrix.index, cohort_matrix.to_numpy(dtype = np.float32), samples)
+
+    def to_frame(self):
+        '''
+        Return the cohort as a pandas df with gene symbols as index and one column per
+        sample.
+        '''
+        return pd.DataFrame(sparse.dense(self.matrix), index = self.genes, columns = self.samples["sample"])
+
+    def to_sparse(self, dtype = None):
+        '''
+        The cohort with a sparse (CSC) matrix, see sparse.to_sparse: raw counts are kept
+        as uint32, other levels as float32. Mostly-zero count matrices take a fraction
+        of the dense memory and score faster.
+        '''
+        return Cohort(self.genes, sparse.to_sparse(self.matrix, dtype), self.samples, self._ranks, self._stats)
+
+    @property
+    def nbytes(self):
+        '''
+        Memory used by the expression levels, in bytes.
+        '''
+        return sparse.nbytes(self.matrix)
+
+    @property
+    def n_genes(self):
+        return self.matrix.shape[0]
+
+    @property
+    def n_samples(self):
+        return self.matrix.shape[1]
+
+    def sample_stats(self):
+        '''
+        Per-sample statistics: 'sum' (library size), 'sq_sum', 'min' and 'max' of every
+        sample column (float64). A cohort store keeps them on disk (see
+        write_cohort_store); otherwise they are computed once and cached.
+        '''
+        with self._lock:
+            if self._stats is None:
+                self._stats = normalization.sample_stats(self.matrix)
+            return self._stats
+
+    def column_sums(self):
+        '''
+        Sum and sum of squares of every sample column (float64), from the sample
+        statistics.
+        '''
+        stats = self.sample_stats()
+        return stats["sum"].to_numpy(), stats["sq_sum"].to_numpy()
+
+    def gene_ids(self):
+        '''
+        Ids of the cohort genes (see gene_dictionary.GeneDictionary), one int64 per row.
+        The genes are interned in gene_dictionary.GENES the first time this is called.
+        '''
+        with self._lock:
+            if self._gene_ids is None:
+                self._gene_ids = gene_dictionary.GENES.encode(self.genes)
+            return self._gene_ids
+
+    def gene_rows(self, ids):
+        '''
+        Rows of gene ids (see gene_ids), -1 for genes that are not in the cohort. The
+        integer hash table of the cohort ids is built once, so aligning an encoded
+        profile never hashes a gene symbol.
+        '''
+        with self._lock:
+            if self._row_lookup is None:
+                self._row_lookup = pd.Index(self.gene_ids())
+        return self._row_lookup.get_indexer(np.asarray(ids, dtype = np.int64)).astype(np.int32)
+
+    def panel(self, genes):
+        '''
+        The cohort restricted to the genes of a panel (see gene_panel.read_gene_panel).
+        Panel genes that are not in the cohort are left out.
+
+        The sliced matrix is a contiguous copy (sparse stays sparse), so scoring it
+        costs time in proportion to the panel size rather than the genome size. The
+        slices of the last PANEL_CACHE_SIZE panels are cached and reused by later
+        queries.
+
+        Parameters:
+            genes (list of strings): Gene symbols of the panel.
+
+        Returns:
+            cohort (Cohort): panel genes x samples cohort with the same sample table.
+        '''
+        rows = np.unique(self.genes.get_indexer(pd.Index(genes).unique()))
+        rows = rows[rows >= 0]
+        key = rows.tobytes()
+        with self._lock:
+            panel = self._panels.get(key)
+            if panel is not None:
+                self._panels.move_to_end(key)
+                return panel
+
+        matrix = self.matrix[rows] if sparse.issparse(self.matrix) else np.asfortranarray(self.matrix[rows])
+        panel = Cohort(self.genes[rows], matrix, self.samples)
+        with self._lock:
+            # Another thread may have sliced the same panel meanwhile: keep the cached
+            # one.
+            panel = self._panels.setdefault(key, panel)
+            self._panels.move_to_end(key)
+            while len(self._panels) > PANEL_CACHE_SIZE:
+                self._panels.popitem(last = False)
+        return panel
+
+    def normalized(self, method = "z-score", columns = None, **kwargs):
+        '''
+        Normalized copy of the cohort matrix, or of some of its sample columns (see
+        normalization.normalize_matrix). The sample statistics are reused, so only the
+        requested columns are read.
+
+        Parameters:
+            method (string): Normalization method.
+            columns (slice or np.ndarray): Sample columns to normalize (default: all).
+            kwargs: gene_lengths ("tpm") or target ("quantile") of normalize_matrix.
+
+        Returns:
+            levels (np.ndarray): genes x columns normalized levels.
+        '''
+        columns = slice(None) if columns is None else columns
+        stats = self.sample_stats().iloc[columns].reset_index(drop = True)
+        return normalization.normalize_matrix(self.matrix[:, columns], method, stats, copy = True, **kwargs)
+
+    def ranks(self):
+        '''
+        Gene ranks of every sample column (genes x samples, float32, ties get their
+        average rank). A cohort store keeps them on disk (see write_cohort_store);
+        otherwise they are computed once and cached.
+        '''
+        with self._lock:
+            if self._ranks is None:
+                self._ranks = rank_columns(self.matrix)
+            return self._ranks
+
+    def rank_sums(self):
+        '''
+        Sum and sum of squares of every rank column (float64). Computed once and cached.
+        '''
+        with self._lock:
+            if self._rank_sums is None:
+                self._rank_sums = _column_sums(self.ranks())
+            return self._rank_sums
+
+    def __len__(self):
+        return self.n_samples
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"Cohort({self.n_genes} genes x {self.n_samples} samples)"
+
+
+def read_cohort(file_names, sample_names = None, sparse_matrix = False):
+    '''
+    Read in several TCGA sample files (see read_TCGA_sample) and collect them into one
+    cohort. The cohort uses the union of all genes; genes missing in a sample get zero
+    expression levels.
+
+    Parameters:
+        file_names (list of strings): The TCGA sample files. ('symbol', 'value' .csv
+                                      files)
+        sample_names (list of strings): Names of the samples. Defaults to the file
+                                        names.
+        sparse_matrix (boolean): Keep the levels as a sparse matrix (see
+                                 Cohort.to_sparse).
+
+    Returns:
+        cohort (Cohort): genes x samples cohort.
+    '''
+    if sample_names is None:
+        sample_names = [str(file_name) for file_name in file_names]
+    assert len(sample_names) == len(file_names), "There must be one sample name per file."
+
+    levels = [m._gene_levels(m.read_TCGA_sample(file_name)) for file_name in file_names]
+    cohort_matrix = pd.concat(levels, axis = 1, keys = sample_names, sort = True).fillna(0)
+    cohort = Cohort.from_frame(cohort_matrix)
+    cohort.samples["file"] = [str(file_name) for file_name in file_names]
+    return cohort.to_sparse() if sparse_matrix else cohort
+
+
+@instrumentation.instrumented
+def match_cohort(profile, cohort_matrix, add_missing = False, method = "pearson", panel = None):
+    '''
+    Score a reference expression profile against every sample of a TCGA cohort in one
+    vectorized call. The score is the pearson correlation that compute_distance reports
+    for a single pair after check_TCGA and check_profile. Genes are aligned once for the
+    whole cohort.
+
+    The pearson correlation does not change under the z-score, mean or min-max
+    normalization, so the profiles do not have to be normalized first.
+
+    With method = "spearman", the score is the spearman correlation over the gene index
+    of the cohort: only the reference profile is ranked, the ranks of the samples are
+    computed once per cohort (see Cohort.ranks). Reference genes that are missing in the
+    cohort are left out and cohort genes that are missing in the reference count as zero
+    expression levels, whatever add_missing is (ranking a subset of genes would mean
+    ranking every sample again).
+
+    With a gene panel, both the profile and the cohort are restricted to the panel genes
+    first. The cohort slice is cached (see Cohort.panel), so later queries with the same
+    panel only score the panel rows.
+
+    Parameters:
+        profile (pd.DataFrame or tuple): Reference Profile dataset ('symbol', 'value'),
+                                         or an encoded (ids, values) profile (see
+                                         gene_dictionary.encode_profile), which is
+                                         aligned without looking up any gene symbol.
+        cohort_matrix (Cohort or pd.DataFrame): The TCGA samples. A pandas df needs gene
+                                                symbols as index and one column per
+                                                sample.
+        add_missing (boolean): If False, genes that only exist in one dataset are
+                               dropped. If True, they are kept with zero expression
+                               levels in the other dataset.
+        method (string): "pearson" or "spearman".
+        panel (list of strings): Gene symbols to restrict the matching to (see
+                                 gene_panel.read_gene_panel).
+
+    Returns:
+        ranking (pd.DataFrame): One row per sample, sorted from best to worst match.
+                                Columns: sample metadata, 'score' (correlation)
+                                and 'rank' (1 = best match).
+    '''
+    cohort = _as_cohort(cohort_matrix)
+    if panel is not None:
+        cohort = cohort.panel(panel)
+        profile = gene_panel.restrict_profile(profile, panel)
+    if method == "pearson":
+        scores = _cohort_scores(profile, cohort, add_missing)
+    elif method == "spearman":
+        scores = _score_columns(_rank_profile(profile, cohort), cohort.ranks(), cohort.rank_sums())
+    else:
+        raise ValueError(f"Not a valid correlation method: {method}")
+    return rank_samples(cohort.samples, scores)
+
+
+def rank_columns(matrix, block_size = 1024):
+    '''
+    Gene ranks of every column of a genes x samples matrix (float32, column-major, ties
+    get their average rank), computed block_size columns at a time.
+    '''
+    ranks = np.empty(matrix.shape, dtype = np.float32, order = "F")
+    for start in range(0, matrix.shape[1], block_size):
+        stop = min(start + block_size, matrix.shape[1])
+        ranks[:, start:stop] = correlation.rank(sparse.dense(matrix[:, start:stop]))
+    return ranks
+
+
+def rank_samples(samples, scores):
+    '''
+    Turn one score per cohort sample into a ranked table (best match first).
+
+    Parameters:
+        samples (pd.DataFrame): Sample table of the scored samples (e.g.
+                                Cohort.samples).
+        scores (np.ndarray): One score per sample, in the order of the sample table.
+
+    Returns:
+        ranking (pd.DataFrame): Sample metadata with 'score' and 'rank' columns, sorted
+                                by descending score.
+    '''
+    ranking = samples.reset_index(drop = True)
+    ranking["score"] = scores
+    ranking = ranking.sort_values("score", ascending = False, kind = "stable", na_position = "last", ignore_index = True)
+    ranking["rank"] = np.arange(1, len(ranking) + 1)
+    return ranking
+
+
+def _as_cohort(cohort_matrix):
+    if isinstance(cohort_matrix, Cohort):
+        return cohort_matrix
+    return Cohort.from_frame(cohort_matrix)
+
+
+def _cohort_scores(profile, cohort, add_missing = False):
+    # Pearson correlation of the profile against all cohort columns with one
+    # matrix-vector product.
+    aligned = _align_profile(profile, cohort, add_missing)
+    column_sums = cohort.column_sums() if aligned[0] is None else None
+    return _score_columns(aligned, cohort.matrix, column_sums)
+
+
+def _align_profile(profile, genes, add_missing = False):
+    # Align a profile to the rows of a cohort (genes: a Cohort or its gene index).
+    # Returns (rows, x, n, x_sum, x_sq_sum):
+    #   rows: the cohort rows to compare (None: all of them),
+    #   x: the profile levels on those rows,
+    #   n, x_sum, x_sq_sum: length and sums of the full profile vector that is compared.
+    rows, x_all = _profile_rows(profile, genes)
+    genes = genes.genes if isinstance(genes, Cohort) else genes
+    shared = rows >= 0
+
+    if not add_missing and shared.sum() < len(genes):
+        # Only the shared genes are compared: take those rows of the cohort (in cohort
+        # order).
+        order = np.argsort(rows[shared])
+        rows = rows[shared][order]
+        x = x_all[shared][order]
+        return rows, x, len(x), x.sum(), (x * x).sum()
+
+    # All cohort genes are compared. Profile genes that are missing in the cohort
+    # (add_missing = True) are zero in every sample, so they only add to the profile
+    # sums: the cohort matrix never has to be extended.
+    x = np.zeros(len(genes), dtype = np.float64)
+    x[rows[shared]] = x_all[shared]
+    if not add_missing:
+        x_all = x_all[shared]
+    n = len(genes) + len(x_all) - int(shared.sum())
+    return None, x, n, x_all.sum(), (x_all * x_all).sum()
+
+
+def _rank_profile(profile, genes):
+    # Ranks of a profile on all cohort genes (missing genes are zero), in the aligned
+    # form of _align_profile.
+    rows, levels = _profile_rows(profile, genes)
+    genes = genes.genes if isinstance(genes, Cohort) else genes
+    x = np.zeros(len(genes), dtype = np.float64)
+    x[rows[rows >= 0]] = levels[rows >= 0]
+    x = correlation.rank(x)
+    return None, x, len(x), x.sum(), (x * x).sum()
+
+
+def _profile_rows(profile, genes):
+    # Cohort rows of the profile genes (-1: not in the cohort) and their levels
+    # (float64). An encoded profile is looked up by gene id if genes is a Cohort
+    # (integer operations only), a dataframe by gene symbol.
+    if gene_dictionary.is_encoded(profile):
+        ids, values = profile
+        if isinstance(genes, Cohort):
+            rows = genes.gene_rows(ids)
+        else:
+            rows = pd.Index(gene_dictionary.symbol_ids(genes)).get_indexer(ids)
+        return rows, np.asarray(values, dtype = np.float64)
+    levels = m._gene_levels(profile)
+    genes = genes.genes if isinstance(genes, Cohort) else genes
+    return genes.get_indexer(levels.index), levels.to_numpy(dtype = np.float64)
+
+
+def _score_columns(aligned, matrix, column_sums = None):
+    # Pearson correlation of an aligned profile (see _align_profile) against the columns
+    # of a genes x samples matrix. column_sums: precomputed (sum, sum of squares) of the
+    # columns, only valid if all rows are compared.
+    rows, x, n, x_sum, x_sq_sum = aligned
+    sample_levels = matrix if rows is None else matrix[rows]
+    if rows is not None or column_sums is None:
+        column_sums = _column_sums(sample_levels)
+    y_sum, y_sq_sum = column_sums
+    return _pearson(x, sample_levels, n, x_sum, x_sq_sum, y_sum, y_sq_sum)
+
+
+def _column_sums(sample_levels):
+    # Sum and sum of squares of every sample column, accumulated in float64.
+    if sparse.issparse(sample_levels):
+        stats = normalization.column_stats(sample_levels)
+        return stats[:, 0], stats[:, 1]
+    y_sum = np.asarray(sample_levels.sum(axis = 0, dtype = np.float64)).ravel()
+    y_sq_sum = np.einsum("ij,ij->j", sample_levels, sample_levels, dtype = np.float64)
+    return y_sum, y_sq_sum
+
+
+def _pearson(x, sample_levels, n, x_sum, x_sq_sum, y_sum, y_sq_sum):
+    # Pearson correlation from sums. x holds the profile levels on the rows of
+    # sample_levels (genes x samples). n and the sums describe the full vectors, which
+    # may have extra genes that are zero in all samples. The sums of squares use the
+    # one-pass formula on float64 sums (the sample sums come from the stored statistics,
+    # so the cohort is not read twice); expression levels are far from the range where
+    # it cancels noticeably.
+    x_mean = x_sum / n
+    y_mean = y_sum / n
+    x_ss = x_sq_sum - n * x_mean * x_mean
+    y_ss = y_sq_sum - n * y_mean * y_mean
+
+    # sum((x - x_mean) * (y - y_mean)) = sum((x - x_mean) * y), and the genes outside of
+    # sample_levels have y = 0. The centered profile is cast to float32 for float32
+    # matrices so that the product runs in BLAS without copying the matrix. A sparse
+    # matrix only multiplies its non-zero levels.
+    centered = (x - x_mean).astype(np.float32 if sample_levels.dtype == np.float32 else np.float64, copy = False)
+    cross = np.asarray(centered @ sample_levels, dtype = np.float64).ravel()
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        scores = cross / np.sqrt(x_ss * y_ss)
+    # float32 products can overshoot +-1 by rounding.
+    return np.clip(scores, -1, 1)
@@ -0,0 +1,393 @@
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code import correlation
+from TCGA_code import normalization
+from TCGA_code import sparse
+from TCGA_code.cohort import Cohort
+
+
+# A cohort store is a directory with:
+#   store.json   - format version and matrix shape
+#   genes.npy    - the shared, sorted gene index
+#   matrix.f32   - float32 genes x samples expression matrix, column-major (every sample
+#                  is one contiguous block)
+#   ranks.f32    - float32 genes x samples gene ranks of every sample, column-major (see
+#                  Cohort.ranks)
+#   samples.csv  - sample metadata, one row per matrix column
+#   stats.csv    - sum (library size), sum of squares, minimum and maximum of every
+#                  sample (see Cohort.sample_stats)
+STORE_FORMAT = "tcga-matchmaker-cohort"
+STORE_VERSION = 1
+STORE_DTYPE = np.float32
+RANKS_FILE = "ranks.f32"
+STATS_FILE = "stats.csv"
+
+# An update writes the files it rewrites under this suffix and moves them into place
+# once store.json.tmp is written (see update_cohort_store), in this order: store.json is
+# replaced last.
+UPDATE_SUFFIX = ".tmp"
+STORE_FILES = ["matrix.f32", RANKS_FILE, STATS_FILE, "samples.csv", "genes.npy", "store.json"]
+
+
+def write_cohort_store(cohort, path):
+    '''
+    Write a cohort to an on-disk cohort store that open_cohort_store can memory-map. The
+    gene ranks and the statistics of every sample are written with the matrix, so
+    spearman matching only ranks the reference and normalizing the cohort does not need
+    an extra pass over it.
+
+    Parameters:
+        cohort (Cohort): The cohort to write.
+        path (string): Directory of the store. It is created if it does not exist.
+
+    Returns:
+        path (Path): Directory of the store.
+    '''
+    path = Path(path)
+    path.mkdir(parents = True, exist_ok = True)
+
+    matrix = _create_matrix(path, cohort.n_genes, cohort.n_samples)
+    if matrix is not None:
+        if sparse.issparse(cohort.matrix):
+            # The store is dense: a sparse cohort is written one densified column at a
+            # time.
+            for i in range(cohort.n_samples):
+                matrix[:, i] = sparse.dense(cohort.matrix[:, i]).ravel()
+        else:
+            matrix[:] = cohort.matrix
+        matrix.flush()
+        del matrix
+
+    _write_ranks(path, cohort.n_genes, cohort.n_samples)
+    _write_stats(path, normalization.sample_stats(_open_matrix(path / "matrix.f32", (cohort.n_genes, cohort.n_samples))))
+    _write_index(path, cohort.genes, cohort.samples)
+    return path
+
+
+def open_cohort_store(path, mmap = True):
+    '''
+    Open a cohort store written by write_cohort_store or ingest_cohort_store.
+
+    Parameters:
+        path (string): Directory of the store.
+        mmap (boolean): If True, the expression matrix and the gene ranks are
+                        memory-mapped read-only (zero-copy, pages are read on demand).
+                        If False, they are read into memory.
+
+    Returns:
+        cohort (Cohort): genes x samples cohort.
+    '''
+    path = Path(path)
+    _finish_update(path)
+    info = _read_info(path)
+    genes = np.load(path / "genes.npy", allow_pickle = False)
+    samples = pd.read_csv(path / "samples.csv", dtype = {"sample": str})
+    shape = (info["n_genes"], info["n_samples"])
+
+    matrix = _open_matrix(path / "matrix.f32", shape, mmap)
+    # Stores written before the ranks and statistics were kept compute them when they
+    # are needed.
+    ranks = _open_matrix(path / RANKS_FILE, shape, mmap) if info.get("ranks", False) else None
+    stats = _read_stats(path) if info.get("stats", False) else None
+
+    return Cohort(genes, matrix, samples, ranks, stats)
+
+
+def ingest_cohort_store(file_names, path, sample_names = None, output = True):
+    '''
+    Consolidate TCGA sample files (see read_TCGA_sample) into a cohort store. The store
+    uses the sorted union of all genes; genes missing in a sample get zero expression
+    levels. Samples are written one at a time, so memory use does not grow with the
+    number of samples.
+
+    Parameters:
+        file_names (list of strings): TCGA sample files or directories that contain them
+                                      (.csv or GDC .tsv files, searched recursively).
+        path (string): Directory of the store.
+        sample_names (list of strings): Names of the samples. Defaults to the file names
+                                        without extension.
+        output (boolean): Prints the progress.
+
+    Returns:
+        cohort (Cohort): The memory-mapped cohort store.
+    '''
+    file_names = find_sample_files(file_names)
+    if sample_names is None:
+        sample_names = [Path(file_name).stem for file_name in file_names]
+    assert len(sample_names) == len(file_names), "There must be one sample name per file."
+
+    # First pass: only the gene symbols, to build the shared gene index.
+    genes = pd.Index([], dtype = object)
+    for file_name in file_names:
+        genes = genes.union(_read_symbols(file_name))
+    genes = genes.sort_values()
+
+    # Second pass: fill the matrix one sample column at a time.
+    path = Path(path)
+    path.mkdir(parents = True, exist_ok = True)
+    matrix = _create_matrix(path, len(genes), len(file_names))
+    ranks = _create_matrix(path, len(genes), len(file_names), RANKS_FILE)
+    stats = np.zeros((len(file_names), len(normalization.STATS_COLUMNS)))
+    if matrix is not None:
+        for i, file_name in enumerate(file_names):
+            levels = m._gene_levels(m.read_TCGA_sample(file_name))
+            matrix[:, i] = levels.reindex(genes, fill_value = 0).to_numpy(dtype = STORE_DTYPE)
+            ranks[:, i] = correlation.rank(matrix[:, i])
+            stats[i] = normalization.column_stats(matrix[:, i])[0]
+            if output:
+                print(f"[{i + 1}/{len(file_names)}] {file_name}")
+        matrix.flush()
+        ranks.flush()
+        del matrix, ranks
+
+    samples = pd.DataFrame({"sample": sample_names, "file": [str(file_name) for file_name in file_names]})
+    _write_stats(path, pd.DataFrame(stats, columns = normalization.STATS_COLUMNS))
+    _write_index(path, genes, samples)
+    return open_cohort_store(path)
+
+
+def update_cohort_store(cohort, path, key = "file_id"):
+    '''
+    Add the samples of a cohort to an existing cohort store (the store is created if it
+    does not exist). The key column of the sample table identifies samples: a sample
+    whose key is already in the store replaces that column in place, all other samples
+    are appended to the end of the matrix file. Unchanged samples are not touched, so
+    the cost is proportional to the number of new samples. Only genes that are not in
+    the store yet force a rewrite of the whole matrix (to extend the shared gene index).
+
+    An interrupted update leaves a store that opens with its previous samples and genes:
+    the rewritten files are written under temporary names and only moved into place once
+    all of them are complete (an update that got that far is finished by the next open).
+    Appended columns past the stored ones are cut off by the next update. Only the
+    columns of replaced samples are written in place; they are consistent again once the
+    update is run again.
+
+    Parameters:
+        cohort (Cohort): The new or changed samples. Its sample table needs the key
+                         column.
+        path (string): Directory of the store.
+        key (string): Sample table column that identifies a sample (e.g. the GDC file
+                      id).
+
+    Returns:
+        cohort (Cohort): The memory-mapped, updated cohort store.
+    '''
+    path = Path(path)
+    _finish_update(path)
+    if not (path / "store.json").exists():
+        write_cohort_store(cohort, path)
+        return open_cohort_store(path)
+
+    stored = open_cohort_store(path)
+    if stored.n_genes * stored.n_samples == 0:
+        write_cohort_store(cohort, path)
+        return open_cohort_store(path)
+    assert stored.samples[key].is_unique, f"The '{key}' column of the cohort store must be unique."
+    # Files of an earlier update that was interrupted before store.json.tmp was written.
+    for name in STORE_FILES:
+        (path / (name + UPDATE_SUFFIX)).unlink(missing_ok = True)
+
+    # New genes: extend the gene index and rewrite the matrix with the new (zero) rows,
+    # under a temporary name. The new zeros change the ranks of every sample, so they
+    # are computed again (also for stores that do not have ranks yet). The sums stay the
+    # same, the minimum and maximum now include zero.
+    genes = stored.genes
+    matrix_file = path / "matrix.f32"
+    info = _read_info(path)
+    rerank = not info.get("ranks", False)
+    stats = _read_stats(path) if info.get("stats", False) else None
+    if not cohort.genes.isin(genes).all():
+        genes = genes.union(cohort.genes).sort_values()
+        matrix_file = _extend_matrix(path, stored, genes)
+        rerank = True
+        if stats is not None:
+            stats["min"] = np.minimum(stats["min"], 0)
+            stats["max"] = np.maximum(stats["max"], 0)
+    rows = genes.get_indexer(cohort.genes)
+    del stored
+
+    samples = pd.read_csv(path / "samples.csv", dtype = {"sample": str})
+    positions = pd.Index(samples[key].astype(str)).get_indexer(cohort.samples[key].astype(str))
+    column = np.zeros(len(genes), dtype = STORE_DTYPE)
+
+    # Changed samples: overwrite their column.
+    replaced = np.flatnonzero(positions >= 0)
+    if len(replaced) > 0:
+        matrix = np.memmap(matrix_file, dtype = STORE_DTYPE, mode = "r+", shape = (len(genes), len(samples)), order = "F")
+        ranks = None if rerank else np.memmap(path / RANKS_FILE, dtype = STORE_DTYPE, mode = "r+", shape = matrix.shape, order = "F")
+        for i in replaced:
+            column[:] = 0
+            column[rows] = sparse.dense(cohort.matrix[:, i]).ravel()
+            matrix[:, positions[i]] = column
+            if ranks is not None:
+                ranks[:, positions[i]] = correlation.rank(column)
+            if stats is not None:
+                stats.iloc[positions[i]] = normalization.column_stats(column)[0]
+        matrix.flush()
+        del matrix
+        if ranks is not None:
+            ranks.flush()
+            del ranks
+        for name in cohort.samples.columns:
+            samples.loc[positions[replaced], name] = cohort.samples[name].to_numpy()[replaced]
+
+    # New samples: every column is one contiguous block at the end of the (column-major)
+    # matrix file. Bytes past the stored samples (left by an interrupted update,
+    # store.json still has the old shape) are cut off first, otherwise the new columns
+    # would land behind them and the memmap would read shifted columns.
+    appended = np.flatnonzero(positions < 0)
+    appended_stats = np.zeros((len(appended), len(normalization.STATS_COLUMNS)))
+    stored_size = len(genes) * len(samples) * np.dtype(STORE_DTYPE).itemsize
+    os.truncate(matrix_file, stored_size)
+    if not rerank:
+        os.truncate(path / RANKS_FILE, stored_size)
+    with open(matrix_file, "ab") as f, open(path / RANKS_FILE, "ab") as r:
+        for j, i in enumerate(appended):
+            column[:] = 0
+            column[rows] = sparse.dense(cohort.matrix[:, i]).ravel()
+            column.tofile(f)
+            if not rerank:
+                correlation.rank(column).astype(STORE_DTYPE).tofile(r)
+            appended_stats[j] = normalization.column_stats(column)[0]
+    samples = pd.concat([samples, cohort.samples.iloc[appended]], ignore_index = True)
+
+    if rerank:
+        _write_ranks(path, len(genes), len(samples), matrix_file, RANKS_FILE + UPDATE_SUFFIX)
+    if stats is None:
+        stats = normalization.sample_stats(_open_matrix(matrix_file, (len(genes), len(samples))))
+    else:
+        stats = pd.concat([stats, pd.DataFrame(appended_stats, columns = normalization.STATS_COLUMNS)], ignore_index = True)
+    _write_stats(path, stats, STATS_FILE + UPDATE_SUFFIX)
+    _write_index(path, genes, samples, UPDATE_SUFFIX)
+    _finish_update(path)
+    return open_cohort_store(path)
+
+
+def find_sample_files(file_names):
+    '''
+    Expand directories into the .csv and GDC .tsv files they contain (recursively,
+    sorted). Files are kept as they are.
+    '''
+    found = []
+    for file_name in file_names:
+        if os.path.isdir(file_name):
+            found.extend(sorted(str(f) for f in Path(file_name).rglob("*") if f.suffix in (".csv", ".tsv")))
+        else:
+            found.append(str(file_name))
+    return found
+
+
+def _read_symbols(file_name):
+    # Only the unique gene symbols of a sample file (see load_expression_file for the
+    # formats).
+    if str(file_name).endswith(".tsv"):
+        symbols = pd.read_csv(file_name, sep = "\t", comment = "#", usecols = ["gene_id", "gene_name"], dtype = str)
+        symbols = symbols.loc[~symbols["gene_id"].str.startswith("N_"), "gene_name"]
+    else:
+        symbols = pd.read_csv(file_name, sep = ";", usecols = [0], dtype = str).iloc[:,0]
+    return symbols.unique()
+
+
+def _create_matrix(path, n_genes, n_samples, file_name = "matrix.f32"):
+    # Writable column-major memmap of a store matrix (None for an empty matrix, which
+    # np.memmap cannot map).
+    if n_genes * n_samples == 0:
+        open(path / file_name, "wb").close()
+        return None
+    return np.memmap(path / file_name, dtype = STORE_DTYPE, mode = "w+", shape = (n_genes, n_samples), order = "F")
+
+
+def _open_matrix(file_name, shape, mmap = True):
+    # Read-only column-major store matrix.
+    if shape[0] * shape[1] == 0:
+        return np.zeros(shape, dtype = STORE_DTYPE, order = "F")
+    if mmap:
+        return np.memmap(file_name, dtype = STORE_DTYPE, mode = "r", shape = shape, order = "F")
+    return np.fromfile(file_name, dtype = STORE_DTYPE).reshape(shape, order = "F")
+
+
+def _write_ranks(path, n_genes, n_samples, matrix_file = None, ranks_file = RANKS_FILE, block_size = 1024):
+    # (Re)compute the ranks of every sample of the store matrix (default: matrix.f32),
+    # block_size columns at a time.
+    ranks = _create_matrix(path, n_genes, n_samples, ranks_file)
+    if ranks is None:
+        return
+    matrix = _open_matrix(path / "matrix.f32" if matrix_file is None else matrix_file, (n_genes, n_samples))
+    for start in range(0, n_samples, block_size):
+        stop = min(start + block_size, n_samples)
+        ranks[:, start:stop] = correlation.rank(matrix[:, start:stop])
+    ranks.flush()
+    del ranks
+
+
+def _write_stats(path, stats, file_name = STATS_FILE):
+    stats.to_csv(path / file_name, index = False)
+
+
+def _read_stats(path):
+    return pd.read_csv(path / STATS_FILE, dtype = np.float64)
+
+
+def _extend_matrix(path, stored, genes):
+    # Write the matrix of a store for a larger gene index next to it, one sample column
+    # at a time. Returns the file.
+    rows = genes.get_indexer(stored.genes)
+    extended = np.memmap(path / ("matrix.f32" + UPDATE_SUFFIX), dtype = STORE_DTYPE, mode = "w+", shape = (len(genes), stored.n_samples), order = "F")
+    for i in range(stored.n_samples):
+        extended[rows, i] = stored.matrix[:, i]
+    extended.flush()
+    del extended
+    return path / ("matrix.f32" + UPDATE_SUFFIX)
+
+
+def _write_index(path, genes, samples, suffix = ""):
+    # Write everything but the matrix (with suffix: the files of an update). store.json
+    # is written last and marks the store (or the update) as complete.
+    with open(path / ("genes.npy" + suffix), "wb") as f:
+        np.save(f, np.asarray(genes, dtype = str), allow_pickle = False)
+    samples.to_csv(path / ("samples.csv" + suffix), index = False)
+    info = {"format": STORE_FORMAT, "version": STORE_VERSION, "dtype": np.dtype(STORE_DTYPE).name, "order": "F",
+            "n_genes": len(genes), "n_samples": len(samples),
+            "ranks": (path / (RANKS_FILE + suffix)).exists() or (path / RANKS_FILE).exists(),
+            "stats": (path / (STATS_FILE + suffix)).exists() or (path / STATS_FILE).exists()}
+    with open(path / ("store.json" + suffix), "w") as f:
+        json.dump(info, f, indent = 2)
+
+
+def _finish_update(path):
+    # Move the files of a complete update into place (store.json.tmp is only written
+    # once all of them are). The renames can be repeated, so an update interrupted while
+    # they run is finished by the next call.
+    if not (path / ("store.json" + UPDATE_SUFFIX)).exists():
+        return
+    for name in STORE_FILES:
+        if (path / (name + UPDATE_SUFFIX)).exists():
+            os.replace(path / (name + UPDATE_SUFFIX), path / name)
+
+
+def _read_info(path):
+    with open(path / "store.json") as f:
+        info = json.load(f)
+    assert info.get("format") == STORE_FORMAT, f"{path} is not a cohort store."
+    assert info.get("version") == STORE_VERSION, f"Unsupported cohort store version: {info.get('version')}."
+    return info
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Consolidate TCGA sample files into a memory-mappable cohort store.")
+    parser.add_argument("store", help = "directory of the cohort store")
+    parser.add_argument("files", nargs = "+", help = "TCGA sample files ('symbol;value' .csv) or directories that contain them")
+    args = parser.parse_args(argv)
+
+    cohort = ingest_cohort_store(args.files, args.store)
+    print(f"Wrote {cohort} to {args.store}")
+
+
+if __name__ == "__main__":
+    main()
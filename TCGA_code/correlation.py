@@ -0,0 +1,259 @@
+import numpy as np
+from scipy.stats import kendalltau, rankdata
+from TCGA_code import sparse
+
+
+# Correlation kernels on expression level arrays: x and y are vectors (one profile) or
+# genes x samples matrices (one profile per column). Every column of x is correlated
+# with every column of y:
+#     vector, vector -> float
+#     vector, matrix -> one score per column of the matrix
+#     matrix, matrix -> x columns x y columns matrix of scores
+# float32 inputs are computed in float32 (BLAS), everything else in float64. y may be a
+# scipy sparse matrix: pearson and cosine then only touch its non-zero levels.
+
+
+def pearson(x, y, block_size = 4096):
+    '''
+    Pearson correlation coefficients.
+
+    Both inputs are centered (two-pass, which avoids the cancellation of the sum of
+    squares formula) and scaled to unit norm, so that all scores are one matrix product.
+    Sparse y columns are not centered in memory, but their sums of squares are still
+    taken around the column means. (match_cohort instead uses the one-pass formula on
+    the float64 column sums that a cohort store keeps, see cohort._pearson.) y is
+    processed block_size columns at a time, so a memory-mapped cohort is never copied as
+    a whole.
+
+    Parameters:
+        x (np.ndarray): Vector or genes x samples matrix.
+        y (np.ndarray): Vector or genes x samples matrix with the same genes (rows) as
+                        x.
+        block_size (int): Number of y columns that are centered at once.
+
+    Returns:
+        scores (float or np.ndarray): Correlation coefficients, NaN for constant
+                                      profiles.
+    '''
+    x, y, shape = _columns(x, y)
+    x_unit = _unit_columns(x)
+    scores = np.empty((x.shape[1], y.shape[1]), dtype = x_unit.dtype)
+    for start in range(0, y.shape[1], block_size):
+        stop = min(start + block_size, y.shape[1])
+        if sparse.issparse(y):
+            scores[:, start:stop] = _sparse_scores(x_unit, y[:, start:stop], center = True)
+        else:
+            scores[:, start:stop] = x_unit.T @ _unit_columns(y[:, start:stop])
+    return _result(np.clip(scores, -1, 1), shape)
+
+
+def spearman(x, y, block_size = 4096):
+    '''
+    Spearman rank correlation coefficients: the pearson correlation of the ranks (ties
+    get their average rank).
+
+    Parameters and Returns: see pearson.
+    '''
+    x, y, shape = _columns(x, y)
+    dtype = _dtype(x, y)
+    x_ranks = rank(x).astype(dtype, copy = False)
+    scores = np.empty((x.shape[1], y.shape[1]), dtype = dtype)
+    for start in range(0, y.shape[1], block_size):
+        stop = min(start + block_size, y.shape[1])
+        scores[:, start:stop] = pearson(x_ranks, rank(sparse.dense(y[:, start:stop])).astype(dtype, copy = False))
+    return _result(scores, shape)
+
+
+def cosine(x, y, block_size = 4096):
+    '''
+    Cosine similarities (the uncentered pearson correlation).
+
+    Parameters and Returns: see pearson.
+    '''
+    x, y, shape = _columns(x, y)
+    x_unit = _unit_columns(x, center = False)
+    scores = np.empty((x.shape[1], y.shape[1]), dtype = x_unit.dtype)
+    for start in range(0, y.shape[1], block_size):
+        stop = min(start + block_size, y.shape[1])
+        if sparse.issparse(y):
+            scores[:, start:stop] = _sparse_scores(x_unit, y[:, start:stop], center = False)
+        else:
+            scores[:, start:stop] = x_unit.T @ _unit_columns(y[:, start:stop], center = False)
+    return _result(np.clip(scores, -1, 1), shape)
+
+
+def kendall(x, y):
+    '''
+    Kendall rank correlation coefficients, tau-b (adjusted for ties).
+
+    Unbatched fallback: tau-b has no matrix product form, so unlike the other kernels
+    nothing is shared between columns. Every pair is one call of scipy's O(n log n)
+    implementation (Knight's algorithm), and the cost grows with x columns times y
+    columns.
+
+    Parameters:
+        x (np.ndarray): Vector or genes x samples matrix.
+        y (np.ndarray): Vector or genes x samples matrix with the same genes (rows) as
+                        x.
+
+    Returns:
+        scores (float or np.ndarray): tau-b coefficients, NaN for constant profiles.
+    '''
+    x, y, shape = _columns(x, y)
+    scores = np.empty((x.shape[1], y.shape[1]))
+    for i in range(x.shape[1]):
+        x_levels = np.asarray(x[:, i], dtype = np.float64)
+        for j in range(y.shape[1]):
+            scores[i, j] = _kendalltau(x_levels, sparse.dense(y[:, j]).astype(np.float64).ravel())
+    return _result(scores, shape)
+
+
+def _kendalltau(x, y):
+    # scipy warns about constant inputs, their coefficient is NaN.
+    if x.min() == x.max() or y.min() == y.max():
+        return np.nan
+    return kendalltau(x, y, variant = "b")[0]
+
+
+CORRELATIONS = {"pearson": pearson, "spearman": spearman, "cosine": cosine, "kendall": kendall}
+
+
+def correlate(x, y, method = "pearson"):
+    '''
+    Correlation coefficients of the given method ("pearson", "spearman", "cosine" or
+    "kendall"), see pearson.
+    '''
+    if method not in CORRELATIONS:
+        raise ValueError(f"Not a valid correlation method: {method}")
+    return CORRELATIONS[method](x, y)
+
+
+def rank(levels):
+    '''
+    Ranks of a vector or of every column of a genes x samples matrix (1 = lowest, ties
+    get their average rank).
+    '''
+    return rankdata(np.asarray(levels), axis = 0)
+
+
+class RunningPearson:
+    '''
+    Single-pass pearson correlation for profiles that arrive in chunks of genes (e.g.
+    read from a file in blocks).
+
+    Keeps the count, means, sums of squared deviations and co-moments (Welford / Chan et
+    al. updates), so the result is as accurate as the two-pass pearson and no chunk has
+    to be kept. y may hold several samples (one per column).
+
+    Attributes:
+        n (int): Number of genes seen so far.
+    '''
+
+    def __init__(self):
+        self.n = 0
+        self._x_mean = 0.0
+        self._y_mean = 0.0
+        self._x_m2 = 0.0
+        self._y_m2 = 0.0
+        self._co_moment = 0.0
+
+    def update(self, x, y):
+        '''
+        Add a chunk of genes.
+
+        Parameters:
+            x (np.ndarray): Reference levels of the chunk (vector).
+            y (np.ndarray): Sample levels of the chunk (vector, or genes x samples
+                            matrix).
+        '''
+        x = np.asarray(x, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        n_chunk = len(x)
+        if n_chunk == 0:
+            return
+
+        # Moments of the chunk (two-pass), then merged with the moments so far.
+        x_mean = x.mean()
+        y_mean = y.mean(axis = 0)
+        x_centered = x - x_mean
+        y_centered = y - y_mean
+        x_m2 = x_centered @ x_centered
+        y_m2 = (y_centered * y_centered).sum(axis = 0)
+        co_moment = x_centered @ y_centered
+
+        n = self.n + n_chunk
+        x_delta = x_mean - self._x_mean
+        y_delta = y_mean - self._y_mean
+        weight = self.n * n_chunk / n
+        self._x_mean = self._x_mean + x_delta * n_chunk / n
+        self._y_mean = self._y_mean + y_delta * n_chunk / n
+        self._x_m2 = self._x_m2 + x_m2 + x_delta * x_delta * weight
+        self._y_m2 = self._y_m2 + y_m2 + y_delta * y_delta * weight
+        self._co_moment = self._co_moment + co_moment + x_delta * y_delta * weight
+        self.n = n
+
+    def correlation(self):
+        '''
+        Returns the pearson correlation of the genes seen so far (a float, or one score
+        per sample column).
+        '''
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            scores = np.clip(self._co_moment / np.sqrt(self._x_m2 * self._y_m2), -1, 1)
+        return float(scores) if np.ndim(scores) == 0 else scores
+
+
+def _columns(x, y):
+    # Both inputs as 2D genes x columns arrays, plus the shape of the result.
+    x = sparse.dense(x)
+    y = y.tocsc() if sparse.issparse(y) else np.asarray(y)
+    shape = tuple(array.shape[1] for array in (x, y) if array.ndim == 2)
+    x = x.reshape(len(x), -1) if x.ndim == 1 else x
+    y = y.reshape(len(y), -1) if y.ndim == 1 else y
+    assert x.shape[0] == y.shape[0], "Input datasets are not of same length."
+    return x, y, shape
+
+
+def _sparse_scores(x_unit, y, center = True):
+    # Scores of unit-norm (centered) x columns against a sparse (CSC) y block without
+    # densifying it. x_unit sums to zero if it is centered, so centering y does not
+    # change the products: x_unit . (y - mean) = x_unit . y
+    # The centered sums of squares are two-pass: the deviations of the stored levels
+    # plus mean^2 for every zero.
+    y = y.tocsc().astype(x_unit.dtype)
+    n_stored = np.diff(y.indptr)
+    if center:
+        mean = np.asarray(y.sum(axis = 0, dtype = np.float64)).ravel() / y.shape[0]
+        columns = np.repeat(np.arange(y.shape[1]), n_stored)
+        deviations = y.data.astype(np.float64) - mean[columns]
+        y_ss = np.bincount(columns, weights = deviations * deviations, minlength = y.shape[1]) + (y.shape[0] - n_stored) * mean * mean
+    else:
+        y_ss = np.asarray(y.multiply(y).sum(axis = 0, dtype = np.float64)).ravel()
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        return np.asarray(y.T @ x_unit).T / np.where(y_ss > 0, np.sqrt(y_ss), np.nan)
+
+
+def _dtype(x, y):
+    return np.float32 if x.dtype == np.float32 and y.dtype == np.float32 else np.float64
+
+
+def _unit_columns(levels, center = True):
+    # Columns centered (optional) and scaled to unit norm; constant (zero) columns
+    # become NaN.
+    dtype = np.float32 if levels.dtype == np.float32 else np.float64
+    levels = np.array(levels, dtype = dtype)
+    if center:
+        levels -= levels.mean(axis = 0, dtype = np.float64).astype(dtype)
+    norm = np.sqrt(np.einsum("ij,ij->j", levels, levels, dtype = np.float64))
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        levels /= np.where(norm > 0, norm, np.nan).astype(dtype)
+    return levels
+
+
+def _result(scores, shape):
+    # Drop the dimensions of vector inputs: a float for two vectors, a vector for a
+    # vector and a matrix.
+    if len(shape) == 0:
+        return float(scores[0, 0])
+    if len(shape) == 1:
+        return scores.ravel()
+    return scores
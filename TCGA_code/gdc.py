@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code.cohort import Cohort
+from TCGA_code import cohort_store
+
+
+# Expected layout of a GDC download tree (as in real_dataset_tutorial/TCGA_DATASETS):
+#   <project> : <case> / <sample type> / [gdc_download_*] / MANIFEST.txt
+#                                                         / <file uuid> / <data file>
+# The MANIFEST.txt lists id, filename (relative to the manifest), md5, size and state of
+# every downloaded file.
+EXPRESSION_SUFFIXES = (".tsv", ".csv")
+
+
+def read_manifest(file_name):
+    '''
+    Read a GDC MANIFEST.txt.
+
+    Parameters:
+        file_name (string): Path of the MANIFEST.txt.
+
+    Returns:
+        manifest (pd.DataFrame): Columns 'id', 'filename', 'md5', 'size', 'state'. Files
+                                 without id (e.g. annotations) have id NaN.
+    '''
+    return pd.read_csv(file_name, sep = "\t", na_values = ["\\N"], keep_default_na = False, dtype = {"id": str, "filename": str, "md5": str})
+
+
+def find_gdc_files(root):
+    '''
+    Walk a GDC download tree and use the MANIFEST.txt files to find the expression data
+    file of every case / sample type.
+
+    If the file named in the manifest does not exist (e.g. it was converted to a
+    'symbol;value' .csv and renamed), the only expression file in its file uuid
+    directory is used instead. Such files can not be verified.
+
+    Parameters:
+        root (string): Directory of the GDC download tree.
+
+    Returns:
+        files (pd.DataFrame): One row per data file. Columns 'sample', 'project',
+                              'case', 'sample_type', 'file_id', 'file', 'md5', 'size'
+                              and 'renamed' (True if the manifest file name was not
+                              found).
+    '''
+    rows = []
+    for manifest_name in sorted(Path(root).rglob("MANIFEST.txt")):
+        project, case, sample_type = _describe_directory(manifest_name.parent)
+        manifest = read_manifest(manifest_name)
+        for _, entry in manifest[manifest["id"].notna()].iterrows():
+            file_name = manifest_name.parent / entry["filename"]
+            renamed = not file_name.exists()
+            if renamed:
+                file_name = _find_expression_file(file_name.parent)
+                if file_name is None:
+                    continue
+            rows.append({"project": project, "case": case, "sample_type": sample_type, "file_id": entry["id"],
+                         "file": str(file_name), "md5": entry["md5"], "size": int(entry["size"]), "renamed": renamed})
+
+    files = pd.DataFrame(rows, columns = ["project", "case", "sample_type", "file_id", "file", "md5", "size", "renamed"])
+
+    # Sample names: '<case> <sample type>', with the file id for cases that have several
+    # files of a sample type.
+    sample = files["case"] + " " + files["sample_type"]
+    repeated = sample.duplicated(keep = False)
+    sample[repeated] = sample[repeated] + " " + files.loc[repeated, "file_id"]
+    files.insert(0, "sample", sample)
+    return files
+
+
+def verify_file(file_name, md5, size):
+    '''
+    Check a downloaded file against the size and md5 sum of its manifest entry.
+
+    Returns:
+        status (string): 'ok', 'size mismatch' or 'md5 mismatch'.
+    '''
+    if os.path.getsize(file_name) != size:
+        return "size mismatch"
+    digest = hashlib.md5()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    if digest.hexdigest() != md5:
+        return "md5 mismatch"
+    return "ok"
+
+
+def ingest_gdc_tree(root, store = None, workers = None, verify = True, value_column = "unstranded", output = True, incremental = True):
+    '''
+    Build a cohort from a GDC download tree. The data files are verified and parsed in
+    parallel worker processes.
+
+    With a cohort store, its sample table is the ledger of already ingested files (file
+    uuid and md5 sum from the MANIFEST.txt). When the tree is ingested again, only new
+    files and files with a changed md5 sum are parsed: new files are appended to the
+    store, changed files replace their column (see update_cohort_store).
+
+    Parameters:
+        root (string): Directory of the GDC download tree.
+        store (string): If given, the cohort is also written to (or updated in) this
+                        cohort store directory.
+        workers (int): Number of worker processes. Defaults to the number of cores; 1
+                       parses in this process.
+        verify (boolean): Check the size and md5 sum of every file. Files that fail are
+                          left out of the cohort.
+        value_column (string): Count column of the GDC .tsv files (see
+                               load_expression_file).
+        output (boolean): Prints the progress.
+        incremental (boolean): Skip the files that are already in the store with the
+                               same md5 sum. If False, an existing store is overwritten.
+
+    Returns:
+        cohort (Cohort): genes x samples cohort. The sample table has the find_gdc_files
+                         columns plus 'status' ('ok', 'unverified' for renamed or
+                         unchecked files). With a store, this is the whole
+                         (memory-mapped) store.
+    '''
+    files = find_gdc_files(root)
+    ledger = _read_ledger(store) if store is not None and incremental else None
+    if ledger is not None:
+        known = files["file_id"].map(ledger)
+        files = files[known.isna() | (known != files["md5"])].reset_index(drop = True)
+        if output:
+            print(f"{len(known) - len(files)} file(s) already ingested, "
+                  f"{len(files)} new or changed file(s).")
+        if len(files) == 0:
+            return cohort_store.open_cohort_store(store)
+
+    tasks = [(row.file, row.md5, row.size, verify and not row.renamed, value_column) for row in files.itertuples()]
+
+    statuses = []
+    levels = []
+    shared_genes = None
+    for i, (status, genes, values) in enumerate(_imap(_ingest_file, tasks, workers)):
+        statuses.append(status)
+        if genes is not None:
+            # Samples of the same gene model share one array of symbols instead of
+            # keeping a copy each.
+            if shared_genes is not None and len(genes) == len(shared_genes) and np.array_equal(genes, shared_genes):
+                genes = shared_genes
+            shared_genes = genes
+            levels.append((genes, values))
+        if output:
+            print(f"[{i + 1}/{len(tasks)}] {status}: {tasks[i][0]}")
+
+    files["status"] = statuses
+    keep = files["status"].isin(["ok", "unverified"]).to_numpy()
+
+    cohort = _assemble(levels, files[keep])
+    if store is None:
+        return cohort
+    if ledger is not None:
+        return cohort_store.update_cohort_store(cohort, store, key = "file_id")
+    cohort_store.write_cohort_store(cohort, store)
+    return cohort
+
+
+def _read_ledger(store):
+    # md5 sum of every file that is already in the cohort store, by file id (None if
+    # there is no store yet).
+    cohort_store._finish_update(Path(store))
+    if not (Path(store) / "store.json").exists():
+        return None
+    samples = pd.read_csv(Path(store) / "samples.csv", dtype = str)
+    if "file_id" not in samples or "md5" not in samples:
+        return None
+    return samples.set_index("file_id")["md5"]
+
+
+def _describe_directory(directory):
+    # Project, case and sample type of a manifest directory: '<project> : <case>' /
+    # '<sample type>' / [gdc_download_*]
+    parts = [part for part in directory.resolve().parts if not part.startswith("gdc_download_")]
+    project, _, case = parts[-2].rpartition(" : ")
+    if not project:
+        project = parts[-3] if len(parts) > 2 else ""
+    return project.strip(), case.strip(), parts[-1]
+
+
+def _find_expression_file(directory):
+    # The only expression file in a file uuid directory (None if there is none or it is
+    # ambiguous).
+    if not directory.is_dir():
+        return None
+    candidates = [f for f in directory.iterdir() if f.suffix in EXPRESSION_SUFFIXES]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _ingest_file(task):
+    # Worker: verify and parse one data file. Returns the status, the sorted gene
+    # symbols and the float32 levels.
+    file_name, md5, size, verify, value_column = task
+    status = verify_file(file_name, md5, size) if verify else "unverified"
+    if status not in ("ok", "unverified"):
+        return status, None, None
+    profile = m.load_expression_file(file_name, value_column = value_column, cache = False)
+    return status, profile.iloc[:,0].to_numpy(dtype = object), profile.iloc[:,1].to_numpy(dtype = np.float32)
+
+
+def _imap(function, tasks, workers):
+    # Results of the tasks, in order, computed in a process pool. One worker runs them
+    # in this process.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(function, tasks)
+        return
+    with ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as pool:
+        yield from pool.map(function, tasks, chunksize = max(1, len(tasks) // (4 * workers)))
+
+
+def _assemble(levels, samples):
+    # genes x samples cohort from (genes, values) pairs. Files of the same gene model
+    # share one array of symbols, so only the distinct gene sets are merged and aligned;
+    # their samples are copied straight into their column.
+    gene_sets = {id(sample_genes): sample_genes for sample_genes, _ in levels}
+    genes = pd.Index([], dtype = object)
+    for sample_genes in gene_sets.values():
+        genes = genes.union(sample_genes)
+    genes = genes.sort_values()
+    rows = {key: genes.get_indexer(sample_genes) for key, sample_genes in gene_sets.items()}
+
+    matrix = np.zeros((len(genes), len(levels)), dtype = cohort_store.STORE_DTYPE, order = "F")
+    for i, (sample_genes, values) in enumerate(levels):
+        matrix[rows[id(sample_genes)], i] = values
+    return Cohort(genes, matrix, samples)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Build a cohort store from a GDC download tree "
+                                                   "(MANIFEST.txt files).")
+    parser.add_argument("root", help = "directory of the GDC download tree")
+    parser.add_argument("store", help = "directory of the cohort store")
+    parser.add_argument("--workers", type = int, default = None, help = "number of worker processes (default: all cores)")
+    parser.add_argument("--no-verify", action = "store_true", help = "do not check md5 sums and sizes")
+    parser.add_argument("--value-column", default = "unstranded", help = "count column of the GDC .tsv files")
+    parser.add_argument("--rebuild", action = "store_true", help = "parse all files again instead of only new or changed ones")
+    args = parser.parse_args(argv)
+
+    cohort = ingest_gdc_tree(args.root, args.store, args.workers, not args.no_verify, args.value_column, incremental = not args.rebuild)
+    print(f"Wrote {cohort} to {args.store}")
+
+
+if __name__ == "__main__":
+    main()
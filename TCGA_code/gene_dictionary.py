@@ -0,0 +1,150 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class GeneDictionary:
+    '''
+    Gene symbols and their int64 ids, so that profiles can be kept and aligned as
+    integer arrays instead of columns of Python strings.
+
+    The id of a symbol is its 64-bit hash (see symbol_ids), not a position in the
+    dictionary: it is the same in every process and session, whatever was interned
+    before. Encoded profiles can be sent to worker processes or kept between sessions,
+    and the ids of a cohort store are rebuilt from its genes.npy when it is opened. The
+    dictionary only remembers the symbols it has seen, to decode ids and to catch hash
+    collisions (an error; at 64 bits none is expected among the symbols of a genome).
+    '''
+
+    def __init__(self, symbols = None):
+        self._ids = pd.Index([], dtype = np.int64)
+        self._symbols = np.empty(0, dtype = object)
+        self._lock = threading.Lock()
+        if symbols is not None:
+            self.encode(symbols)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def symbols(self):
+        '''
+        All symbols of the dictionary, in the order they were interned.
+        '''
+        return self._symbols
+
+    def encode(self, symbols, add = True):
+        '''
+        Ids of gene symbols.
+
+        Parameters:
+            symbols (list of strings or pd.Index): Gene symbols (duplicates are
+                                                   allowed).
+            add (boolean): Remember the symbols that are not in the dictionary yet, so
+                           that their ids can be decoded. The ids are the same either
+                           way; with add = False the dictionary does not grow.
+
+        Returns:
+            ids (np.ndarray): One int64 id per symbol.
+        '''
+        symbols = np.asarray(symbols, dtype = object)
+        ids = symbol_ids(symbols)
+        if not add:
+            return ids
+        with self._lock:
+            positions = self._ids.get_indexer(ids)
+            known = positions >= 0
+            if (self._symbols[positions[known]] != symbols[known]).any():
+                raise ValueError("Two gene symbols have the same id (hash collision).")
+            if not known.all():
+                new = pd.DataFrame({"id": ids[~known], "symbol": symbols[~known]}).drop_duplicates()
+                if new["id"].duplicated().any():
+                    raise ValueError("Two gene symbols have the same id (hash collision).")
+                self._ids = self._ids.append(pd.Index(new["id"].to_numpy()))
+                self._symbols = np.concatenate([self._symbols, new["symbol"].to_numpy(dtype = object)])
+        return ids
+
+    def decode(self, ids):
+        '''
+        Gene symbols of ids (an object array). Raises a KeyError for ids whose symbol
+        was never interned.
+        '''
+        positions = self._ids.get_indexer(np.asarray(ids, dtype = np.int64))
+        if (positions < 0).any():
+            raise KeyError(f"{int((positions < 0).sum())} gene id(s) are not in the dictionary.")
+        return self._symbols[positions]
+
+    def save(self, file_name):
+        '''
+        Write the symbols of the dictionary to a .npy file.
+        '''
+        np.save(file_name, self.symbols.astype(str), allow_pickle = False)
+
+    @classmethod
+    def load(cls, file_name):
+        '''
+        Read a dictionary written by save (or the genes.npy file of a cohort store).
+        '''
+        return cls(np.load(file_name, allow_pickle = False).astype(object))
+
+    def __repr__(self):
+        return f"GeneDictionary({len(self)} genes)"
+
+
+def symbol_ids(symbols):
+    '''
+    The int64 ids of gene symbols: pandas' 64-bit hash with its fixed key, so they do
+    not depend on the process.
+    '''
+    symbols = np.asarray(symbols, dtype = object)
+    return pd.util.hash_array(symbols, categorize = False).view(np.int64)
+
+
+# The process-wide gene dictionary.
+GENES = GeneDictionary()
+
+
+def encode_profile(profile, add = True):
+    '''
+    Turn a 'symbol', 'value' dataframe into an encoded profile: an (ids, values) pair of
+    arrays sorted by id. Duplicated symbols are averaged like in read_expr_profile. An
+    encoded profile takes about 720 KB for 60k genes, pickles without any strings and is
+    aligned to a cohort with integer operations (see cohort.match_cohort). The ids are
+    the same in every process (see GeneDictionary).
+
+    Parameters:
+        profile (pd.DataFrame): 'symbol', 'value' dataframe.
+        add (boolean): Intern the symbols in GENES, so that decode_profile can turn the
+                       profile back into symbols.
+
+    Returns:
+        ids (np.ndarray): Unique int64 gene ids, sorted.
+        values (np.ndarray): Expression level of every id (float32 levels stay float32,
+                             everything else is float64).
+    '''
+    ids = GENES.encode(profile.iloc[:,0], add)
+    values = pd.to_numeric(profile.iloc[:,1]).to_numpy()
+    values = values.astype(np.float32 if values.dtype == np.float32 else np.float64, copy = False)
+
+    unique_ids, inverse = np.unique(ids, return_inverse = True)
+    if len(unique_ids) == len(ids):
+        order = np.argsort(ids, kind = "stable")
+        return ids[order], values[order]
+    sums = np.bincount(inverse, weights = values, minlength = len(unique_ids))
+    return unique_ids, (sums / np.bincount(inverse, minlength = len(unique_ids))).astype(values.dtype)
+
+
+def decode_profile(ids, values):
+    '''
+    The 'symbol', 'value' dataframe of an encoded profile, sorted by gene symbol.
+    '''
+    profile = pd.DataFrame({"symbol": GENES.decode(ids), "value": values})
+    return profile.sort_values("symbol", kind = "stable", ignore_index = True)
+
+
+def is_encoded(profile):
+    '''
+    True for an encoded (ids, values) profile, False for a 'symbol', 'value' dataframe.
+    '''
+    return isinstance(profile, tuple)
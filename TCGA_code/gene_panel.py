@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from TCGA_code import gene_dictionary
+
+
+def read_gmt(file_name):
+    '''
+    Read a GMT gene set file: one set per line,
+    'name <tab> description <tab> gene <tab> gene ...'.
+
+    Returns:
+        gene_sets (dict): Gene symbols of every set, by set name (in file order).
+    '''
+    gene_sets = {}
+    with open(file_name) as f:
+        for line in f:
+            fields = [field.strip() for field in line.rstrip("\n").split("\t")]
+            if len(fields) < 2 or not fields[0]:
+                continue
+            gene_sets[fields[0]] = [gene for gene in fields[2:] if gene]
+    return gene_sets
+
+
+def read_gene_panel(file_name, name = None):
+    '''
+    Read a gene panel: the gene symbols to restrict matching to.
+
+    Two formats are supported:
+        .gmt files (see read_gmt). name selects the gene set; without a name, the file
+        must hold a single set.
+        Gene lists: one symbol per line, or a .csv file with a 'symbol' column (';' or
+        ',' separated, otherwise the first column is used).
+
+    Parameters:
+        file_name (string): Path of the panel file.
+        name (string): Gene set of a .gmt file.
+
+    Returns:
+        genes (list of strings): The unique gene symbols of the panel, in file order.
+    '''
+    if Path(file_name).suffix == ".gmt":
+        gene_sets = read_gmt(file_name)
+        if name is None:
+            assert len(gene_sets) == 1, f"{file_name} holds {len(gene_sets)} gene sets, choose one by name."
+            name = next(iter(gene_sets))
+        assert name in gene_sets, f"There is no gene set '{name}' in {file_name}."
+        genes = gene_sets[name]
+    elif Path(file_name).suffix == ".csv":
+        panel = pd.read_csv(file_name, sep = None, engine = "python", dtype = str)
+        genes = panel["symbol" if "symbol" in panel else panel.columns[0]].dropna().str.strip().tolist()
+    else:
+        with open(file_name) as f:
+            genes = [line.strip() for line in f if line.strip()]
+    return list(dict.fromkeys(genes))
+
+
+def restrict_profile(profile, genes):
+    '''
+    Keep only the genes of a panel in a 'symbol', 'value' dataframe or an encoded
+    (ids, values) profile.
+    '''
+    if gene_dictionary.is_encoded(profile):
+        ids, values = profile
+        keep = np.isin(ids, gene_dictionary.symbol_ids(genes))
+        return ids[keep], values[keep]
+    return profile[profile.iloc[:,0].isin(genes)].reset_index(drop = True)
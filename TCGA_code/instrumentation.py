@@ -0,0 +1,204 @@
+import contextlib
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+# Opt-in instrumentation of the match_computation functions and the pipeline stages.
+# Nothing is measured unless a run report is active (see profiling); instrumented
+# functions then only cost one global lookup.
+_active = None
+
+
+class RunReport:
+    '''
+    Wall time, CPU time, memory peak and rows in / out of every instrumented call of one
+    run (see profiling).
+
+    With trace_memory, memory peaks come from tracemalloc (python and numpy
+    allocations): the peak above the memory in use when the call started. tracemalloc
+    slows code that allocates many python objects (e.g. gene symbol columns) down by up
+    to 10x, so the times of a report with memory peaks are only comparable with each
+    other. CPU time is process time (it includes BLAS threads).
+
+    Attributes:
+        records (list of dicts): One record per call, in call order: 'name', 'depth'
+                                 (nesting level), 'wall_time', 'cpu_time' (seconds),
+                                 'peak_bytes', 'rows_in' and 'rows_out' (None if
+                                 unknown).
+    '''
+
+    def __init__(self, trace_memory = False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.started = datetime.now(timezone.utc)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in = None):
+        '''
+        Measure a block of code. Yields its record; set record["rows_out"] to report the
+        rows it produced.
+        '''
+        stack = self._local.__dict__.setdefault("stack", [])
+        record = {"name": name, "depth": len(stack), "wall_time": None, "cpu_time": None, "peak_bytes": None, "rows_in": rows_in, "rows_out": None}
+        with self._lock:
+            self.records.append(record)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # The peak of tracemalloc is reset for every call: the caller keeps the peak
+            # it reached so far.
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+            tracemalloc.reset_peak()
+            record["_start"] = record["_peak"] = current
+        stack.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - wall
+            record["cpu_time"] = time.process_time() - cpu
+            stack.pop()
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], record.pop("_peak"))
+                record["peak_bytes"] = peak - record.pop("_start")
+                if stack:
+                    stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+
+    def summary(self):
+        '''
+        Totals per function / stage, in order of the first call: 'calls', 'wall_time',
+        'cpu_time', 'peak_bytes' (largest), 'rows_in', 'rows_out' and 'rows_per_second'
+        (rows in per second of wall time).
+        '''
+        frame = pd.DataFrame(self.records, columns = ["name", "wall_time", "cpu_time", "peak_bytes", "rows_in", "rows_out"])
+        if len(frame) == 0:
+            return pd.DataFrame(columns = ["name", "calls", "wall_time", "cpu_time", "peak_bytes", "rows_in", "rows_out", "rows_per_second"])
+        def total(values):
+            return values.sum(min_count = 1)
+
+        summary = frame.groupby("name", sort = False).agg(calls = ("name", "size"), wall_time = ("wall_time", "sum"), cpu_time = ("cpu_time", "sum"),
+                                                          peak_bytes = ("peak_bytes", "max"), rows_in = ("rows_in", total), rows_out = ("rows_out", total))
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            summary["rows_per_second"] = summary["rows_in"] / summary["wall_time"]
+        return summary.reset_index()
+
+    def to_dict(self):
+        '''
+        The report as a JSON serializable dict: 'started' (UTC, ISO format), 'records'
+        and 'summary'.
+        '''
+        summary = self.summary().astype(object).where(lambda frame: frame.notna(), None)
+        return {"started": self.started.isoformat(), "trace_memory": self.trace_memory,
+                "records": [_plain(record) for record in self.records],
+                "summary": [_plain(row) for row in summary.to_dict("records")]}
+
+    def to_json(self, file_name):
+        '''
+        Write the report (see to_dict) to a .json file.
+        '''
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent = 2)
+
+    def format(self):
+        '''
+        The summary as a text table.
+        '''
+        lines = [f"{'stage':<40}{'calls':>6}{'wall ms':>10}{'cpu ms':>10}"
+                 f"{'peak MB':>9}{'rows in':>10}{'rows out':>10}"]
+        for row in self.summary().itertuples():
+            peak = "" if pd.isna(row.peak_bytes) else f"{row.peak_bytes / 2**20:.1f}"
+            rows_in = "" if pd.isna(row.rows_in) else f"{int(row.rows_in)}"
+            rows_out = "" if pd.isna(row.rows_out) else f"{int(row.rows_out)}"
+            lines.append(f"{row.name:<40}{row.calls:>6}{row.wall_time * 1000:>10.1f}"
+                         f"{row.cpu_time * 1000:>10.1f}{peak:>9}{rows_in:>10}{rows_out:>10}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"RunReport({len(self.records)} records)"
+
+
+@contextlib.contextmanager
+def profiling(trace_memory = False):
+    '''
+    Collect a run report of everything instrumented that runs inside the block (in any
+    thread), with memory peaks if trace_memory is True (see RunReport).
+
+        with instrumentation.profiling() as report:
+            MatchPipeline("reference.csv", "sample.csv").run()
+        report.to_json("report.json")
+
+    Yields:
+        report (RunReport): The report of the block.
+    '''
+    global _active
+    previous = _active
+    report = RunReport(trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _active = report
+    try:
+        yield report
+    finally:
+        _active = previous
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def stage(name, rows_in = None):
+    '''
+    Measure a block of code in the active run report (a no-op without one). Yields the
+    record (a throw-away dict without a report).
+    '''
+    if _active is None:
+        return contextlib.nullcontext({})
+    return _active.stage(name, rows_in)
+
+
+def instrumented(function):
+    '''
+    Decorator: calls of the function are measured in the active run report, as
+    '<module>.<function>'. Rows in are the rows of the dataframe / array arguments, rows
+    out the rows of the dataframes / arrays it returns.
+    '''
+    name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        report = _active
+        if report is None:
+            return function(*args, **kwargs)
+        with report.stage(name, count_rows(args)) as record:
+            result = function(*args, **kwargs)
+            record["rows_out"] = count_rows(result)
+            return result
+    return wrapper
+
+
+def count_rows(value):
+    '''
+    Rows of a dataframe, series or array, summed over tuples and lists of them (None if
+    there are none).
+    '''
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.shape[0] if value.ndim > 0 else None
+    if isinstance(value, (tuple, list)):
+        rows = [count_rows(item) for item in value if isinstance(item, (pd.DataFrame, pd.Series, np.ndarray))]
+        rows = [row for row in rows if row is not None]
+        return sum(rows) if rows else None
+    return None
+
+
+def _plain(record):
+    # Record without numpy scalars (for json).
+    return {key: value.item() if isinstance(value, np.generic) else value for key, value in record.items()}
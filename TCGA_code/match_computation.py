@@ -1,10 +1,14 @@
+import os
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
-from scipy.stats.stats import pearsonr   
-from scipy.stats import zscore
 import matplotlib.pyplot as plt
+from TCGA_code import correlation
+from TCGA_code import normalization
+from TCGA_code import instrumentation
 
 
+@instrumentation.instrumented
 def read_expr_profile(file_name):
     '''
     Read in the gene expression profile to be analyzed. This GE profile is analyzed against a dataset of cancer samples.
@@ -16,25 +20,25 @@ def read_expr_profile(file_name):
     Parameters: 
         file_name (string): the file name of the gene expression profile input file. (.csv file or path to .csv file)
                              Has to be a two column file in the format: 'symbol' (string), 'value' (float or integer)
+                             A GDC 'augmented_star_gene_counts.tsv' file is read
+                             directly (see load_expression_file).
 
     Returns:
         Reference profile data (panda df): Pandas dataframe with gene symbol and gene expression levels (pre-processed)
 
     '''
     
-    ref_profile = pd.read_csv(file_name, sep = ";", encoding="UTF-8")
+    ref_profile = load_expression_file(file_name)
 
     # Assert that the column size is 2.
     assert len(ref_profile.axes[1]) == 2, "The number of columns must be 2: 'symbol, value'."
-    assert np.isnan(any(ref_profile.iloc[:,0])) == False, "There are not defined gene names in the reference profile."
-    assert np.isnan(any(ref_profile.iloc[:,1])) == False, "There are not defined expression levels in the reference profile."
-
-    # Average the duplicate values
-    ref_profile = ref_profile.groupby('symbol', as_index=False).mean()
+    assert not ref_profile.iloc[:,0].isna().any(), "There are not defined gene names in the reference profile."
+    assert not ref_profile.iloc[:,1].isna().any(), "There are not defined expression levels in the reference profile."
 
     return ref_profile
 
 
+@instrumentation.instrumented
 def read_TCGA_sample(file_name):
     '''
     Read in the TCGA profile to be analyzed. This TCGA profile serves as a dataset of cancer samples.
@@ -46,25 +50,118 @@ def read_TCGA_sample(file_name):
     Parameters: 
         file_name (string): the file name of the TCGA input file. (.csv file or path to .csv file)
                              Has to be a two column file in the format: 'symbol' (string), 'value' (float or integer)
+                             A GDC 'augmented_star_gene_counts.tsv' file is read
+                             directly (see load_expression_file).
 
     Returns:
         Reference profile data (panda df): Pandas dataframe with gene symbol and gene expression levels (pre-processed)
 
     '''
 
-    TCGA_profile = pd.read_csv(file_name, sep = ";")
+    TCGA_profile = load_expression_file(file_name)
 
     # Assert that the column size is 2.
     assert len(TCGA_profile.axes[1]) == 2, "The number of columns must be 2: 'symbol, value'"
-    assert np.isnan(any(TCGA_profile.iloc[:,0])) == False, "There are not defined gene names in the TCGA profile."
-    assert np.isnan(any(TCGA_profile.iloc[:,1])) == False, "There are not defined expression levels in the TCGA profile."
-
-    # Average the duplicate values
-    TCGA_profile = TCGA_profile.groupby('symbol', as_index=False).mean()
+    assert not TCGA_profile.iloc[:,0].isna().any(), "There are not defined gene names in the TCGA profile."
+    assert not TCGA_profile.iloc[:,1].isna().any(), "There are not defined expression levels in the TCGA profile."
 
     return TCGA_profile 
 
 
+# The pyarrow csv parser is used when it is installed, it is several times faster than
+# the default one.
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+# Parsed and deduplicated files, keyed by (path, modification time, size). The least
+# recently used file is dropped first.
+PARSE_CACHE_SIZE = 32
+_parse_cache = OrderedDict()
+
+
+@instrumentation.instrumented
+def load_expression_file(file_name, value_column = "unstranded", cache = True):
+    '''
+    Fast loader for expression files. Gene symbols are read as strings and expression
+    levels as float32, duplicated symbols are averaged and the genes are sorted
+    alphabetically.
+
+    Two formats are supported:
+        'symbol;value' .csv files (the input format of read_expr_profile and
+        read_TCGA_sample).
+        GDC 'augmented_star_gene_counts.tsv' files (as listed in the GDC MANIFEST.txt).
+        The 'gene_name' column is used as symbol, value_column as expression level, and
+        the N_unmapped, N_multimapping, ... rows are skipped.
+
+    The parsed result of a path is cached per path, modification time and size, so
+    reading the same unchanged file again is almost free. Every call returns its own
+    copy. Buffers and file objects are parsed every time.
+
+    Parameters: 
+        file_name (string, path or buffer): Path of the expression file, or anything
+                                            else pd.read_csv accepts.
+        value_column (string): Column of a GDC .tsv file with the expression levels
+                               (e.g. 'unstranded', 'tpm_unstranded').
+        cache (boolean): Use the parse cache.
+
+    Returns:
+        profile (pd.DataFrame): 'symbol', 'value' dataframe.
+    '''
+    key = None
+    if cache and isinstance(file_name, (str, os.PathLike)):
+        stat = os.stat(file_name)
+        key = (os.path.realpath(file_name), stat.st_mtime_ns, stat.st_size, value_column)
+        if key in _parse_cache:
+            _parse_cache.move_to_end(key)
+            return _parse_cache[key].copy()
+
+    if str(file_name).endswith(".tsv"):
+        profile = _parse_gdc_counts(file_name, value_column)
+    else:
+        profile = _parse_symbol_values(file_name)
+
+    # Average the duplicate values (only needed if there are any)
+    if profile.iloc[:,0].is_unique:
+        profile = profile.sort_values(profile.columns[0], ignore_index = True)
+    else:
+        profile = profile.groupby(profile.columns[0], as_index = False, sort = True).mean()
+
+    if key is not None:
+        _parse_cache[key] = profile
+        while len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last = False)
+        profile = profile.copy()
+    return profile
+
+
+def clear_parse_cache():
+    '''
+    Empties the cache of load_expression_file.
+    '''
+    _parse_cache.clear()
+
+
+def _parse_symbol_values(file_name):
+    # 'symbol;value' file with pinned dtypes. A file with more columns is returned as is
+    # and fails the column assert.
+    profile = pd.read_csv(file_name, sep = ";", encoding = "UTF-8", engine = CSV_ENGINE, dtype = {"symbol": str, "value": np.float32})
+    if len(profile.axes[1]) == 2 and profile.iloc[:,1].dtype != np.float32:
+        profile.iloc[:,1] = profile.iloc[:,1].astype(np.float32)
+    return profile
+
+
+def _parse_gdc_counts(file_name, value_column):
+    # GDC STAR counts: '# gene-model' comment line, a header and 4 N_* summary rows
+    # (without gene_name) before the genes.
+    counts = pd.read_csv(file_name, sep = "\t", comment = "#", usecols = ["gene_id", "gene_name", value_column],
+                         dtype = {"gene_id": str, "gene_name": str, value_column: np.float32})
+    counts = counts[~counts["gene_id"].str.startswith("N_")]
+    return pd.DataFrame({"symbol": counts["gene_name"].to_numpy(), "value": counts[value_column].to_numpy()})
+
+
 
 
 # def test_match(profile, sample_data, threshold):
@@ -91,6 +188,7 @@ def read_TCGA_sample(file_name):
 #     return is_match
 
 
+@instrumentation.instrumented
 def check_profile(profile, sample_data, add_missing = False, output = True):
     '''
     Check if all genes in the reference profile are present in the TCGA dataset. 
@@ -116,51 +214,35 @@ def check_profile(profile, sample_data, add_missing = False, output = True):
     '''
 
     # CHECK IF ALL GENES IN THE PROFILE ARE PRESENT IN THE TCGA SAMPLE DATA.
-    
-    # profile and sample_data are dfs. Extract their gene names as lists.
-    profile_genes = profile.iloc[:,0].tolist()
-    TCGA_genes = sample_data.iloc[:,0].tolist()
-
-    # Check if all values in profile_genes are also in TCGA_genes
-    missing_genes = []
-    missing_genes_idx = []
-    idx = 0
-    for gene in profile_genes:
-        if gene not in TCGA_genes:
-            missing_genes.append(gene)
-            missing_genes_idx.append(idx)
-        idx += 1 
-    
+
+    # Hash lookup of every profile gene in the TCGA gene index (instead of scanning a
+    # list per gene).
+    present = _gene_index(profile).isin(_gene_index(sample_data))
+    missing_genes = profile.iloc[~present, 0].tolist()
+
     # If we don´t want to add temporary zero expression levels to the TCGA_dataset, just remove them from
     # the reference profile set and report them as missing.
-    add_genes_dict = {}
     if add_missing == False:
         # Drop the missing genes from the reference profile
-        profile = profile.drop(missing_genes_idx)
-        
+        profile = profile[present]
+
         if output == True:
             print("The following genes are dropped from the reference profile dataset and not considered as they do not exist in this TCGA sample database:")
             print(missing_genes)
-        
+
         return profile, sample_data, missing_genes
     else:
-        for gene in missing_genes:
-            add_genes_dict[gene] = 0
-            
-
-        add_genes = pd.DataFrame(add_genes_dict.items(), columns=['symbol', 'value'])
-        
         # Append the missing genes with 0 expression levels and sort genes alphabetically 
-        sample_data = pd.concat([sample_data, add_genes], ignore_index=True) 
-        sample_data = sample_data.groupby('symbol', as_index=False).mean()
-        
+        sample_data = _add_zero_genes(sample_data, missing_genes)
+
         if output == True:
             print("Gene(s) from the reference profile are missing in the TCGA dataset and are added to the TCGA dataset with zero expression levels.")
             print(missing_genes)
-        
+
         return profile, sample_data, missing_genes
-        
-        
+
+
+@instrumentation.instrumented
 def check_TCGA(profile, sample_data, add_missing = False, output = True):
     '''
     Check if all genes in the TCGA dataset are present in the reference profile.
@@ -186,45 +268,27 @@ def check_TCGA(profile, sample_data, add_missing = False, output = True):
     '''
     
     # CHECK IF ALL GENES IN THE TCGA ARE PRESENT IN THE REFERENCE PROFILE DATASET.
-    
-    # profile and sample_data are dfs. Extract their gene names as lists.
-    profile_genes = profile.iloc[:,0].tolist()
-    TCGA_genes = sample_data.iloc[:,0].tolist()
-
-    # Check if all values in TCGA_genes are alson in profile_genes
-    missing_genes = []
-    missing_genes_idx = []
-    idx = 0
-    for gene in TCGA_genes:
-        if gene not in profile_genes:
-            missing_genes.append(gene)
-            missing_genes_idx.append(idx)
-        idx += 1
-
-        
+
+    # Hash lookup of every TCGA gene in the reference gene index (instead of scanning a
+    # list per gene).
+    present = _gene_index(sample_data).isin(_gene_index(profile))
+    missing_genes = sample_data.iloc[~present, 0].tolist()
+
     # If we don´t want to add temporary zero expression levels to the ref_profile_dataset, just remove them from
     # the TCGA profile set and report them as missing.
-    add_genes_dict = {}
     if add_missing == False:
-        # Drop the missing genes from the reference profile
-        sample_data = sample_data.drop(missing_genes_idx)
-        
+        # Drop the missing genes from the TCGA dataset
+        sample_data = sample_data[present]
+
         if output == True:
             print("The following genes are dropped from the TCGA dataset and not considered as they do not exist in this Reference profile dataset:")
             print(missing_genes)
-        
+
         return profile, sample_data, missing_genes
     else:
-        for gene in missing_genes:
-            add_genes_dict[gene] = 0
-            
-
-        add_genes = pd.DataFrame(add_genes_dict.items(), columns=['symbol', 'value'])
-        
         # Append the missing genes with 0 expression levels and sort genes alphabetically 
-        profile = pd.concat([profile, add_genes], ignore_index=True) 
-        profile = profile.groupby('symbol', as_index=False).mean()
-        
+        profile = _add_zero_genes(profile, missing_genes)
+
         if output == True:
             print("Gene(s) from the TCGA profile are missing in the reference dataset and are added to the reference dataset with zero expression levels.")
             print(missing_genes)
@@ -232,9 +296,90 @@ def check_TCGA(profile, sample_data, add_missing = False, output = True):
         return profile, sample_data, missing_genes
 
 
+@instrumentation.instrumented
+def reconcile_genes(profile, sample_data, add_missing = False):
+    '''
+    Reconcile the genes of the reference profile and the TCGA dataset in both directions
+    at once. This gives the same result as running check_TCGA and check_profile one
+    after the other, but both gene columns are turned into a hash index once and the
+    expression levels come back as aligned vectors.
+
+    Parameters: 
+        profile (pd.DataFrame): Reference Profile dataset ('symbol', 'value')
+        sample_data (pd.DataFrame): TCGA dataset ('symbol', 'value')
+        add_missing (boolean): If False, genes that only exist in one dataset are
+                               dropped. If True, they are kept and get zero expression
+                               levels in the other dataset.
+
+    Returns:
+        genes (np.ndarray): Sorted gene symbols, the common row order of both value
+                            vectors.
+        profile_levels (np.ndarray): Reference expression levels aligned to genes
+                                     (float64).
+        TCGA_levels (np.ndarray): TCGA expression levels aligned to genes (float64).
+        missing_TCGA (list): Genes of the reference profile that are missing in the TCGA
+                             dataset.
+        missing_reference (list): Genes of the TCGA dataset that are missing in the
+                                  reference profile.
+    '''
+    profile_levels = _gene_levels(profile)
+    TCGA_levels = _gene_levels(sample_data)
+
+    # Fast path: both datasets hold exactly the same genes (e.g. two GDC samples of the
+    # same gene model).
+    if profile_levels.index.equals(TCGA_levels.index) and profile_levels.index.is_monotonic_increasing:
+        return profile_levels.index.to_numpy(), profile_levels.to_numpy(dtype = np.float64), TCGA_levels.to_numpy(dtype = np.float64), [], []
+
+    # One hash lookup per direction.
+    in_TCGA = profile_levels.index.isin(TCGA_levels.index)
+    in_profile = TCGA_levels.index.isin(profile_levels.index)
+    missing_TCGA = profile_levels.index[~in_TCGA].tolist()
+    missing_reference = TCGA_levels.index[~in_profile].tolist()
+
+    if not add_missing:
+        genes = profile_levels.index[in_TCGA].sort_values()
+    else:
+        genes = profile_levels.index.union(TCGA_levels.index, sort = True)
+
+    # Missing genes only show up in the union and are filled with zero expression
+    # levels.
+    profile_values = profile_levels.reindex(genes, fill_value = 0).to_numpy(dtype = np.float64)
+    TCGA_values = TCGA_levels.reindex(genes, fill_value = 0).to_numpy(dtype = np.float64)
+
+    return genes.to_numpy(), profile_values, TCGA_values, missing_TCGA, missing_reference
+
+
+def _gene_index(data):
+    # Gene symbols of a 'symbol', 'value' dataframe as a (hashable) pandas index. Object
+    # dtype: isin on pyarrow backed strings (what the pyarrow csv parser returns) goes
+    # through python lists and is ~30x slower.
+    return pd.Index(data.iloc[:,0].to_numpy(dtype = object), dtype = object)
+
+
+def _gene_levels(data):
+    # Expression levels as a series indexed by gene symbol. Duplicated symbols are
+    # averaged like in read_expr_profile.
+    levels = pd.Series(pd.to_numeric(data.iloc[:,1]).to_numpy(), index = _gene_index(data))
+    if not levels.index.is_unique:
+        levels = levels.groupby(level = 0).mean()
+    return levels
+
+
+def _add_zero_genes(data, genes):
+    # Append genes with zero expression levels and sort the dataframe alphabetically by
+    # gene symbol. Duplicated symbols are averaged, like the groupby of the original
+    # implementation (the groupby is only paid if there are any).
+    add_genes = pd.DataFrame({data.columns[0]: genes, data.columns[1]: 0})
+    data = pd.concat([data, add_genes], ignore_index=True)
+    if data[data.columns[0]].duplicated().any():
+        return data.groupby(data.columns[0], as_index=False).mean()
+    return data.sort_values(data.columns[0], kind = "stable", ignore_index = True)
+
 
 
-def compute_distance(profile, sample_data):
+
+@instrumentation.instrumented
+def compute_distance(profile, sample_data, method = "pearson"):
 
     '''
     Compute the distance between the reference expression profile and a sample expression profile as a pearson correlation
@@ -243,40 +388,59 @@ def compute_distance(profile, sample_data):
         profile (pandas df): a pandas df with the reference profil
                                 data is the expression level, rownames are gene symbols or IDs
         sample_data(pandas df): a pandas df with the sample profile data is the expression level, rownames are gene symbols or IDs
+        method (string): "pearson" (default), "spearman", "cosine" or "kendall" (see the
+                         correlation module).
 
     Returns (float): match score - correlation of expression values distance type metric that shows how similiar the gene expression data sets are:
                     0 would be minimum and 1 would be maximum
 
     '''
-    profile_levels = profile.iloc[:,1].tolist()
-    TCGA_levels = sample_data.iloc[:,1].tolist()
+    profile_levels = profile.iloc[:,1].to_numpy(dtype = np.float64)
+    TCGA_levels = sample_data.iloc[:,1].to_numpy(dtype = np.float64)
     
     assert len(profile_levels) == len(TCGA_levels), "Input datasets are not of same length."
     
-    distance, p = pearsonr(profile_levels, TCGA_levels)
+    distance = correlation.correlate(profile_levels, TCGA_levels, method)
     return round(distance,4)
 
 
+@instrumentation.instrumented
 def normalize_profile(profile, method = "z-score"):
+    '''
+    Normalizes the expression levels of a profile (see normalization.normalize_matrix
+    for the methods). The passed dataframe is not changed.
 
-    # SOURCE for mean and min-max: https://stackoverflow.com/questions/26414913/normalize-columns-of-a-dataframe
-    if method == "z-score":
-        profile.iloc[:,1] = zscore(profile.iloc[:,1])
-        return profile
-    
-    elif method == "mean":
-        profile.iloc[:,1] = (profile.iloc[:,1]-profile.iloc[:,1].mean())/profile.iloc[:,1].std()
-        return profile
-    
-    elif method == "min-max":
-        profile.iloc[:,1] =(profile.iloc[:,1]-profile.iloc[:,1].min())/(profile.iloc[:,1].max()-profile.iloc[:,1].min())
-        return profile
-    elif method == "raw":
-        return profile
-    else:
-        print("Not a valid input method")
-        return 0
-    
+    Parameters: 
+        profile (pd.DataFrame): 'symbol', 'value' dataset.
+        method (string): "z-score", "mean", "min-max", "log1p", "cpm", "quantile" or
+                         "raw".
+
+    Returns:
+        profile (pd.DataFrame): Copy of the profile with normalized expression levels
+                                (float64).
+    '''
+    profile = profile.copy()
+    profile[profile.columns[1]] = normalize_levels(profile.iloc[:,1], method)
+    return profile
+
+
+@instrumentation.instrumented
+def normalize_levels(levels, method = "z-score"):
+    '''
+    Normalizes expression levels like normalize_profile, for a vector or for every
+    column of a genes x samples matrix at once. The input is not changed.
+
+    Parameters: 
+        levels (np.ndarray): Expression levels (vector or genes x samples matrix).
+        method (string): A method of normalization.normalize_matrix.
+
+    Returns:
+        levels (np.ndarray): Normalized levels (float64).
+    '''
+    return normalization.normalize_matrix(np.array(levels, dtype = np.float64), method)
+
+
+@instrumentation.instrumented
 def expression_analysis(profile, sample_data, sensitivity_threshold = 0.05):
     '''
     Analyses similiarities between the reference expression profile and a sample expression profile:
@@ -288,6 +452,8 @@ def expression_analysis(profile, sample_data, sensitivity_threshold = 0.05):
     Parameters: 
         profile (pd.DataFrame): Reference Profile dataset
         sample_data (pd.DataFrame): TCGA dataset
+        sensitivity_threshold (float): Maximum distance of the ratio from 1 for genes to
+                                       count as similiar.
 
     Returns (float): 
         gene_ratio (pd.DataFrame) 
@@ -295,89 +461,160 @@ def expression_analysis(profile, sample_data, sensitivity_threshold = 0.05):
 
     ''' 
  
-    # Loop through the dfs and find the genes whose expression levels are most similiar within a certain threshold
-    similiar = []  # list of genes that have similiar expression levels among two profiles
-    ratio_list = []  # list ofthe ratio of genes  
-    for gene in range(len(profile.axes[0])):
-        ratio = profile.iloc[gene, 1]/sample_data.iloc[gene, 1]
-        # Consider the nans. You have to edit this later! I want it to be representative. 
-        if np.isnan(ratio):
-            ratio = 0
-        ratio_list.append(ratio)
-        if abs(ratio-1) <= sensitivity_threshold:
-            similiar.append(gene)
-
-    gene_ratio = pd.DataFrame(list(zip(profile.iloc[:,0].tolist(), ratio_list)), columns =['symbol', 'ratio'])
+    assert len(profile.axes[0]) == len(sample_data.axes[0]), "Input datasets are not of same length."
+
+    # Ratio of all genes at once, then the genes whose expression levels are most
+    # similiar within a certain threshold
+    ratio = expression_ratios(profile.iloc[:,1].to_numpy(dtype = np.float64), sample_data.iloc[:,1].to_numpy(dtype = np.float64))
+    similiar = np.flatnonzero(similiar_mask(ratio, sensitivity_threshold)).tolist()  # positions of genes that have similiar expression levels
+
+    gene_ratio = pd.DataFrame({'symbol': profile.iloc[:,0].to_numpy(), 'ratio': ratio})
 
     return gene_ratio, similiar
 
 
-def gene_bar_chart(gene_ratio, show = "percentage"):
+@instrumentation.instrumented
+def expression_ratios(profile_levels, sample_levels):
+    '''
+    Computes the expression level ratio reference/TCGA for every gene. Works for one
+    TCGA sample (vector) or for many samples at once (genes x samples matrix).
+
+    Denominators are handled explicitly:
+        0/0 and anything with an undefined (nan) level gives a ratio of 0.
+        x/0 (x != 0) gives +-inf, it is counted as a strong over-/underexpression.
+        x/inf gives 0.
+
+    Parameters: 
+        profile_levels (np.ndarray): Reference expression levels (one per gene).
+        sample_levels (np.ndarray): TCGA expression levels aligned to the same genes.
+                                    Vector or genes x samples matrix.
+
+    Returns:
+        ratio (np.ndarray): Ratios with the shape of sample_levels (float64).
+    '''
+    profile_levels = np.asarray(profile_levels, dtype = np.float64)
+    sample_levels = np.asarray(sample_levels)
+    if sample_levels.ndim == 2:
+        profile_levels = profile_levels[:, np.newaxis]
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        ratio = np.divide(profile_levels, sample_levels, dtype = np.float64)
+    ratio[np.isnan(ratio)] = 0
+    return ratio
+
+
+def similiar_mask(ratio, sensitivity_threshold = 0.05):
+    '''
+    Boolean mask of the ratios that are within the sensitivity threshold of 1 (similiar
+    expression levels).
+    '''
+    return np.abs(ratio - 1) <= sensitivity_threshold
+
+
+# Upper edges of the ratio bins of the bar chart. Bins are closed on the right:
+# (0.2, 0.4], (0.4, 0.6], ... Everything <= the first edge falls into the first bin,
+# everything > the last edge into the last bin.
+RATIO_BIN_EDGES = (0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 1.8, 2.0)
+
+
+@instrumentation.instrumented
+def ratio_histogram(gene_ratio, edges = RATIO_BIN_EDGES):
+    '''
+    Counts the gene ratios per bin. This is the data behind gene_bar_chart and needs no
+    plotting.
+
+    Parameters: 
+        gene_ratio (pd.DataFrame or np.ndarray): obtained from expression_analysis
+                                                 function (uses the 'ratio' column), or
+                                                 ratios from expression_ratios (vector
+                                                 or genes x samples matrix).
+        edges (tuple of floats): Sorted upper edges of the bins (see RATIO_BIN_EDGES).
+
+    Returns:
+        counts (pd.Series or pd.DataFrame): Number of genes per bin, indexed by the bin
+                                            labels ("0.0-0.2", ..., ">2.0", "nan"). One
+                                            column per sample for a matrix.
+    '''
+    if isinstance(gene_ratio, pd.DataFrame):
+        ratio = gene_ratio["ratio"].to_numpy(dtype = np.float64)
+    else:
+        ratio = np.asarray(gene_ratio, dtype = np.float64)
+    labels = ratio_bin_labels(edges)
+
+    # Bin of every ratio; undefined ratios get the extra last bin.
+    bins = np.digitize(ratio, edges, right = True)
+    bins[np.isnan(ratio)] = len(labels) - 1
+
+    if ratio.ndim == 1:
+        return pd.Series(np.bincount(bins, minlength = len(labels)), index = labels)
+
+    # One bincount for all samples: shift the bins of every column into their own range.
+    n_samples = ratio.shape[1]
+    bins = bins + np.arange(n_samples) * len(labels)
+    counts = np.bincount(bins.ravel(), minlength = n_samples * len(labels)).reshape(n_samples, len(labels))
+    return pd.DataFrame(counts.T, index = labels)
+
+
+def ratio_bin_labels(edges = RATIO_BIN_EDGES):
+    '''
+    Labels of the ratio bins: "0.0-<first edge>", "<edge>-<next edge>", ...,
+    "><last edge>" and "nan".
+    '''
+    lower = (0.0,) + tuple(edges[:-1])
+    labels = [f"{lo:.1f}-{hi:.1f}" for lo, hi in zip(lower, edges)]
+    return labels + [f">{edges[-1]:.1f}", "nan"]
+
+
+@instrumentation.instrumented
+def gene_bar_chart(gene_ratio, show = "percentage", edges = RATIO_BIN_EDGES, ax = None):
     '''
     Prints a bar chart with gene ratios. 
     
     Parameters: 
         gene_ratio (pd.DataFrame) = obtained from expression_analysis function.
+                                    It is not changed.
         show (string) = determines whether percentage or discrete count values are shown
+        edges (tuple of floats) = upper edges of the ratio bins (see ratio_histogram)
+        ax (matplotlib Axes) = draw the chart on these axes (e.g. a figure embedded in
+                               the UI) instead of showing it
 
     Returns (float): 
         na
         (prints bar chart)
 
     ''' 
-    # loop through dataframe to create bins
-    category = []
-    for ratio in gene_ratio["ratio"]:
-        if ratio <= 0.2:
-            category.append("0.0-0.2")
-        elif ratio > 0.2 and ratio <= 0.4:
-            category.append("0.2-0.4")
-        elif ratio > 0.4 and ratio <= 0.6:
-            category.append("0.4-0.6")
-        elif ratio > 0.6 and ratio <= 0.8:
-            category.append("0.6-0.8")
-        elif ratio > 0.8 and ratio <= 1:
-            category.append("0.8-1.0")
-        elif ratio > 1.0 and ratio <= 1.2:
-            category.append("1.0-1.2")
-        elif ratio > 1.2 and ratio <= 1.4:
-            category.append("1.2-1.4")
-        elif ratio > 1.4 and ratio <= 1.6:
-            category.append("1.4-1.6")
-        elif ratio > 1.6 and ratio <= 1.8:
-            category.append("1.6-1.8")
-        elif ratio > 1.8 and ratio <= 2.0:
-            category.append("1.8-2.0")
-        elif ratio > 2.0:
-            category.append(">2.0")
+    gene_ratio_count = ratio_histogram(gene_ratio, edges)
+    # Undefined ratios are only shown if there are any.
+    if gene_ratio_count["nan"] == 0:
+        gene_ratio_count = gene_ratio_count.drop("nan")
+
+    # Orange: reference underexpressed, green: similiar, blue: reference overexpressed
+    lower = (-np.inf,) + tuple(edges)
+    upper = tuple(edges) + (np.inf, np.nan)
+    colors = []
+    for lo, hi in zip(lower, upper[:len(gene_ratio_count)]):
+        if hi <= 0.8:
+            colors.append('#FFA500')
+        elif lo >= 0.8 and hi <= 1.2:
+            colors.append('#2E8B57')
         else:
-            category.append("nan")
-    
-    # Count the values of each bin:
-    gene_ratio["category"] = category
-    gene_ratio_count = gene_ratio.groupby('category')["category"].count()
+            colors.append('#191970')
 
+    show_chart = ax is None
+    if ax is None:
+        ax = plt.gca()
 
-    p1 = plt.bar(gene_ratio_count.index.sort_values(), gene_ratio_count,  color=['#FFA500', '#FFA500', '#FFA500', '#FFA500', 
-                                                                                 '#2E8B57', '#2E8B57', 
-                                                                                 '#191970', '#191970','#191970', '#191970','#191970','#191970'])
-                                                                                 
+    p1 = ax.bar(gene_ratio_count.index, gene_ratio_count, color=colors)
 
     for rect1 in p1:
         height = rect1.get_height()
         if show == "count":
-            plt.annotate("{}".format(height),(rect1.get_x() + rect1.get_width()/2, height+.05),ha="center",va="bottom",fontsize=9)
+            ax.annotate("{}".format(height),(rect1.get_x() + rect1.get_width()/2, height+.05),ha="center",va="bottom",fontsize=9)
         else: # shows percentage
-            plt.annotate("{}%".format(round(height/len(gene_ratio),3)*100),(rect1.get_x() + rect1.get_width()/2, height+.05),ha="center",va="bottom",fontsize=9)
-    plt.xlabel = ("Expression Value Ratio: Reference/TCGA")
-    plt.ylabel = ("Number of genes")
-    plt.title = ("Binned Bar Chart: Gene Expression Level Relationship")
-    plt.xticks(rotation="vertical")
-    plt.show()
-
-
-
-
-
-
-            
+            ax.annotate("{}%".format(round(height/len(gene_ratio),3)*100),(rect1.get_x() + rect1.get_width()/2, height+.05),ha="center",va="bottom",fontsize=9)
+    ax.set_xlabel("Expression Value Ratio: Reference/TCGA")
+    ax.set_ylabel("Number of genes")
+    ax.set_title("Binned Bar Chart: Gene Expression Level Relationship")
+    ax.tick_params(axis="x", labelrotation=90)
+    if show_chart:
+        plt.show()
@@ -0,0 +1,176 @@
+import numpy as np
+from TCGA_code import cohort as c
+from TCGA_code import sparse
+
+
+class MatchIndex:
+    '''
+    Top-k search for the TCGA samples of a cohort that correlate best with a reference
+    profile.
+
+    The pearson correlation is the cosine similarity of centered, unit-norm vectors, so
+    the best matches are nearest neighbours. Three modes are available:
+        "exact":  every sample is scored, one block of sample columns at a time
+                  (blocked matrix products).
+        "random": the centered, unit-norm samples are reduced to n_components
+                  dimensions with a random projection. A query is scored in the
+                  reduced space and the best k * oversample candidates are re-ranked
+                  exactly.
+        "pca":    like "random", but the projection uses the principal components of
+                  (a sample of) the cohort.
+
+    Attributes:
+        cohort (Cohort): The indexed cohort.
+        mode (string): "exact", "random" or "pca".
+    '''
+
+    def __init__(self, cohort, mode = "exact", n_components = 128, oversample = 10, block_size = 2048, seed = 0):
+        '''
+        Parameters:
+            cohort (Cohort): The cohort to index.
+            mode (string): "exact", "random" or "pca".
+            n_components (int): Dimension of the reduced vectors ("random" and "pca").
+            oversample (int): Number of candidates per requested match that are
+                              re-ranked exactly ("random" and "pca").
+            block_size (int): Number of sample columns scored at once.
+            seed (int): Seed of the random projection and of the samples the principal
+                        components are computed on.
+        '''
+        assert mode in ("exact", "random", "pca"), "The mode must be 'exact', 'random' or 'pca'."
+        self.cohort = cohort
+        self.mode = mode
+        self.oversample = oversample
+        self.block_size = block_size
+
+        # Column statistics over all cohort genes: the mean and norm of every centered
+        # sample.
+        y_sum, y_sq_sum = cohort.column_sums()
+        self._y_mean = y_sum / max(cohort.n_genes, 1)
+        self._y_norm = np.sqrt(np.maximum(y_sq_sum - cohort.n_genes * self._y_mean * self._y_mean, 0))
+
+        self._projection = None
+        self._reduced = None
+        if mode != "exact":
+            n_components = min(n_components, cohort.n_genes)
+            rng = np.random.default_rng(seed)
+            if mode == "random":
+                projection = rng.standard_normal((n_components, cohort.n_genes)) / np.sqrt(n_components)
+            else:
+                projection = self._principal_components(n_components, rng)
+            self._projection = projection.astype(np.float32)
+            self._reduced = self._reduce_cohort()
+
+    def query(self, profile, k = 10, add_missing = False):
+        '''
+        Find the k TCGA samples that correlate best with a reference profile. The scores
+        are exact pearson correlations (see match_cohort); in the approximate modes, a
+        sample may be missed if its reduced vector does not rank among the candidates.
+
+        Parameters:
+            profile (pd.DataFrame): Reference Profile dataset ('symbol', 'value')
+            k (int): Number of matches.
+            add_missing (boolean): Gene handling of the scores, see match_cohort.
+
+        Returns:
+            ranking (pd.DataFrame): The k best samples, sorted from best to worst match
+                                    ('score' and 'rank' columns).
+        '''
+        k = min(k, self.cohort.n_samples)
+        aligned = c._align_profile(profile, self.cohort, add_missing)
+
+        if self.mode == "exact":
+            candidates = np.arange(self.cohort.n_samples)
+            scores = self._exact_scores(aligned, candidates)
+        else:
+            n_candidates = min(self.cohort.n_samples, k * self.oversample)
+            approximate = self._reduced_scores(aligned)
+            candidates = np.sort(_top(approximate, n_candidates))
+            scores = self._exact_scores(aligned, candidates)
+
+        best = _top(scores, k)
+        return c.rank_samples(self.cohort.samples.iloc[candidates[best]], scores[best])
+
+    def _exact_scores(self, aligned, columns):
+        # Exact scores of the given sample columns, one block of columns at a time.
+        rows = aligned[0]
+        scores = np.empty(len(columns))
+        for start in range(0, len(columns), self.block_size):
+            block = columns[start:start + self.block_size]
+            if len(block) == self.cohort.n_samples:
+                matrix = self.cohort.matrix
+            elif block[-1] - block[0] + 1 == len(block):
+                matrix = self.cohort.matrix[:, block[0]:block[-1] + 1]
+            else:
+                matrix = self.cohort.matrix[:, block]
+            column_sums = None
+            if rows is None:
+                y_sum, y_sq_sum = self.cohort.column_sums()
+                column_sums = (y_sum[block], y_sq_sum[block])
+            scores[start:start + len(block)] = c._score_columns(aligned, matrix, column_sums)
+        return scores
+
+    def _reduced_scores(self, aligned):
+        # Approximate scores: cosine similarity of the reduced, centered, unit-norm
+        # vectors.
+        rows, x, n, x_sum, x_sq_sum = aligned
+        full = np.zeros(self.cohort.n_genes, dtype = np.float64)
+        if rows is None:
+            full[:] = x
+        else:
+            full[rows] = x
+        full -= full.mean()
+        norm = np.linalg.norm(full)
+        if norm > 0:
+            full /= norm
+        query = self._projection @ full.astype(np.float32)
+        return query @ self._reduced
+
+    def _reduce_cohort(self):
+        # Reduced vectors of all centered, unit-norm samples (n_components x samples),
+        # one block at a time: R (y - mean) / norm = (R y - (R 1) mean) / norm
+        projection_sum = self._projection.sum(axis = 1, dtype = np.float64)[:, np.newaxis]
+        reduced = np.empty((self._projection.shape[0], self.cohort.n_samples), dtype = np.float32)
+        for start in range(0, self.cohort.n_samples, self.block_size):
+            stop = min(start + self.block_size, self.cohort.n_samples)
+            block = self._projection @ self.cohort.matrix[:, start:stop]
+            block = (block - projection_sum * self._y_mean[start:stop]) / _nonzero(self._y_norm[start:stop])
+            reduced[:, start:stop] = block
+        return reduced
+
+    def _principal_components(self, n_components, rng, max_samples = 1000):
+        # Leading principal directions of the centered, unit-norm samples (computed on
+        # at most max_samples samples).
+        columns = np.arange(self.cohort.n_samples)
+        if len(columns) > max_samples:
+            columns = np.sort(rng.choice(columns, max_samples, replace = False))
+        sample = sparse.dense(self.cohort.matrix[:, columns]).astype(np.float64)
+        sample = (sample - self._y_mean[columns]) / _nonzero(self._y_norm[columns])
+
+        # Eigenvectors of the small samples x samples gram matrix give the left singular
+        # vectors: u = sample v / s
+        eigenvalues, v = np.linalg.eigh(sample.T @ sample)
+        order = np.argsort(eigenvalues)[::-1][:n_components]
+        order = order[eigenvalues[order] > 1e-10 * max(eigenvalues.max(), 1e-300)]
+        components = (sample @ (v[:, order] / np.sqrt(eigenvalues[order]))).T
+
+        if components.shape[0] < n_components:
+            # Fewer samples than components: fill up with random directions.
+            extra = rng.standard_normal((n_components - components.shape[0], self.cohort.n_genes)) / np.sqrt(n_components)
+            components = np.vstack([components, extra])
+        return components
+
+    def __repr__(self):
+        return f"MatchIndex({self.cohort!r}, mode = {self.mode!r})"
+
+
+def _top(scores, k):
+    # Positions of the k highest scores (undefined scores last), in no particular order.
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+def _nonzero(values):
+    # Replace zeros (constant samples) by 1 to avoid a division by zero.
+    return np.where(values > 0, values, 1)
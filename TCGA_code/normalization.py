@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from TCGA_code import correlation
+from TCGA_code import sparse
+
+
+# Column-wise normalization of genes x samples matrices (a vector is one column). Every
+# method runs on all columns in one vectorized pass. The statistics the methods need
+# (sum, sum of squares, minimum and maximum of every sample) can be passed in, e.g. the
+# ones a cohort store keeps (see Cohort.sample_stats), so they are not computed again.
+METHODS = ["z-score", "mean", "min-max", "log1p", "cpm", "tpm", "quantile", "raw"]
+STATS_COLUMNS = ["sum", "sq_sum", "min", "max"]
+
+
+def sample_stats(matrix, block_size = 1024):
+    '''
+    Per-sample statistics of a genes x samples matrix, computed block_size columns at a
+    time (float64).
+
+    Returns:
+        stats (pd.DataFrame): One row per column: 'sum' (the library size of count
+                              data), 'sq_sum', 'min' and 'max'.
+    '''
+    if not sparse.issparse(matrix):
+        matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        matrix = matrix[:, np.newaxis]
+    stats = np.zeros((matrix.shape[1], len(STATS_COLUMNS)))
+    for start in range(0, matrix.shape[1], block_size):
+        stop = min(start + block_size, matrix.shape[1])
+        stats[start:stop] = column_stats(matrix[:, start:stop])
+    return pd.DataFrame(stats, columns = STATS_COLUMNS)
+
+
+def column_stats(block):
+    '''
+    Sum, sum of squares, minimum and maximum of every column of a (sparse or dense)
+    block (a samples x 4 float64 array).
+    '''
+    if sparse.issparse(block):
+        block = block.astype(np.float64)
+        return np.column_stack([np.asarray(block.sum(axis = 0)).ravel(),
+                                np.asarray(block.multiply(block).sum(axis = 0)).ravel(),
+                                block.min(axis = 0).toarray().ravel(),
+                                block.max(axis = 0).toarray().ravel()])
+    block = np.asarray(block)
+    if block.ndim == 1:
+        block = block[:, np.newaxis]
+    if block.shape[0] == 0:
+        return np.zeros((block.shape[1], len(STATS_COLUMNS)))
+    return np.column_stack([block.sum(axis = 0, dtype = np.float64),
+                            np.einsum("ij,ij->j", block, block, dtype = np.float64),
+                            block.min(axis = 0).astype(np.float64),
+                            block.max(axis = 0).astype(np.float64)])
+
+
+def normalize_matrix(matrix, method = "z-score", stats = None, copy = False, gene_lengths = None, target = None):
+    '''
+    Normalizes every column of a genes x samples matrix (or a vector).
+
+    Methods:
+        "z-score":  (x - mean) / standard deviation
+        "mean":     (x - mean) / sample standard deviation (ddof = 1)
+        "min-max":  (x - min) / (max - min)
+        "log1p":    log(1 + x)
+        "cpm":      counts per million: x / library size * 1e6
+        "tpm":      transcripts per million: x / gene length, scaled to a sum of 1e6
+                    (needs gene_lengths)
+        "quantile": every column gets the same distribution (target, by default the
+                    mean of the sorted columns); tied values get the target value at
+                    their average rank
+        "raw":      unchanged
+
+    The matrix is normalized in place, unless copy is True or it can not be (integer
+    dtype or read-only, e.g. a memory-mapped cohort store). float32 stays float32,
+    everything else becomes float64. Constant columns give NaN for "z-score", "mean" and
+    "min-max".
+
+    Parameters:
+        matrix (np.ndarray): genes x samples matrix or vector.
+        method (string): One of METHODS.
+        stats (pd.DataFrame): Per-sample statistics of the matrix (see sample_stats).
+                              Computed if not given.
+        copy (boolean): Normalize a copy.
+        gene_lengths (np.ndarray): One length per gene (row), for "tpm".
+        target (np.ndarray): Sorted target distribution (one value per gene), for
+                             "quantile".
+
+    Returns:
+        levels (np.ndarray): The normalized matrix (the input itself if it was
+                             normalized in place).
+    '''
+    if method not in METHODS:
+        raise ValueError(f"Not a valid input method: {method}")
+    levels = _writable(matrix, copy)
+    columns = levels if levels.ndim == 2 else levels[:, np.newaxis]
+    n = columns.shape[0]
+
+    if method in ("z-score", "mean", "min-max", "cpm"):
+        if stats is None:
+            stats = sample_stats(columns)
+        stats = {name: np.asarray(stats[name], dtype = np.float64) for name in STATS_COLUMNS}
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        if method in ("z-score", "mean"):
+            # Two-pass standard deviation: the sum of squares of the centered levels,
+            # not sq_sum - n * mean^2 (which cancels for large levels with a small
+            # spread).
+            mean = stats["sum"] / n
+            columns -= mean.astype(columns.dtype)
+            ss = np.einsum("ij,ij->j", columns, columns, dtype = np.float64)
+            std = np.sqrt(ss / (n if method == "z-score" else n - 1))
+            columns /= std.astype(columns.dtype)
+        elif method == "min-max":
+            columns -= stats["min"].astype(columns.dtype)
+            columns /= (stats["max"] - stats["min"]).astype(columns.dtype)
+        elif method == "log1p":
+            np.log1p(columns, out = columns)
+        elif method == "cpm":
+            columns *= (1e6 / stats["sum"]).astype(columns.dtype)
+        elif method == "tpm":
+            assert gene_lengths is not None, "TPM normalization needs the gene lengths."
+            columns /= np.asarray(gene_lengths, dtype = columns.dtype)[:, np.newaxis]
+            columns *= (1e6 / columns.sum(axis = 0, dtype = np.float64)).astype(columns.dtype)
+        elif method == "quantile":
+            columns[:] = _quantile(columns, target)
+    return levels
+
+
+def quantile_target(matrix, block_size = 1024):
+    '''
+    Target distribution of the quantile normalization: the mean of the sorted columns,
+    block_size columns at a time.
+    '''
+    matrix = np.asarray(matrix)
+    if matrix.ndim == 1:
+        return np.sort(matrix).astype(np.float64)
+    target = np.zeros(matrix.shape[0])
+    for start in range(0, matrix.shape[1], block_size):
+        stop = min(start + block_size, matrix.shape[1])
+        target += np.sort(matrix[:, start:stop], axis = 0).sum(axis = 1, dtype = np.float64)
+    return target / max(matrix.shape[1], 1)
+
+
+def _quantile(columns, target = None):
+    # Map the (average) rank of every value to the target distribution, interpolated
+    # between the target values for the fractional ranks of ties.
+    if target is None:
+        target = quantile_target(columns)
+    target = np.asarray(target, dtype = np.float64)
+    assert len(target) == columns.shape[0], "The quantile target needs one value per gene."
+    position = correlation.rank(columns) - 1
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, len(target) - 1)
+    fraction = position - below
+    return target[below] * (1 - fraction) + target[above] * fraction
+
+
+def _writable(matrix, copy = False):
+    # The matrix itself if it can be normalized in place, otherwise a float copy
+    # (dense).
+    if sparse.issparse(matrix):
+        matrix = sparse.dense(matrix)
+        copy = False
+    dtype = np.float32 if np.asarray(matrix).dtype == np.float32 else np.float64
+    if not copy and isinstance(matrix, np.ndarray) and matrix.dtype == dtype and matrix.flags.writeable:
+        return matrix
+    return np.array(matrix, dtype = dtype)
@@ -0,0 +1,181 @@
+import os
+
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code import gene_panel
+from TCGA_code import instrumentation
+
+
+# Stages of a comparison, in order. Every stage only depends on the stages before it and
+# on these parameters.
+STAGES = ["reference", "sample", "reconciled", "normalized", "distance", "expression"]
+STAGE_PARAMETERS = {
+    "reference": [],
+    "sample": [],
+    "reconciled": ["add_missing", "panel"],
+    "normalized": ["method"],
+    "distance": [],
+    "expression": ["threshold"],
+}
+
+
+class MatchPipeline:
+    '''
+    One comparison of a reference profile with a TCGA sample:
+        read both files -> check_TCGA / check_profile -> normalize_profile ->
+        compute_distance and expression_analysis
+
+    The stages are evaluated lazily, when their result is first asked for, and memoized.
+    A stage is keyed by the fingerprints of the inputs (path, modification time and size
+    of a file, or the contents of a dataframe) and by the parameters of the stage and of
+    the stages before it. Changing a parameter only re-runs the stages that depend on
+    it: a new threshold re-runs expression_analysis, but does not read or reconcile the
+    files again.
+
+    Attributes:
+        reference (string or pd.DataFrame): Reference profile file (see
+                                            read_expr_profile) or 'symbol', 'value'
+                                            dataframe.
+        sample (string or pd.DataFrame): TCGA sample file (see read_TCGA_sample) or
+                                         'symbol', 'value' dataframe.
+        add_missing (boolean): Add missing genes with zero expression levels instead of
+                               dropping them.
+        panel (list of strings): If given, only the genes of this panel are compared
+                                 (see gene_panel.read_gene_panel).
+        method (string): Normalization method, see normalize_profile.
+        threshold (float): Sensitivity threshold of expression_analysis.
+        output (boolean): Prints the outputs of check_TCGA and check_profile.
+        on_stage (function): Called with the name of a stage before it is computed (not
+                             when it is reused).
+        computed (list of strings): Names of the stages that were computed, in order.
+    '''
+
+    def __init__(self, reference = None, sample = None, add_missing = False, method = "z-score", threshold = 0.05, output = False, on_stage = None, panel = None):
+        self.reference = reference
+        self.sample = sample
+        self.add_missing = add_missing
+        self.panel = panel
+        self.method = method
+        self.threshold = threshold
+        self.output = output
+        self.on_stage = on_stage
+        self.computed = []
+        self._results = {}
+
+    def reference_profile(self):
+        '''
+        Returns the reference profile dataframe (read_expr_profile).
+        '''
+        return self._stage("reference", lambda: _read(self.reference, m.read_expr_profile))
+
+    def sample_profile(self):
+        '''
+        Returns the TCGA sample dataframe (read_TCGA_sample).
+        '''
+        return self._stage("sample", lambda: _read(self.sample, m.read_TCGA_sample))
+
+    def reconciled(self):
+        '''
+        Returns the profile, the sample, the genes missing in the TCGA sample and the
+        genes missing in the reference profile, after check_TCGA and check_profile.
+        '''
+        def compute():
+            profile, sample = self.reference_profile(), self.sample_profile()
+            if self.panel is not None:
+                profile = gene_panel.restrict_profile(profile, self.panel)
+                sample = gene_panel.restrict_profile(sample, self.panel)
+            profile, sample, missing_TCGA = m.check_TCGA(profile, sample, self.add_missing, self.output)
+            profile, sample, missing_reference = m.check_profile(profile, sample, self.add_missing, self.output)
+            return profile, sample, missing_TCGA, missing_reference
+        return self._stage("reconciled", compute)
+
+    def normalized(self):
+        '''
+        Returns the normalized profile and sample (normalize_profile).
+        '''
+        def compute():
+            profile, sample, _, _ = self.reconciled()
+            return m.normalize_profile(profile, self.method), m.normalize_profile(sample, self.method)
+        return self._stage("normalized", compute)
+
+    def distance(self):
+        '''
+        Returns the match score of the normalized profiles (compute_distance).
+        '''
+        return self._stage("distance", lambda: m.compute_distance(*self.normalized()))
+
+    def expression(self):
+        '''
+        Returns the gene ratios and the similiar genes of the normalized profiles
+        (expression_analysis).
+        '''
+        return self._stage("expression", lambda: m.expression_analysis(*self.normalized(), self.threshold))
+
+    def run(self):
+        '''
+        Evaluates every stage (reusing the memoized ones).
+
+        Returns:
+            results (dict): 'distance', 'gene_ratio', 'similiar_genes', 'missing_TCGA'
+                            and 'missing_reference'.
+        '''
+        _, _, missing_TCGA, missing_reference = self.reconciled()
+        distance = self.distance()
+        gene_ratio, similiar_genes = self.expression()
+        return {"distance": distance, "gene_ratio": gene_ratio, "similiar_genes": similiar_genes,
+                "missing_TCGA": missing_TCGA, "missing_reference": missing_reference}
+
+    def clear(self):
+        '''
+        Forgets all memoized stages.
+        '''
+        self._results.clear()
+
+    def _key(self, name):
+        # Input fingerprints and the parameters of this stage and of every stage before
+        # it.
+        key = []
+        if name != "sample":
+            key.append(fingerprint(self.reference))
+        if name != "reference":
+            key.append(fingerprint(self.sample))
+        for stage in STAGES[:STAGES.index(name) + 1]:
+            key.extend(getattr(self, parameter) for parameter in STAGE_PARAMETERS[stage])
+        return tuple(key)
+
+    def _stage(self, name, compute):
+        key = self._key(name)
+        if name in self._results and self._results[name][0] == key:
+            return self._results[name][1]
+        if self.on_stage is not None:
+            self.on_stage(name)
+        with instrumentation.stage(f"pipeline.{name}") as record:
+            value = compute()
+            record["rows_out"] = instrumentation.count_rows(value)
+        self._results[name] = (key, value)
+        self.computed.append(name)
+        return value
+
+    def __repr__(self):
+        return (f"MatchPipeline({self.reference!r}, {self.sample!r}, "
+                f"add_missing = {self.add_missing!r}, method = {self.method!r}, "
+                f"threshold = {self.threshold!r})")
+
+
+def fingerprint(data):
+    '''
+    Identifies the contents of an input: (real path, modification time, size) of a file,
+    or a hash of a dataframe.
+    '''
+    if isinstance(data, pd.DataFrame):
+        return ("frame", tuple(data.columns), len(data), int(pd.util.hash_pandas_object(data, index = False).sum()))
+    stat = os.stat(data)
+    return (os.path.realpath(data), stat.st_mtime_ns, stat.st_size)
+
+
+def _read(data, read):
+    # Dataframes are copied (so the caller's frame is not changed) with float levels
+    # like the files, files are read.
+    if isinstance(data, pd.DataFrame):
+        return data.astype({data.columns[1]: float})
+    return read(data)
@@ -0,0 +1,597 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code import cohort as c
+from TCGA_code import gene_dictionary
+from TCGA_code import sparse
+
+
+# A long-running local match server: the cohort is loaded once and stays in memory, so a
+# query costs the scoring and nothing else (no imports, no file reads, no gene index to
+# rebuild). HTTP/1.1 with JSON bodies over TCP (localhost) or a Unix socket; see
+# client.MatchClient for the client side.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Largest request body (a 60k gene profile as JSON takes about 2 MB).
+MAX_BODY_BYTES = 64 * 2**20
+
+# Normalizations the service can apply once to the resident matrix. Both keep zeros at
+# zero, so genes that are missing in a sample still count as zero levels. The linear
+# methods (z-score, mean, min-max, cpm) do not change pearson scores and are left out.
+NORMALIZATIONS = ["raw", "log1p"]
+
+# Request coalescing of the server (see MatchServer): pearson queries that arrive within
+# BATCH_WINDOW seconds of the first one are scored together, up to MAX_BATCH queries per
+# matrix product.
+BATCH_WINDOW = 0.002
+MAX_BATCH = 64
+
+# Number of compared gene sets whose column sums the service keeps (see
+# MatchService._row_sums).
+ROW_SUMS_CACHE_SIZE = 16
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class MatchService:
+    '''
+    Scores reference profiles against a cohort that is kept warm in memory.
+
+    The matrix (and the ranks of a cohort store) are read into memory instead of being
+    memory-mapped, and everything a query reuses is computed when the service starts:
+    the sample statistics (the column sums of the pearson scores), the gene id lookup of
+    encoded profiles (see Cohort.gene_rows) and, with spearman, the rank sums. A query
+    is then an integer gather and one row of a matrix product (see score_many).
+
+    A profile that does not cover every cohort gene is compared on the shared genes
+    only. match_cohort copies those rows of the cohort for every query; the service
+    instead multiplies the whole resident matrix with a profile vector that is zero
+    outside the shared genes, and derives the column sums of the shared genes from the
+    cohort totals minus the (few) left-out rows. The sums of the last
+    ROW_SUMS_CACHE_SIZE gene sets are kept, since the profiles of one platform share
+    their genes.
+
+    Queried profiles are encoded without interning their symbols in
+    gene_dictionary.GENES, so a long-running service does not grow with every new gene
+    symbol a client sends; genes that are not in the cohort are simply not compared.
+
+    Attributes:
+        cohort (Cohort): The resident, normalized cohort.
+        normalization (string): Normalization of the cohort and of every queried profile
+                                (see NORMALIZATIONS).
+        file_root (string): Directory of the profile files that /score requests may name
+                            (None: no file requests).
+    '''
+
+    def __init__(self, cohort, normalization = "raw", spearman = False, file_root = None):
+        '''
+        Parameters:
+            cohort (Cohort): The cohort to serve (a memory-mapped cohort store is read
+                             into memory).
+            normalization (string): "raw" or "log1p", applied once to the cohort and to
+                                    every profile.
+            spearman (boolean): Also warm up the sample ranks, so that the first
+                                spearman query is fast.
+            file_root (string): A "file" request field is read by the service, so any
+                                client could make it read any file it can access. Only
+                                files inside this directory are read; without a
+                                file_root, requests have to send the profile itself.
+        '''
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Not a valid service normalization: {normalization}")
+        self.normalization = normalization
+        self.file_root = None if file_root is None else os.path.realpath(file_root)
+        self.cohort = _resident(cohort, normalization)
+        self.started = time.time()
+        self.n_queries = 0
+        self._row_sums_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cohort.sample_stats()
+        self.cohort.gene_rows(np.empty(0, dtype = np.int64))
+        if spearman:
+            self.cohort.rank_sums()
+
+    def score(self, profile, k = None, add_missing = False, method = "pearson", panel = None):
+        '''
+        Score a reference profile against every cohort sample (see cohort.match_cohort).
+
+        Parameters:
+            profile (pd.DataFrame or tuple): Reference Profile dataset ('symbol',
+                                             'value') or encoded profile. It is
+                                             normalized like the cohort.
+            k (int): Only return the k best matches (default: all samples).
+            add_missing, method, panel: see match_cohort.
+
+        Returns:
+            ranking (pd.DataFrame): Sample metadata, 'score' and 'rank', best match
+                                    first.
+        '''
+        if method == "pearson" and panel is None:
+            return self.score_many([profile], k, add_missing)[0]
+        ranking = c.match_cohort(self._encode(profile), self.cohort, add_missing, method, panel)
+        self._count(1)
+        return ranking if k is None else ranking.head(k)
+
+    def score_many(self, profiles, k = None, add_missing = False):
+        '''
+        Pearson scores of several reference profiles with one matrix-matrix product: the
+        cohort matrix is read once for all of them instead of once per profile.
+
+        Returns:
+            rankings (list of pd.DataFrames): The ranking of every profile (see score).
+        '''
+        scores = self.batch_scores([self.align(profile, add_missing) for profile in profiles])
+        self._count(len(profiles))
+        rankings = [c.rank_samples(self.cohort.samples, profile_scores) for profile_scores in scores]
+        return rankings if k is None else [ranking.head(k) for ranking in rankings]
+
+    def align(self, profile, add_missing = False):
+        '''
+        The part of the pearson score of a profile that does not depend on the other
+        profiles of a batch.
+
+        Returns:
+            centered (np.ndarray): Centered profile levels on all cohort rows (zero on
+                                   the rows that are not compared), in the dtype of the
+                                   cohort matrix.
+            x_ss (float): Centered sum of squares of the profile.
+            y_ss (np.ndarray): Centered sum of squares of every sample over the compared
+                               genes.
+        '''
+        rows, x, n, x_sum, x_sq_sum = c._align_profile(self._encode(profile), self.cohort, add_missing)
+        if rows is None:
+            centered = x - x_sum / n
+            y_sum, y_sq_sum = self.cohort.column_sums()
+        else:
+            centered = np.zeros(self.cohort.n_genes)
+            centered[rows] = x - x_sum / n
+            y_sum, y_sq_sum = self._row_sums(rows)
+        centered = centered.astype(np.float32 if self.cohort.matrix.dtype == np.float32 else np.float64, copy = False)
+        return centered, x_sq_sum - x_sum * x_sum / n, y_sq_sum - y_sum * y_sum / n
+
+    def batch_scores(self, aligned):
+        '''
+        Pearson scores of aligned profiles (see align) against all samples: profiles x
+        samples matrix.
+        '''
+        matrix = self.cohort.matrix
+        centered = np.stack([profile[0] for profile in aligned])
+        if sparse.issparse(matrix):
+            cross = np.asarray((matrix.T @ centered.T).T, dtype = np.float64)
+        else:
+            cross = np.asarray(centered @ matrix, dtype = np.float64)
+        x_ss = np.array([profile[1] for profile in aligned])[:, np.newaxis]
+        y_ss = np.stack([profile[2] for profile in aligned])
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.clip(cross / np.sqrt(x_ss * y_ss), -1, 1)
+
+    def handle(self, request):
+        '''
+        Answer a decoded /score request (see _request_profile for the profile fields).
+        Returns the JSON response body.
+        '''
+        _check_request(request)
+        started = time.perf_counter()
+        ranking = self.score(_request_profile(request, self.file_root), request.get("k"), request.get("add_missing", False),
+                             request.get("method", "pearson"), request.get("panel"))
+        return _score_response(ranking, self.cohort.n_samples, time.perf_counter() - started)
+
+    def align_request(self, request):
+        '''
+        Check the options of a /score request that can be batched (see batchable), then
+        read and align its profile. An invalid request fails here, before it joins a
+        batch.
+        '''
+        _check_request(request)
+        return self.align(_request_profile(request, self.file_root), request.get("add_missing", False))
+
+    def handle_batch(self, requests, aligned):
+        '''
+        Answer several aligned /score requests with one matrix product (see score_many).
+        Returns the JSON response bodies, in the order of the requests; a request whose
+        response fails gets its exception instead, so it does not fail the others.
+        '''
+        started = time.perf_counter()
+        scores = self.batch_scores(aligned)
+        self._count(len(requests))
+        bodies = []
+        for request, profile_scores in zip(requests, scores):
+            try:
+                ranking = c.rank_samples(self.cohort.samples, profile_scores)
+                ranking = ranking if request.get("k") is None else ranking.head(request["k"])
+                bodies.append(_score_response(ranking, self.cohort.n_samples, time.perf_counter() - started, len(requests)))
+            except Exception as error:
+                bodies.append(error)
+        return bodies
+
+    @staticmethod
+    def batchable(request):
+        '''
+        Whether a /score request can share a matrix product with other requests (pearson
+        scores without a panel).
+        '''
+        return isinstance(request, dict) and request.get("method", "pearson") == "pearson" and request.get("panel") is None
+
+    def _encode(self, profile):
+        # The encoded profile, normalized like the cohort.
+        if not gene_dictionary.is_encoded(profile):
+            profile = gene_dictionary.encode_profile(profile, add = False)
+        ids, values = profile
+        if self.normalization != "raw":
+            values = m.normalize_levels(values, self.normalization)
+        return ids, values
+
+    def _count(self, n_queries):
+        with self._lock:
+            self.n_queries += n_queries
+
+    def _row_sums(self, rows):
+        # Sum and sum of squares of every sample column over some cohort rows (sorted,
+        # unique), cached per row set.
+        key = hashlib.blake2b(rows.tobytes(), digest_size = 16).digest()
+        with self._lock:
+            if key in self._row_sums_cache:
+                self._row_sums_cache.move_to_end(key)
+                return self._row_sums_cache[key]
+        if len(rows) > self.cohort.n_genes // 2:
+            left_out = np.setdiff1d(np.arange(self.cohort.n_genes), rows, assume_unique = True)
+            y_sum, y_sq_sum = self.cohort.column_sums()
+            left_out_sum, left_out_sq_sum = c._column_sums(self.cohort.matrix[left_out])
+            sums = (y_sum - left_out_sum, np.maximum(y_sq_sum - left_out_sq_sum, 0))
+        else:
+            sums = c._column_sums(self.cohort.matrix[rows])
+        with self._lock:
+            self._row_sums_cache[key] = sums
+            while len(self._row_sums_cache) > ROW_SUMS_CACHE_SIZE:
+                self._row_sums_cache.popitem(last = False)
+        return sums
+
+    def info(self):
+        '''
+        Description of the served cohort (the /health response).
+        '''
+        return {"status": "ok", "n_genes": self.cohort.n_genes, "n_samples": self.cohort.n_samples,
+                "normalization": self.normalization, "nbytes": self.cohort.nbytes,
+                "uptime": time.time() - self.started, "n_queries": self.n_queries}
+
+    def __repr__(self):
+        return f"MatchService({self.cohort}, normalization = {self.normalization!r})"
+
+
+class MatchServer:
+    '''
+    asyncio HTTP server of a MatchService.
+
+        GET  /health   the cohort and the service state (see MatchService.info)
+        POST /score    {"profile": {"symbol": [...], "value": [...]}} or
+                       {"file": "reference.csv"} (a file inside the file_root of the
+                       service), and optionally "k", "add_missing", "method" and
+                       "panel" (a list of gene symbols). Answers {"n_samples",
+                       "seconds", "batch_size", "ranking": [{sample metadata, "score",
+                       "rank"}, ...]}.
+
+    Invalid requests get a 400 response with {"error": message}, other failures a 500
+    response. Connections are kept alive. Scoring runs in a thread pool, so the event
+    loop keeps accepting requests while numpy works.
+
+    Request coalescing: a pearson query without a panel is read and aligned on its own,
+    then waits up to batch_window seconds for other queries. The waiting queries are
+    stacked into one profiles x genes matrix and scored with a single matrix product
+    against the cohort (see MatchService.handle_batch), and every caller gets its own
+    ranking. Scoring one query streams the whole cohort matrix from memory; a batch of
+    64 streams it once, so under concurrent load the throughput grows almost with the
+    batch size. A lone query waits batch_window at most (2 ms by default);
+    batch_window = 0 turns coalescing off.
+
+    Attributes:
+        service (MatchService): The served cohort.
+        address (string): "http://host:port" or "unix://path" once the server is
+                          started.
+    '''
+
+    def __init__(self, service, host = DEFAULT_HOST, port = DEFAULT_PORT, socket_path = None, workers = 4,
+                 batch_window = BATCH_WINDOW, max_batch = MAX_BATCH):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.address = None
+        self._pending = []
+        self._flush_timer = None
+        self._scoring = False
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix = "match-service")
+        # Batches are scored one at a time (the matrix product uses all BLAS threads);
+        # the next batch fills meanwhile.
+        self._batch_executor = ThreadPoolExecutor(1, thread_name_prefix = "match-batch")
+        self._server = None
+        self._loop = None
+        self._thread = None
+        self._writers = set()
+
+    async def start(self):
+        '''
+        Start listening (port 0 picks a free port). Returns the server.
+        '''
+        if self.socket_path is not None:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._server = await asyncio.start_unix_server(self._connection, self.socket_path)
+            self.address = f"unix://{os.path.abspath(self.socket_path)}"
+        else:
+            self._server = await asyncio.start_server(self._connection, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            self.address = f"http://{self.host}:{self.port}"
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would keep wait_closed waiting.
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait = False)
+        self._batch_executor.shutdown(wait = False)
+        if self.socket_path is not None and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def score(self, request):
+        '''
+        Answer a decoded /score request off the event loop, in a batch with the other
+        queries of the batch window if it can be batched. Returns the JSON response
+        body.
+        '''
+        loop = asyncio.get_running_loop()
+        if self.batch_window <= 0 or not self.service.batchable(request):
+            return await loop.run_in_executor(self._executor, self.service.handle, request)
+        aligned = await loop.run_in_executor(self._executor, self.service.align_request, request)
+        future = loop.create_future()
+        self._pending.append((request, aligned, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        # Score the pending queries as one batch. While a batch is being scored, queries
+        # keep collecting and are flushed when it is done: under load the batches grow
+        # instead of queueing up one product per query.
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._scoring or not self._pending:
+            return
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        self._scoring = True
+        asyncio.get_running_loop().create_task(self._score_batch(batch))
+
+    async def _score_batch(self, batch):
+        requests, aligned, futures = zip(*batch)
+        try:
+            bodies = await asyncio.get_running_loop().run_in_executor(self._batch_executor, self.service.handle_batch, requests, aligned)
+        except Exception as error:
+            bodies = [error] * len(futures)
+        finally:
+            # Queries whose batch window ran out during the scoring (no timer left) or
+            # that fill a batch go next; the others keep waiting for their window.
+            self._scoring = False
+            if self._flush_timer is None or len(self._pending) >= self.max_batch:
+                self._flush()
+        for future, body in zip(futures, bodies):
+            if future.done():
+                continue
+            if isinstance(body, Exception):
+                future.set_exception(body)
+            else:
+                future.set_result(body)
+
+    async def _connection(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await _respond(writer, 400, {"error": "Malformed request."}, keep_alive = False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    error = f"Request bodies are limited to {MAX_BODY_BYTES} bytes."
+                    await _respond(writer, 413, {"error": error}, keep_alive = False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, payload = await self._dispatch(method, target.split("?", 1)[0], body)
+                await _respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        # (status, response payload) of one request.
+        if path == "/health":
+            return (200, self.service.info()) if method == "GET" else (405, {"error": "Use GET /health."})
+        if path != "/score":
+            return 404, {"error": f"Unknown path: {path}"}
+        if method != "POST":
+            return 405, {"error": "Use POST /score."}
+        try:
+            return 200, await self.score(json.loads(body))
+        except ValueError as error:
+            # Invalid requests raise ValueErrors (see _check_request and
+            # _request_profile), anything else is a bug.
+            return 400, {"error": f"{type(error).__name__}: {error}"}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+
+def serve(service, host = DEFAULT_HOST, port = DEFAULT_PORT, socket_path = None, workers = 4, output = True,
+          batch_window = BATCH_WINDOW, max_batch = MAX_BATCH):
+    '''
+    Run a match server until it is interrupted (Ctrl+C).
+
+    Parameters:
+        service (MatchService): The served cohort.
+        host, port (string, int): TCP address to listen on (only used without
+                                  socket_path).
+        socket_path (string): Listen on this Unix socket instead.
+        workers (int): Number of scoring threads.
+        output (boolean): Print the address once the server listens.
+        batch_window, max_batch (float, int): Request coalescing, see MatchServer.
+    '''
+    async def run():
+        server = await MatchServer(service, host, port, socket_path, workers, batch_window, max_batch).start()
+        if output:
+            print(f"Serving {service.cohort} on {server.address}", flush = True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def background(service, host = DEFAULT_HOST, port = 0, socket_path = None, workers = 4, batch_window = BATCH_WINDOW, max_batch = MAX_BATCH):
+    '''
+    Start a match server in a daemon thread with its own event loop, e.g. inside a
+    notebook (whose event loop is already running) or a test. Returns the running
+    MatchServer; stop it with stop_background(server).
+    '''
+    loop = asyncio.new_event_loop()
+    server = MatchServer(service, host, port, socket_path, workers, batch_window, max_batch)
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    server._thread = threading.Thread(target = run, name = "match-server", daemon = True)
+    server._loop = loop
+    server._thread.start()
+    started.wait()
+    return server
+
+
+def stop_background(server):
+    '''
+    Stop a server started by background.
+    '''
+    asyncio.run_coroutine_threadsafe(server.close(), server._loop).result()
+    server._loop.call_soon_threadsafe(server._loop.stop)
+    server._thread.join()
+    server._loop.close()
+
+
+def _resident(cohort, normalization):
+    # The cohort with its matrix and ranks in memory (memory-mapped store files are read
+    # once), normalized.
+    matrix = np.array(cohort.matrix, order = "F") if isinstance(cohort.matrix, np.memmap) else cohort.matrix
+    ranks = np.array(cohort._ranks, order = "F") if isinstance(cohort._ranks, np.memmap) else cohort._ranks
+    stats = cohort._stats
+    if normalization == "log1p":
+        # log1p keeps zeros and the order of the levels: a sparse matrix stays sparse
+        # and the ranks stay valid.
+        matrix = matrix.log1p().astype(sparse.LEVEL_DTYPE) if sparse.issparse(matrix) else np.log1p(matrix, dtype = np.float32 if matrix.dtype == np.float32 else np.float64)
+        stats = None
+    return c.Cohort(cohort.genes, matrix, cohort.samples, ranks, stats)
+
+
+def _request_profile(request, file_root = None):
+    # The profile of a /score request: "file" (a profile file inside file_root, read
+    # through the parse cache) or "profile" ({"symbol": [...], "value": [...]}). A
+    # profile the request cannot give raises a ValueError.
+    if "file" in request:
+        if file_root is None:
+            raise ValueError("This server does not read profile files, send the profile instead.")
+        if not isinstance(request["file"], str):
+            raise ValueError("file must be the path of a profile file.")
+        path = os.path.realpath(os.path.join(file_root, request["file"]))
+        if os.path.commonpath([path, file_root]) != file_root:
+            raise ValueError(f"This server only reads profile files inside {file_root}.")
+        try:
+            return m.read_expr_profile(path)
+        except (OSError, AssertionError, ValueError) as error:
+            raise ValueError(f"Cannot read the profile file {request['file']}: {error}") from error
+    profile = request.get("profile")
+    if not isinstance(profile, dict) or not isinstance(profile.get("symbol"), list) or not isinstance(profile.get("value"), list):
+        raise ValueError('A /score request needs a "file" or a "profile": '
+                         '{"symbol": [...], "value": [...]}.')
+    if len(profile["symbol"]) != len(profile["value"]):
+        raise ValueError("The profile needs one value per symbol.")
+    try:
+        values = np.asarray(profile["value"], dtype = np.float64)
+    except (TypeError, ValueError) as error:
+        raise ValueError("The profile values must be numbers.") from error
+    return pd.DataFrame({"symbol": pd.Series(profile["symbol"], dtype = object), "value": values})
+
+
+def _check_request(request):
+    # Raise a ValueError for a /score request with invalid options.
+    if not isinstance(request, dict):
+        raise ValueError("A /score request is a JSON object.")
+    k = request.get("k")
+    if k is not None and (not isinstance(k, int) or isinstance(k, bool) or k < 0):
+        raise ValueError(f"k must be a non-negative integer or null: {k!r}")
+    if request.get("method", "pearson") not in ("pearson", "spearman"):
+        raise ValueError(f"Not a valid correlation method: {request['method']!r}")
+    panel = request.get("panel")
+    if panel is not None and (not isinstance(panel, list) or not all(isinstance(gene, str) for gene in panel)):
+        raise ValueError("panel must be a list of gene symbols or null.")
+    if not isinstance(request.get("add_missing", False), bool):
+        raise ValueError(f"add_missing must be true or false: {request['add_missing']!r}")
+
+
+def _score_response(ranking, n_samples, seconds, batch_size = 1):
+    # JSON body of a ranking (pandas writes NaN scores as null).
+    return (f'{{"n_samples": {n_samples}, "seconds": {seconds:.6f}, '
+            f'"batch_size": {batch_size}, "ranking": '
+            + ranking.to_json(orient = "records") + "}").encode()
+
+
+async def _respond(writer, status, payload, keep_alive = True):
+    # payload: a JSON serializable object or an encoded JSON body.
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
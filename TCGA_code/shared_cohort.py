@@ -0,0 +1,125 @@
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from TCGA_code import cohort as c
+from TCGA_code import sparse
+
+
+class SharedCohort:
+    '''
+    A copy of a cohort in named shared memory blocks (multiprocessing.shared_memory), so
+    that any number of worker processes can score it without receiving their own pickled
+    copy of the matrix.
+
+    The matrix, the gene index and the sample ranks (if they were computed) are copied
+    once. Workers get the small handle (block names, shapes and dtypes) and attach to
+    the blocks by name (see attach_cohort): the memory is mapped, not copied, so 32
+    workers cost no more cohort memory than one. Sparse matrices share their three CSC
+    arrays. The sample table stays in the creating process.
+
+    A cohort store does not need this: workers memory-map the store files, which the
+    page cache already shares.
+
+    Use it as a context manager; the blocks are freed when it exits (or by close).
+
+    Attributes:
+        handle (dict): What worker processes need to attach (see attach_cohort).
+    '''
+
+    def __init__(self, cohort):
+        self._segments = []
+        self.handle = {"shape": cohort.matrix.shape, "arrays": {}}
+        try:
+            if sparse.issparse(cohort.matrix):
+                matrix = cohort.matrix.tocsc()
+                for name in ("data", "indices", "indptr"):
+                    self._share(name, getattr(matrix, name))
+                self.handle["sparse"] = True
+            else:
+                self._share("matrix", np.asarray(cohort.matrix))
+                self.handle["sparse"] = False
+            self._share("genes", cohort.genes.to_numpy().astype(str))
+            if cohort._ranks is not None:
+                self._share("ranks", cohort._ranks)
+        except BaseException:
+            self.close()
+            raise
+
+    def _share(self, name, array):
+        # Copy an array into a new shared memory block (column-major arrays stay
+        # column-major).
+        order = "F" if array.ndim == 2 and array.flags.f_contiguous and not array.flags.c_contiguous else "C"
+        segment = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+        self._segments.append(segment)
+        np.ndarray(array.shape, dtype = array.dtype, buffer = segment.buf, order = order)[...] = array
+        self.handle["arrays"][name] = (segment.name, array.shape, array.dtype.str, order)
+
+    @property
+    def nbytes(self):
+        '''
+        Size of the shared memory blocks, in bytes.
+        '''
+        return sum(segment.size for segment in self._segments)
+
+    def close(self):
+        '''
+        Free the shared memory blocks. Workers that are still attached keep their
+        mapping until they exit.
+        '''
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        genes, samples = self.handle["shape"]
+        return f"SharedCohort({genes} genes x {samples} samples, {self.nbytes} bytes)"
+
+
+def attach_cohort(handle):
+    '''
+    Attach to a shared cohort by the handle of a SharedCohort (in a worker process).
+
+    Returns:
+        cohort (Cohort): The cohort, its arrays are views of the shared memory (nothing
+                         is copied). Sample names are placeholders, the sample table
+                         stays in the creating process.
+        segments (list): The attached shared memory blocks. They must be kept as long as
+                         the cohort is used.
+    '''
+    segments = []
+    arrays = {}
+    for name, (segment_name, shape, dtype, order) in handle["arrays"].items():
+        segment = _attach_segment(segment_name)
+        segments.append(segment)
+        arrays[name] = np.ndarray(shape, dtype = np.dtype(dtype), buffer = segment.buf, order = order)
+
+    if handle["sparse"]:
+        matrix = scipy.sparse.csc_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape = handle["shape"], copy = False)
+    else:
+        matrix = arrays["matrix"]
+    cohort = c.Cohort(pd.Index(arrays["genes"]), matrix, ranks = arrays.get("ranks"))
+    return cohort, segments
+
+
+def _attach_segment(name):
+    # The creating process owns (and unlinks) the block. Before python 3.13, attaching
+    # also registers it with the resource tracker (shared with the creating process),
+    # which then reports it as leaked or unlinks it early.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name = name, track = False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name = name)
+    finally:
+        resource_tracker.register = register
@@ -0,0 +1,230 @@
+import numpy as np
+from TCGA_code import cohort as c
+from TCGA_code import instrumentation
+from TCGA_code import sparse
+
+
+# Normal quantile of the 95% confidence intervals of the permutation p-values.
+Z_95 = 1.959963984540054
+
+# Null scores within this distance of the observed score count as exceedances (float32
+# products round).
+TIE_TOLERANCE = 1e-6
+
+
+@instrumentation.instrumented
+def permutation_test(profile, cohort_matrix, n_permutations = 1000, batch_size = 100, seed = None, add_missing = False,
+                     alternative = "greater", alpha = 0.05, tolerance = 0.1, block_size = 1024):
+    '''
+    Empirical significance of the pearson match scores of a reference profile against
+    every sample of a cohort.
+
+    The gene labels of the reference are permuted: the scores of the permuted profiles
+    against all samples are the null distribution of every sample. The permutations of a
+    batch are stacked into a batch x genes matrix, so a batch is one matrix product with
+    the cohort instead of a loop of correlations.
+
+    Sequential stopping: a sample gets no more permutations once the 95% confidence
+    interval of its p-value lies above alpha (clearly not significant) or is narrower
+    than tolerance times the p-value. Most samples stop after a batch or two; only
+    candidate matches run all n_permutations.
+
+    Parameters:
+        profile (pd.DataFrame or tuple): Reference Profile dataset ('symbol', 'value')
+                                         or encoded profile.
+        cohort_matrix (Cohort or pd.DataFrame): The TCGA samples (see match_cohort).
+        n_permutations (int): Maximum number of permutations per sample.
+        batch_size (int): Number of permutations scored at once.
+        seed (int): Seed of the random number generator (the results are reproducible
+                    for a given seed).
+        add_missing (boolean): Gene handling of the scores, see match_cohort.
+        alternative (string): "greater" (a null score at least as high as the observed
+                              one is an exceedance) or "two-sided" (at least as high in
+                              absolute value).
+        alpha (float): Significance level of the stopping rule.
+        tolerance (float): Relative half width of the p-value confidence interval at
+                           which a sample stops.
+        block_size (int): Number of samples scored at once.
+
+    Returns:
+        ranking (pd.DataFrame): One row per sample, sorted from best to worst match (see
+                                match_cohort), with the columns
+                                'p_value' ((exceedances + 1) / (permutations + 1)),
+                                'q_value' (Benjamini-Hochberg FDR over all samples),
+                                'null_mean', 'null_std',
+                                'adjusted_score' ((score - null_mean) / null_std) and
+                                'n_permutations'.
+    '''
+    assert alternative in ("greater", "two-sided"), "The alternative must be 'greater' or 'two-sided'."
+    cohort = c._as_cohort(cohort_matrix)
+    rng = np.random.default_rng(seed)
+    x, matrix, y_ss = _null_setup(profile, cohort, add_missing)
+    n_rows, n_samples = matrix.shape
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        scale = 1 / np.sqrt((x @ x) * y_ss)
+    observed = np.clip(_products(x[np.newaxis, :n_rows], matrix).ravel() * scale, -1, 1)
+    observed_level = np.abs(observed) if alternative == "two-sided" else observed
+
+    exceedances = np.zeros(n_samples)
+    counts = np.zeros(n_samples, dtype = np.int64)
+    null_sum = np.zeros(n_samples)
+    null_sq_sum = np.zeros(n_samples)
+    active = ~np.isnan(observed)
+    done = 0
+    while done < n_permutations and active.any():
+        batch = min(batch_size, n_permutations - done)
+        permuted = rng.permuted(np.tile(x, (batch, 1)), axis = 1)[:, :n_rows]
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            columns = np.flatnonzero(active[start:stop]) + start
+            if len(columns) == 0:
+                continue
+            block = matrix[:, start:stop] if len(columns) > (stop - start) // 2 else matrix[:, columns]
+            null = _products(permuted, block)
+            if null.shape[1] != len(columns):
+                null = null[:, columns - start]
+            null = null * scale[columns]
+            level = np.abs(null) if alternative == "two-sided" else null
+            exceedances[columns] += (level >= observed_level[columns] - TIE_TOLERANCE).sum(axis = 0)
+            null_sum[columns] += null.sum(axis = 0)
+            null_sq_sum[columns] += (null * null).sum(axis = 0)
+            counts[columns] += batch
+        done += batch
+
+        # Samples whose p-value is settled get no more permutations.
+        p_value = (exceedances + 1) / (counts + 1)
+        half_width = Z_95 * np.sqrt(p_value * (1 - p_value) / np.maximum(counts, 1))
+        active &= ~((p_value - half_width > alpha) | (half_width <= tolerance * p_value))
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        p_value = np.where(counts > 0, (exceedances + 1) / (counts + 1), np.nan)
+        null_mean = null_sum / counts
+        null_std = np.sqrt(np.maximum(null_sq_sum / counts - null_mean * null_mean, 0))
+        adjusted = (observed - null_mean) / null_std
+
+    ranking = c.rank_samples(cohort.samples.assign(p_value = p_value, q_value = fdr(p_value), null_mean = null_mean,
+                                                   null_std = null_std, adjusted_score = adjusted, n_permutations = counts), observed)
+    return ranking[list(cohort.samples.columns) + ["score", "rank", "p_value", "q_value", "null_mean", "null_std", "adjusted_score", "n_permutations"]]
+
+
+@instrumentation.instrumented
+def bootstrap_scores(profile, cohort_matrix, n_resamples = 1000, batch_size = 100, seed = None, add_missing = False,
+                     confidence = 0.95, tolerance = 0.005, block_size = 1024):
+    '''
+    Bootstrap confidence intervals of the pearson match scores of a reference profile
+    against every cohort sample.
+
+    Every resample draws the compared genes with replacement (the same genes for the
+    profile and the sample). A batch of resamples is a batch x genes matrix of gene
+    counts, and the weighted sums of all samples are matrix products with the cohort.
+
+    Stops early (after at least two batches) once no confidence interval bound moved by
+    more than tolerance in the last batch.
+
+    Parameters:
+        profile, cohort_matrix, add_missing, batch_size, seed, block_size: see
+            permutation_test.
+        n_resamples (int): Maximum number of bootstrap resamples.
+        confidence (float): Level of the percentile confidence intervals.
+        tolerance (float): Largest change of a confidence interval bound between two
+                           batches at which resampling stops.
+
+    Returns:
+        ranking (pd.DataFrame): One row per sample, sorted from best to worst match (see
+                                match_cohort), with the columns 'std_error', 'ci_low',
+                                'ci_high' and 'n_resamples'.
+    '''
+    cohort = c._as_cohort(cohort_matrix)
+    rng = np.random.default_rng(seed)
+    x, matrix, y_ss = _null_setup(profile, cohort, add_missing)
+    n = len(x)
+    n_rows, n_samples = matrix.shape
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        observed = np.clip(_products(x[np.newaxis, :n_rows], matrix).ravel() / np.sqrt((x @ x) * y_ss), -1, 1)
+
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    resampled = np.empty((n_resamples, n_samples), dtype = np.float32)
+    bounds = None
+    done = 0
+    while done < n_resamples:
+        batch = min(batch_size, n_resamples - done)
+        # Gene counts of every resample: n draws with replacement.
+        draws = rng.integers(0, n, (batch, n)) + n * np.arange(batch)[:, np.newaxis]
+        weights = np.bincount(draws.ravel(), minlength = batch * n).reshape(batch, n).astype(np.float64)
+        x_sum = weights @ x
+        x_ss = n * (weights @ (x * x)) - x_sum * x_sum
+        sample_weights = weights[:, :n_rows]
+        weighted_x = sample_weights * x[:n_rows]
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            block = sparse.dense(matrix[:, start:stop]).astype(np.float64)
+            y_sum = sample_weights @ block
+            y_ss_block = n * (sample_weights @ (block * block)) - y_sum * y_sum
+            cross = n * (weighted_x @ block) - x_sum[:, np.newaxis] * y_sum
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                resampled[done:done + batch, start:stop] = np.clip(cross / np.sqrt(x_ss[:, np.newaxis] * y_ss_block), -1, 1)
+        done += batch
+
+        previous = bounds
+        bounds = _nanquantile(resampled[:done], quantiles)
+        if previous is not None and np.nan_to_num(np.abs(bounds - previous)).max() <= tolerance:
+            break
+
+    with np.errstate(invalid = "ignore"):
+        std_error = np.sqrt(np.maximum(np.nanvar(resampled[:done], axis = 0, ddof = 1), 0)) if done > 1 else np.full(n_samples, np.nan)
+    ranking = c.rank_samples(cohort.samples.assign(std_error = std_error, ci_low = bounds[0], ci_high = bounds[1], n_resamples = done), observed)
+    return ranking[list(cohort.samples.columns) + ["score", "rank", "std_error", "ci_low", "ci_high", "n_resamples"]]
+
+
+def fdr(p_values):
+    '''
+    Benjamini-Hochberg adjusted p-values (q-values) of a set of tests. Undefined (NaN)
+    p-values stay undefined and do not count as tests.
+    '''
+    p_values = np.asarray(p_values, dtype = np.float64)
+    q_values = np.full(p_values.shape, np.nan)
+    defined = ~np.isnan(p_values)
+    m = int(defined.sum())
+    if m == 0:
+        return q_values
+    order = np.argsort(p_values[defined])
+    adjusted = p_values[defined][order] * m / np.arange(1, m + 1)
+    adjusted = np.minimum(np.minimum.accumulate(adjusted[::-1])[::-1], 1)
+    defined_q = np.empty(m)
+    defined_q[order] = adjusted
+    q_values[defined] = defined_q
+    return q_values
+
+
+def _null_setup(profile, cohort, add_missing):
+    # The compared profile vector, centered (the genes of the compared cohort rows
+    # first, then the reference genes that are missing in the cohort, which are zero in
+    # every sample), the compared cohort rows and the centered sums of squares of the
+    # samples.
+    aligned = c._align_profile(profile, cohort, add_missing)
+    rows, x, n = aligned[:3]
+    extra = np.empty(0)
+    if rows is None and len(x) < n:
+        profile_rows, levels = c._profile_rows(profile, cohort)
+        extra = levels[profile_rows < 0]
+    x = np.concatenate([x, extra])
+    matrix = cohort.matrix if rows is None else cohort.matrix[rows]
+    y_sum, y_sq_sum = cohort.column_sums() if rows is None else c._column_sums(matrix)
+    return x - x.mean(), matrix, np.maximum(y_sq_sum - y_sum * y_sum / n, 0)
+
+
+def _products(x, matrix):
+    # x (batch x rows) times a genes x samples block. Dense float32 blocks are
+    # multiplied in float32 (BLAS).
+    if sparse.issparse(matrix):
+        return np.asarray((matrix.T @ x.T).T)
+    return x.astype(np.float32 if matrix.dtype == np.float32 else np.float64) @ matrix
+
+
+def _nanquantile(values, quantiles):
+    # Quantiles of every column, NaN for columns without any defined value.
+    with np.errstate(invalid = "ignore"):
+        defined = ~np.isnan(values).all(axis = 0)
+        bounds = np.full((len(quantiles), values.shape[1]), np.nan)
+        bounds[:, defined] = np.nanquantile(values[:, defined], quantiles, axis = 0)
+    return bounds
@@ -0,0 +1,67 @@
+import numpy as np
+import scipy.sparse
+
+
+# Most genes of a TCGA count sample are zero. A cohort matrix can be kept as a scipy CSC
+# matrix (one compressed column per sample) with uint32 counts (float32 for other
+# levels): only the non-zero levels are stored, and matrix-vector products skip the
+# zeros.
+COUNT_DTYPE = np.uint32
+LEVEL_DTYPE = np.float32
+
+
+def issparse(matrix):
+    return scipy.sparse.issparse(matrix)
+
+
+def dense(matrix):
+    '''
+    A dense numpy array of a (sparse or dense) matrix or block.
+    '''
+    if issparse(matrix):
+        return matrix.toarray()
+    return np.asarray(matrix)
+
+
+def to_sparse(matrix, dtype = None, block_size = 1024):
+    '''
+    Compress a genes x samples matrix into a CSC matrix, block_size columns at a time.
+
+    Parameters:
+        matrix (np.ndarray): Dense (or memory-mapped) genes x samples matrix.
+        dtype (np.dtype): dtype of the stored levels. Defaults to uint32 if all levels
+                          are non-negative integers that fit, float32 otherwise.
+
+    Returns:
+        matrix (scipy.sparse.csc_matrix): The compressed matrix.
+    '''
+    if issparse(matrix):
+        return scipy.sparse.csc_matrix(matrix, dtype = dtype or matrix.dtype)
+    if dtype is None:
+        dtype = COUNT_DTYPE if _are_counts(matrix, block_size) else LEVEL_DTYPE
+    blocks = []
+    for start in range(0, matrix.shape[1], block_size):
+        stop = min(start + block_size, matrix.shape[1])
+        blocks.append(scipy.sparse.csc_matrix(np.asarray(matrix[:, start:stop]).astype(dtype)))
+    if len(blocks) == 0:
+        return scipy.sparse.csc_matrix(matrix.shape, dtype = dtype)
+    return scipy.sparse.hstack(blocks, format = "csc")
+
+
+def nbytes(matrix):
+    '''
+    Memory used by the levels of a (sparse or dense) matrix, in bytes.
+    '''
+    if issparse(matrix):
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return np.asarray(matrix).nbytes
+
+
+def _are_counts(matrix, block_size):
+    # True if all levels are non-negative integers that fit into COUNT_DTYPE.
+    limit = np.iinfo(COUNT_DTYPE).max
+    for start in range(0, matrix.shape[1], block_size):
+        block = np.asarray(matrix[:, start:start + block_size])
+        if block.size > 0 and (block.min() < 0 or block.max() > limit or not np.array_equal(block, np.floor(block))):
+            return False
+    return True
@@ -0,0 +1,182 @@
+import glob
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from TCGA_code import match_computation as m
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store
+from TCGA_code import instrumentation
+
+
+def iter_sample_blocks(source, block_size = 256):
+    '''
+    Read a cohort in blocks of sample columns, without ever holding more than one block
+    in memory.
+
+    Parameters:
+        source (string or list of strings): A cohort store directory, or TCGA sample
+                                            files / directories / glob patterns. Sample
+                                            files are read twice: once for the gene
+                                            symbols only (the shared gene index, see
+                                            ingest_cohort_store), then block by block.
+        block_size (int): Number of samples per block.
+
+    Yields:
+        cohort (Cohort): The next block of samples (gene index of the whole cohort,
+                         block_size samples at most).
+    '''
+    sources = [source] if isinstance(source, (str, Path)) else list(source)
+    if len(sources) == 1 and (Path(sources[0]) / "store.json").exists():
+        yield from _store_blocks(Path(sources[0]), block_size)
+        return
+
+    file_names = []
+    for pattern in sources:
+        file_names.extend(sorted(glob.glob(str(pattern), recursive = True)) if glob.has_magic(str(pattern)) else [pattern])
+    file_names = cohort_store.find_sample_files(file_names)
+
+    genes = pd.Index([], dtype = object)
+    for file_name in file_names:
+        genes = genes.union(cohort_store._read_symbols(file_name))
+    genes = genes.sort_values()
+
+    for start in range(0, len(file_names), block_size):
+        block = file_names[start:start + block_size]
+        matrix = np.zeros((len(genes), len(block)), dtype = cohort_store.STORE_DTYPE, order = "F")
+        for i, file_name in enumerate(block):
+            levels = m._gene_levels(m.read_TCGA_sample(file_name))
+            matrix[:, i] = levels.reindex(genes, fill_value = 0).to_numpy(dtype = cohort_store.STORE_DTYPE)
+        samples = pd.DataFrame({"sample": [Path(file_name).stem for file_name in block], "file": [str(file_name) for file_name in block]})
+        yield c.Cohort(genes, matrix, samples)
+
+
+@instrumentation.instrumented
+def stream_match(profile, source, k = 10, add_missing = False, block_size = 256, output = False):
+    '''
+    Score a reference profile against a cohort that does not fit in memory: the samples
+    are read in blocks (see iter_sample_blocks), every block is scored and released.
+    Only the k best matches and summary statistics of all scores are kept, so peak
+    memory depends on the block size and not on the number of samples.
+
+    The scores are the same as the ones of match_cohort on the whole cohort.
+
+    Parameters:
+        profile (pd.DataFrame or tuple): Reference Profile dataset ('symbol', 'value')
+                                         or encoded profile.
+        source (string or list of strings): Cohort store directory or TCGA sample files
+                                            (see iter_sample_blocks).
+        k (int): Number of best matches to keep.
+        add_missing (boolean): Gene handling of the scores, see match_cohort.
+        block_size (int): Number of samples per block.
+        output (boolean): Prints the progress.
+
+    Returns:
+        ranking (pd.DataFrame): The k best samples, sorted from best to worst match
+                                ('score' and 'rank' columns).
+        summary (dict): 'n_samples', 'n_undefined' (constant samples), 'mean', 'std',
+                        'min' and 'max' of the scores.
+    '''
+    top = TopK(k)
+    summary = RunningSummary()
+    aligned = None
+    for i, block in enumerate(iter_sample_blocks(source, block_size)):
+        if aligned is None:
+            # All blocks share the gene index of the cohort, so the profile is aligned
+            # once.
+            aligned = c._align_profile(profile, block, add_missing)
+        scores = c._score_columns(aligned, block.matrix)
+        top.update(block.samples, scores)
+        summary.update(scores)
+        if output:
+            print(f"[block {i + 1}] {summary.n_samples} samples scored")
+    return top.ranking(), summary.result()
+
+
+class TopK:
+    '''
+    The k highest scores seen so far, with the rows of their sample tables.
+    '''
+
+    def __init__(self, k):
+        assert k > 0, "k must be at least 1."
+        self.k = k
+        self._samples = None
+        self._scores = np.empty(0)
+
+    def update(self, samples, scores):
+        '''
+        Add the scores of a block of samples (one score per row of the sample table).
+        '''
+        samples = pd.concat([self._samples, samples], ignore_index = True) if self._samples is not None else samples.reset_index(drop = True)
+        scores = np.concatenate([self._scores, scores])
+        if len(scores) > self.k:
+            best = np.argpartition(-np.where(np.isnan(scores), -np.inf, scores), self.k - 1)[:self.k]
+            samples = samples.iloc[best].reset_index(drop = True)
+            scores = scores[best]
+        self._samples = samples
+        self._scores = scores
+
+    def ranking(self):
+        '''
+        Returns the k best samples as a ranked table (see rank_samples).
+        '''
+        if self._samples is None:
+            return c.rank_samples(pd.DataFrame({"sample": []}), np.empty(0))
+        return c.rank_samples(self._samples, self._scores)
+
+
+class RunningSummary:
+    '''
+    Count, mean, standard deviation, minimum and maximum of scores that arrive in blocks
+    (Chan et al. updates). Undefined (NaN) scores are only counted.
+    '''
+
+    def __init__(self):
+        self.n_samples = 0
+        self.n_undefined = 0
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+
+    def update(self, scores):
+        scores = np.asarray(scores, dtype = np.float64)
+        self.n_samples += len(scores)
+        defined = scores[~np.isnan(scores)]
+        self.n_undefined += len(scores) - len(defined)
+        if len(defined) == 0:
+            return
+        n = self._n + len(defined)
+        delta = defined.mean() - self._mean
+        self._m2 += ((defined - defined.mean()) ** 2).sum() + delta * delta * self._n * len(defined) / n
+        self._mean += delta * len(defined) / n
+        self._n = n
+        self._min = min(self._min, defined.min())
+        self._max = max(self._max, defined.max())
+
+    def result(self):
+        if self._n == 0:
+            return {"n_samples": self.n_samples, "n_undefined": self.n_undefined, "mean": np.nan, "std": np.nan, "min": np.nan, "max": np.nan}
+        return {"n_samples": self.n_samples, "n_undefined": self.n_undefined, "mean": float(self._mean),
+                "std": float(np.sqrt(self._m2 / self._n)), "min": float(self._min), "max": float(self._max)}
+
+
+def _store_blocks(path, block_size):
+    # Blocks of a cohort store, read straight from the column-major matrix file (every
+    # block is one contiguous range of the file), so nothing outside the current block
+    # is mapped or cached by this process.
+    cohort_store._finish_update(path)
+    info = cohort_store._read_info(path)
+    genes = pd.Index(np.load(path / "genes.npy", allow_pickle = False))
+    samples = pd.read_csv(path / "samples.csv", dtype = {"sample": str})
+    n_genes, n_samples = info["n_genes"], info["n_samples"]
+    item_size = np.dtype(cohort_store.STORE_DTYPE).itemsize
+
+    with open(path / "matrix.f32", "rb") as f:
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            f.seek(start * n_genes * item_size)
+            values = np.fromfile(f, dtype = cohort_store.STORE_DTYPE, count = (stop - start) * n_genes)
+            yield c.Cohort(genes, values.reshape((n_genes, stop - start), order = "F"), samples.iloc[start:stop])
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+from TCGA_code import cohort as c
+
+
+# Synthetic expression data with the shape of GENCODE based TCGA files, for benchmarks
+# and tests: about 60k genes (a third protein coding symbols, the rest lncRNA /
+# pseudogene style names), a few percent duplicated symbols (Y_RNA, snoRNA, ... in
+# GENCODE) and zero-inflated, overdispersed counts.
+GENCODE_GENES = 60660
+DUPLICATE_SYMBOLS = ["Y_RNA", "U6", "SNORA70", "5S_rRNA", "7SK", "U3", "SNORD112", "Metazoa_SRP", "snoU13", "U8"]
+
+
+def gene_symbols(n_genes = GENCODE_GENES, duplicate_fraction = 0.02, seed = None):
+    '''
+    GENCODE like gene symbols: 'GENE<n>' (protein coding), 'LINC<n>' and 'RP11-<n>'
+    names, and duplicate_fraction of the symbols drawn from a few repeated small RNA
+    names. The unique symbols only depend on their number, so profiles and cohorts of
+    the same size share their genes whatever the seed.
+
+    Returns:
+        symbols (np.ndarray): n_genes symbols (object array), in random order.
+    '''
+    rng = np.random.default_rng(seed)
+    n_duplicates = int(n_genes * duplicate_fraction)
+    n_unique = n_genes - n_duplicates
+    kind = np.arange(n_unique) % 20
+    prefixes = np.where(kind < 7, "GENE", np.where(kind < 12, "LINC", "RP11-")).astype(object)
+    symbols = prefixes + np.arange(n_unique).astype(str).astype(object)
+    duplicates = np.array(DUPLICATE_SYMBOLS, dtype = object)[rng.integers(0, len(DUPLICATE_SYMBOLS), n_duplicates)]
+    symbols = np.concatenate([symbols, duplicates])
+    rng.shuffle(symbols)
+    return symbols
+
+
+def gene_means(n_genes, seed = None):
+    '''
+    Mean count of every gene: log-normal, so that a few genes dominate the library size
+    like in real samples.
+    '''
+    rng = np.random.default_rng(seed)
+    return rng.lognormal(mean = 2.0, sigma = 2.0, size = n_genes)
+
+
+def synthetic_counts(means, n_samples = 1, zero_fraction = 0.4, dispersion = 0.5, seed = None):
+    '''
+    Zero-inflated negative binomial counts around the gene means: genes x samples
+    float32 matrix.
+
+    Parameters:
+        means (np.ndarray): Mean count of every gene (see gene_means).
+        n_samples (int): Number of sample columns.
+        zero_fraction (float): Fraction of the levels that are set to zero on top of the
+                               sampled zeros.
+        dispersion (float): Negative binomial dispersion (variance = mean + dispersion *
+                            mean^2).
+        seed (int): Seed of the random number generator.
+    '''
+    rng = np.random.default_rng(seed)
+    means = np.asarray(means, dtype = np.float64)[:, np.newaxis]
+    counts = rng.negative_binomial(1 / dispersion, 1 / (1 + dispersion * means), size = (len(means), n_samples))
+    counts[rng.random(counts.shape) < zero_fraction] = 0
+    return counts.astype(np.float32)
+
+
+def synthetic_profile(n_genes = GENCODE_GENES, zero_fraction = 0.4, duplicate_fraction = 0.02, seed = None):
+    '''
+    A synthetic 'symbol', 'value' profile (as read_expr_profile / read_TCGA_sample
+    return before deduplication).
+    '''
+    rng = np.random.default_rng(seed)
+    symbols = gene_symbols(n_genes, duplicate_fraction, rng)
+    counts = synthetic_counts(gene_means(n_genes, rng), 1, zero_fraction, seed = rng)
+    return pd.DataFrame({"symbol": symbols, "value": counts[:, 0]})
+
+
+def synthetic_cohort(n_genes = GENCODE_GENES, n_samples = 100, zero_fraction = 0.4, seed = None):
+    '''
+    A synthetic cohort: unique sorted genes, zero-inflated counts that share their gene
+    means (so the samples correlate like samples of one tissue).
+    '''
+    rng = np.random.default_rng(seed)
+    genes = pd.Index(gene_symbols(n_genes, 0, rng)).sort_values()
+    matrix = np.asfortranarray(synthetic_counts(gene_means(n_genes, rng), n_samples, zero_fraction, seed = rng))
+    return c.Cohort(genes, matrix)
+
+
+def write_profile(profile, file_name):
+    '''
+    Write a profile in the 'symbol;value' .csv format of the input files.
+    '''
+    profile.to_csv(file_name, sep = ";", index = False)
@@ -59,3 +59,12 @@ def test_check_profile2():
 
 
 
+
+def test_check_profile_duplicates():
+
+    # Duplicated symbols are averaged when missing genes are added.
+    profile = pd.DataFrame([['gene1', 1.0], ['gene2', 4.0]], columns=["symbol", "value"])
+    sample_data = pd.DataFrame([['gene3', 5.0], ['gene1', 1.0], ['gene1', 3.0]], columns=["symbol", "value"])
+    new_ref_profile, new_sample, missing_genes = m.check_profile(profile, sample_data, add_missing = True, output = False)
+    assert missing_genes == ['gene2']
+    assert new_sample.values.tolist() == [['gene1', 2.0], ['gene2', 0.0], ['gene3', 5.0]]
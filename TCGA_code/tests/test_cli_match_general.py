@@ -0,0 +1,26 @@
+from TCGA_code import cli
+import pandas as pd
+
+def test_cli_match(tmp_path):
+
+    (tmp_path / "refs").mkdir()
+    (tmp_path / "refs" / "ref1.csv").write_text("symbol;value\ngene1;1\ngene2;5\ngene3;8\ngene9;4\n")
+    (tmp_path / "refs" / "ref2.csv").write_text("symbol;value\ngene1;8\ngene2;5\ngene3;1\n")
+    (tmp_path / "tcga").mkdir()
+    (tmp_path / "tcga" / "s1.csv").write_text("symbol;value\ngene1;1\ngene2;5\ngene3;8\ngene4;2\n")
+    (tmp_path / "tcga" / "s2.csv").write_text("symbol;value\ngene1;2\ngene2;4\ngene3;1\ngene4;3\n")
+
+    cli.main(["match", str(tmp_path / "refs" / "*.csv"), "--cohort", str(tmp_path / "tcga"), "-o", str(tmp_path / "out"),
+              "--workers", "1", "--block-size", "1", "--method", "raw", "--quiet"])
+
+    # N x M correlation matrix.
+    correlations = pd.read_csv(tmp_path / "out" / "correlations.csv", index_col = 0)
+    assert correlations.index.tolist() == ["ref1", "ref2"]
+    assert correlations.columns.tolist() == ["s1", "s2"]
+    assert round(correlations.loc["ref1", "s1"], 4) == 1.0
+
+    # Per reference: the missing genes and the similiar genes of every pair.
+    missing = pd.read_csv(tmp_path / "out" / "ref1" / "missing_genes.csv")
+    assert missing.values.tolist() == [["gene9", "TCGA"], ["gene4", "reference"]]
+    similiar = pd.read_csv(tmp_path / "out" / "ref1" / "similiar_genes.csv")
+    assert similiar[similiar["sample"] == "s1"]["symbol"].tolist() == ["gene1", "gene2", "gene3"]
@@ -0,0 +1,106 @@
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store as s
+import numpy as np
+import os
+import pandas as pd
+import pytest
+
+def test_cohort_store_roundtrip(tmp_path):
+
+    cohort_matrix = pd.DataFrame({"s1": [1, 5, 8, 3], "s2": [8, 5, 1, 0]}, index = ['gene1', 'gene2', 'gene3', 'gene4'])
+    cohort = c.Cohort.from_frame(cohort_matrix)
+
+    s.write_cohort_store(cohort, tmp_path / "store")
+    stored = s.open_cohort_store(tmp_path / "store")
+
+    # The matrix is memory-mapped and holds the same values.
+    assert isinstance(stored.matrix, np.memmap)
+    assert stored.genes.tolist() == cohort.genes.tolist()
+    assert stored.samples["sample"].tolist() == ["s1", "s2"]
+    assert np.array_equal(stored.matrix, cohort.matrix)
+
+def test_ingest_cohort_store(tmp_path):
+
+    # Two sample files with different (and duplicated) genes.
+    (tmp_path / "samples").mkdir()
+    (tmp_path / "samples" / "a.csv").write_text("symbol;value\ngene2;4\ngene1;1\ngene1;3\n")
+    (tmp_path / "samples" / "b.csv").write_text("symbol;value\ngene3;5\ngene1;7\n")
+
+    stored = s.ingest_cohort_store([tmp_path / "samples"], tmp_path / "store", output = False)
+
+    # Genes are the sorted union, duplicates are averaged and missing genes are zero.
+    assert stored.genes.tolist() == ['gene1', 'gene2', 'gene3']
+    assert stored.samples["sample"].tolist() == ["a", "b"]
+    assert stored.matrix[:, 0].tolist() == [2, 4, 0]
+    assert stored.matrix[:, 1].tolist() == [7, 0, 5]
+
+def test_update_cohort_store(tmp_path):
+
+    first = c.Cohort(['gene1', 'gene2'], np.array([[1, 2], [3, 4]]), pd.DataFrame({"sample": ["s1", "s2"], "file_id": ["a", "b"]}))
+    s.write_cohort_store(first, tmp_path / "store")
+
+    # 'b' is replaced, 'c' is appended and brings a new gene.
+    update = c.Cohort(['gene1', 'gene3'], np.array([[5, 7], [6, 8]]), pd.DataFrame({"sample": ["s2", "s3"], "file_id": ["b", "c"]}))
+    stored = s.update_cohort_store(update, tmp_path / "store")
+
+    assert stored.genes.tolist() == ['gene1', 'gene2', 'gene3']
+    assert stored.samples["file_id"].tolist() == ["a", "b", "c"]
+    assert stored.matrix.tolist() == [[1, 5, 7], [3, 0, 0], [0, 6, 8]]
+
+def test_update_after_interrupted_update(tmp_path):
+
+    first = c.Cohort(['gene1', 'gene2'], np.array([[1, 2], [3, 4]]), pd.DataFrame({"sample": ["s1", "s2"], "file_id": ["a", "b"]}))
+    s.write_cohort_store(first, tmp_path / "store")
+    # An interrupted update left a partial column behind the stored samples.
+    for name in ["matrix.f32", s.RANKS_FILE]:
+        with open(tmp_path / "store" / name, "ab") as f:
+            f.write(np.array([9], dtype = np.float32).tobytes())
+
+    update = c.Cohort(['gene1', 'gene2'], np.array([[5], [6]]), pd.DataFrame({"sample": ["s3"], "file_id": ["c"]}))
+    stored = s.update_cohort_store(update, tmp_path / "store")
+    assert stored.matrix.tolist() == [[1, 2, 5], [3, 4, 6]]
+    assert stored.ranks().tolist() == [[1, 1, 1], [2, 2, 2]]
+
+def test_interrupted_gene_update(tmp_path, monkeypatch):
+
+    first = c.Cohort(['gene1', 'gene3'], np.array([[1, 2], [3, 4]]), pd.DataFrame({"sample": ["s1", "s2"], "file_id": ["a", "b"]}))
+    update = c.Cohort(['gene2', 'gene3'], np.array([[5, 7], [6, 8]]), pd.DataFrame({"sample": ["s2", "s3"], "file_id": ["b", "c"]}))
+    expected = [[1, 0, 0], [0, 5, 7], [3, 6, 8]]
+    s.write_cohort_store(first, tmp_path / "store")
+
+    # Interrupted before the new index is complete: the store still opens as it was.
+    def interrupt(*args):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(s, "_write_index", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            s.update_cohort_store(update, tmp_path / "store")
+    assert (tmp_path / "store" / "matrix.f32.tmp").exists()
+    stored = s.open_cohort_store(tmp_path / "store")
+    assert stored.genes.tolist() == ['gene1', 'gene3'] and stored.matrix.tolist() == [[1, 2], [3, 4]]
+    del stored
+    assert s.update_cohort_store(update, tmp_path / "store").matrix.tolist() == expected
+
+    # Interrupted while the files are moved into place: the next open finishes the
+    # update.
+    s.write_cohort_store(first, tmp_path / "other")
+    with monkeypatch.context() as patch:
+        patch.setattr(s, "_finish_update", lambda path: None)
+        s.update_cohort_store(update, tmp_path / "other")
+    os.replace(tmp_path / "other" / "matrix.f32.tmp", tmp_path / "other" / "matrix.f32")
+    stored = s.open_cohort_store(tmp_path / "other")
+    assert stored.genes.tolist() == ['gene1', 'gene2', 'gene3'] and stored.matrix.tolist() == expected
+    assert stored.ranks().tolist() == [[2, 1, 1], [1, 2, 2], [3, 3, 3]]
+    assert not list((tmp_path / "other").glob("*.tmp"))
+
+def test_sparse_cohort_store(tmp_path):
+
+    cohort = c.Cohort(['gene1', 'gene2', 'gene3'], np.array([[0, 2], [3, 0], [0, 0]]), pd.DataFrame({"sample": ["s1", "s2"], "file_id": ["a", "b"]}))
+    s.write_cohort_store(cohort.to_sparse(), tmp_path / "store")
+    stored = s.open_cohort_store(tmp_path / "store")
+    assert stored.matrix.tolist() == [[0, 2], [3, 0], [0, 0]]
+
+    # Sparse updates replace and append densified columns.
+    update = c.Cohort(['gene1', 'gene2'], np.array([[5, 0], [0, 7]]), pd.DataFrame({"sample": ["s2", "s3"], "file_id": ["b", "c"]}))
+    stored = s.update_cohort_store(update.to_sparse(), tmp_path / "store")
+    assert stored.matrix.tolist() == [[0, 5, 0], [3, 0, 7], [0, 0, 0]]
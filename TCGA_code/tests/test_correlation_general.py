@@ -0,0 +1,44 @@
+from TCGA_code import correlation as c
+from scipy import stats
+import scipy.sparse
+import numpy as np
+
+def test_correlation_gen():
+
+    rng = np.random.default_rng(0)
+    x = rng.poisson(3, 100).astype(float)
+    y = rng.poisson(3, (100, 4)).astype(float)
+
+    # One score per sample column, the same as scipy for every single pair.
+    for method, expected in [("pearson", stats.pearsonr), ("spearman", stats.spearmanr), ("kendall", stats.kendalltau)]:
+        scores = c.correlate(x, y, method)
+        assert scores.shape == (4,)
+        assert np.allclose(scores, [expected(x, y[:, j])[0] for j in range(4)])
+
+    assert isinstance(c.pearson(x, y[:, 0]), float)
+    assert np.isclose(c.cosine(x, y[:, 0]), x @ y[:, 0] / np.linalg.norm(x) / np.linalg.norm(y[:, 0]))
+    assert c.pearson(y, y).shape == (4, 4)
+    assert np.isnan(c.pearson(np.ones(5), np.arange(5)))
+
+def test_running_pearson():
+
+    rng = np.random.default_rng(1)
+    x = rng.normal(1e6, 1, 1000)
+    y = x[:, np.newaxis] + rng.normal(0, 1, (1000, 3))
+
+    # Chunks of genes give the two-pass result, also for large means.
+    running = c.RunningPearson()
+    for start in range(0, 1000, 128):
+        running.update(x[start:start + 128], y[start:start + 128])
+    assert running.n == 1000
+    assert np.allclose(running.correlation(), c.pearson(x, y))
+
+def test_large_offset():
+
+    # Levels with a large offset and a small spread: the centered (two-pass) sums of
+    # squares keep the precision.
+    rng = np.random.default_rng(1)
+    x = rng.random(200)
+    y = 1e8 + rng.random((200, 3))
+    expected = [stats.pearsonr(x, column)[0] for column in y.T]
+    assert np.allclose(c.pearson(x, scipy.sparse.csc_matrix(y)), expected, atol = 1e-6)
@@ -0,0 +1,27 @@
+from TCGA_code import match_computation as m
+import numpy as np
+import pandas as pd
+
+def test_expression_analysis_gen():
+
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 0], ['gene4', 3]], columns=["symbol", "value"])
+    sample_data = pd.DataFrame([['gene1', 1], ['gene2', 10], ['gene3', 0], ['gene4', 0]], columns=["symbol", "value"])
+
+    gene_ratio, similiar = m.expression_analysis(profile, sample_data, sensitivity_threshold = 0.05)
+
+    # 0/0 gives a ratio of 0, x/0 an infinite ratio.
+    assert gene_ratio["symbol"].tolist() == ['gene1', 'gene2', 'gene3', 'gene4']
+    assert gene_ratio["ratio"].tolist() == [1, 0.5, 0, np.inf]
+    assert similiar == [0]
+
+def test_expression_ratios_batched():
+
+    profile_levels = np.array([1, 5, 0, 3])
+    sample_levels = np.array([[1, 2], [10, 5], [0, 1], [0, 3]])
+
+    # One column of ratios per TCGA sample.
+    ratio = m.expression_ratios(profile_levels, sample_levels)
+    assert ratio.shape == (4, 2)
+    assert ratio[:, 0].tolist() == m.expression_ratios(profile_levels, sample_levels[:, 0]).tolist()
+    assert ratio[:, 1].tolist() == [0.5, 1, 0, 1]
+    assert m.similiar_mask(ratio)[:, 1].tolist() == [False, True, False, True]
@@ -0,0 +1,60 @@
+from TCGA_code import gdc
+import hashlib
+
+COUNTS = ("# gene-model: GENCODE v36\n"
+          "gene_id\tgene_name\tgene_type\tunstranded\n"
+          "N_unmapped\t\t\t100\n"
+          "ENSG00000000003.15\tTSPAN6\tprotein_coding\t{}\n"
+          "ENSG00000000005.6\tTNMD\tprotein_coding\t{}\n")
+
+def write_download(directory, file_id, text, md5 = None):
+    # One GDC download: MANIFEST.txt and <file id>/<file name>
+    data = text.encode()
+    (directory / file_id).mkdir(parents = True)
+    (directory / file_id / "counts.tsv").write_bytes(data)
+    md5 = md5 or hashlib.md5(data).hexdigest()
+    (directory / "MANIFEST.txt").write_text("id\tfilename\tmd5\tsize\tstate\n"
+                                            f"{file_id}\t{file_id}/counts.tsv\t{md5}\t{len(data)}\tvalidated\n"
+                                            f"\\N\t{file_id}/annotations.txt\t0\t0\t\\N\n")
+
+def test_ingest_gdc_tree(tmp_path):
+
+    case = tmp_path / "TCGA-KIRC : TCGA-B0-4712"
+    write_download(case / "Primary_Tumor" / "gdc_download_1", "uuid-1", COUNTS.format(7, 21))
+    write_download(case / "Solid_Tissue_Normal", "uuid-2", COUNTS.format(1, 2))
+    write_download(tmp_path / "TCGA-KIRC : TCGA-BP-5009" / "Primary_Tumor", "uuid-3", COUNTS.format(5, 5), md5 = "0" * 32)
+
+    files = gdc.find_gdc_files(tmp_path)
+    assert files["sample"].tolist() == ["TCGA-B0-4712 Primary_Tumor", "TCGA-B0-4712 Solid_Tissue_Normal", "TCGA-BP-5009 Primary_Tumor"]
+    assert set(files["project"]) == {"TCGA-KIRC"}
+
+    # The file with the wrong md5 sum is left out.
+    cohort = gdc.ingest_gdc_tree(tmp_path, store = tmp_path / "store", workers = 1, output = False)
+    assert cohort.samples["file_id"].tolist() == ["uuid-1", "uuid-2"]
+    assert cohort.samples["status"].tolist() == ["ok", "ok"]
+    assert cohort.genes.tolist() == ["TNMD", "TSPAN6"]
+    assert cohort.matrix[:, 0].tolist() == [21, 7]
+    assert cohort.matrix[:, 1].tolist() == [2, 1]
+
+def test_ingest_gdc_tree_incremental(tmp_path):
+
+    root = tmp_path / "downloads"
+    write_download(root / "TCGA-KIRC : TCGA-B0-4712" / "Primary_Tumor", "uuid-1", COUNTS.format(7, 21))
+    gdc.ingest_gdc_tree(root, store = tmp_path / "store", workers = 1, output = False)
+
+    # A new download and a changed file: only those are parsed, the first file is
+    # untouched.
+    write_download(root / "TCGA-KIRC : TCGA-BP-5009" / "Primary_Tumor", "uuid-2", COUNTS.format(1, 2))
+    (root / "TCGA-KIRC : TCGA-B0-4712" / "Primary_Tumor" / "MANIFEST.txt").unlink()
+    (root / "TCGA-KIRC : TCGA-B0-4712" / "Primary_Tumor" / "uuid-1" / "counts.tsv").unlink()
+    (root / "TCGA-KIRC : TCGA-B0-4712" / "Primary_Tumor" / "uuid-1").rmdir()
+    write_download(root / "TCGA-KIRC : TCGA-B0-4712" / "Primary_Tumor", "uuid-1", COUNTS.format(8, 22))
+
+    cohort = gdc.ingest_gdc_tree(root, store = tmp_path / "store", workers = 1, output = False)
+    assert cohort.samples["file_id"].tolist() == ["uuid-1", "uuid-2"]
+    assert cohort.matrix[:, 0].tolist() == [22, 8]
+    assert cohort.matrix[:, 1].tolist() == [2, 1]
+
+    # Nothing to do the next time.
+    files = gdc.find_gdc_files(root)
+    assert gdc.ingest_gdc_tree(root, store = tmp_path / "store", workers = 1, output = False).n_samples == len(files)
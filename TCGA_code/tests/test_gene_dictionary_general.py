@@ -0,0 +1,53 @@
+from TCGA_code import cohort as c
+from TCGA_code import gene_dictionary as d
+import numpy as np
+import pandas as pd
+import pytest
+import subprocess
+import sys
+
+def test_gene_dictionary(tmp_path):
+
+    dictionary = d.GeneDictionary(["gene2", "gene1"])
+    ids = dictionary.encode(["gene1", "gene3", "gene1"])
+    assert ids.dtype == np.int64 and ids[0] == ids[2] and ids[0] != ids[1]
+    assert len(dictionary) == 3
+    assert dictionary.encode(["gene4"], add = False).tolist() == d.symbol_ids(["gene4"]).tolist()
+    assert len(dictionary) == 3
+    assert dictionary.decode(ids[[1, 0]]).tolist() == ["gene3", "gene1"]
+    with pytest.raises(KeyError):
+        dictionary.decode(d.symbol_ids(["gene4"]))
+
+    dictionary.save(tmp_path / "genes.npy")
+    assert d.GeneDictionary.load(tmp_path / "genes.npy").symbols.tolist() == ["gene2", "gene1", "gene3"]
+
+    # Duplicated symbols are averaged, ids come back sorted.
+    profile = pd.DataFrame([['gene3', 1.0], ['gene1', 2.0], ['gene3', 3.0]], columns = ["symbol", "value"])
+    ids, values = d.encode_profile(profile)
+    assert ids.dtype == np.int64 and ids.tolist() == sorted(d.symbol_ids(["gene1", "gene3"]).tolist())
+    assert values.tolist() == [2.0, 2.0]
+    assert d.decode_profile(ids, values).values.tolist() == [['gene1', 2.0], ['gene3', 2.0]]
+
+def test_ids_across_processes():
+
+    # Ids do not depend on what the process interned before.
+    code = ("from TCGA_code import gene_dictionary as d; "
+            "print(d.GENES.encode(['gene7', 'TP53']).tolist())")
+    output = subprocess.run([sys.executable, "-c", code], capture_output = True, text = True, check = True).stdout
+    d.GENES.encode(["gene0", "gene5"])
+    assert output.strip() == str(d.GENES.encode(["gene7", "TP53"]).tolist())
+
+def test_encoded_matching():
+
+    cohort_matrix = pd.DataFrame({"s1": [1, 5, 8, 3], "s2": [8, 5, 1, 0]}, index = ['gene1', 'gene2', 'gene3', 'gene4'])
+    cohort = c.Cohort.from_frame(cohort_matrix)
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene4', 9], ['gene9', 4]], columns = ["symbol", "value"])
+    encoded = d.encode_profile(profile)
+
+    # Same scores as the dataframe profile.
+    for add_missing in (False, True):
+        expected = c.match_cohort(profile, cohort, add_missing)
+        assert c.match_cohort(encoded, cohort, add_missing)["score"].tolist() == expected["score"].tolist()
+    assert c.match_cohort(encoded, cohort, method = "spearman")["score"].tolist() == c.match_cohort(profile, cohort, method = "spearman")["score"].tolist()
+    assert c.match_cohort(encoded, cohort, panel = ["gene1", "gene2", "gene4"])["score"].tolist() == c.match_cohort(profile, cohort, panel = ["gene1", "gene2", "gene4"])["score"].tolist()
+    assert cohort.gene_rows(d.GENES.encode(["gene4", "gene9"])).tolist() == [3, -1]
@@ -0,0 +1,50 @@
+from TCGA_code import cohort as c
+from TCGA_code import gene_panel as g
+from TCGA_code import synthetic
+from TCGA_code.pipeline import MatchPipeline
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+def test_read_gene_panel(tmp_path):
+
+    (tmp_path / "panel.txt").write_text("gene1\ngene3\n\ngene3\n")
+    (tmp_path / "panel.csv").write_text("symbol;weight\ngene2;1\ngene4;2\n")
+    (tmp_path / "sets.gmt").write_text("SET_A\tdescription\tgene1\tgene2\nSET_B\t\tgene4\n")
+
+    assert g.read_gene_panel(tmp_path / "panel.txt") == ["gene1", "gene3"]
+    assert g.read_gene_panel(tmp_path / "panel.csv") == ["gene2", "gene4"]
+    assert g.read_gene_panel(tmp_path / "sets.gmt", "SET_B") == ["gene4"]
+    assert g.read_gmt(tmp_path / "sets.gmt") == {"SET_A": ["gene1", "gene2"], "SET_B": ["gene4"]}
+
+def test_panel_matching():
+
+    cohort_matrix = pd.DataFrame({"s1": [1, 5, 8, 3], "s2": [8, 5, 1, 0]}, index = ['gene1', 'gene2', 'gene3', 'gene4'])
+    cohort = c.Cohort.from_frame(cohort_matrix)
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 8], ['gene4', 9]], columns=["symbol", "value"])
+    panel = ["gene1", "gene2", "gene3", "gene7"]
+
+    # Same scores as matching the restricted datasets; the slice is cached.
+    ranking = c.match_cohort(profile, cohort, panel = panel)
+    expected = c.match_cohort(profile[:3], cohort_matrix[:3])
+    assert ranking["score"].tolist() == expected["score"].tolist()
+    assert cohort.panel(panel).genes.tolist() == ["gene1", "gene2", "gene3"]
+    assert cohort.panel(panel) is cohort.panel(list(reversed(panel)))
+
+    # The pipeline compares only the panel genes.
+    pipeline = MatchPipeline(profile, profile.assign(value = [1, 5, 8, 0]), panel = panel)
+    assert pipeline.distance() == 1.0
+
+def test_concurrent_panels():
+
+    cohort = synthetic.synthetic_cohort(300, 20, seed = 0)
+    profile = synthetic.synthetic_profile(300, seed = 1)
+    panels = [cohort.genes[i::c.PANEL_CACHE_SIZE * 2].tolist() for i in range(c.PANEL_CACHE_SIZE * 2)]
+    expected = [c.match_cohort(profile, cohort, panel = panel)["score"].tolist() for panel in panels]
+
+    # More distinct panels than the cache holds, queried from several threads: the cache
+    # evicts without races.
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(5):
+            scores = list(pool.map(lambda panel: c.match_cohort(profile, cohort, panel = panel)["score"].tolist(), panels))
+            assert scores == expected
+    assert len(cohort._panels) == c.PANEL_CACHE_SIZE
@@ -0,0 +1,38 @@
+from TCGA_code import cli
+from TCGA_code import instrumentation
+from TCGA_code.pipeline import MatchPipeline
+import json
+
+def test_profiling_pipeline(tmp_path):
+
+    pipeline = MatchPipeline("TCGA_code/tests/input1.csv", "TCGA_code/tests/input2.csv")
+    with instrumentation.profiling(trace_memory = True) as report:
+        pipeline.run()
+
+    # Pipeline stages (nested in the stage that needs them first) with the
+    # match_computation calls inside them.
+    names = [record["name"] for record in report.records]
+    assert sorted(name for name in names if name.startswith("pipeline.")) == ["pipeline.distance", "pipeline.expression", "pipeline.normalized", "pipeline.reconciled", "pipeline.reference", "pipeline.sample"]
+    reference = report.records[names.index("pipeline.reference")]
+    reader = report.records[names.index("match_computation.read_expr_profile")]
+    assert reader["depth"] == reference["depth"] + 1 and reader["rows_out"] == reference["rows_out"] == 5
+    assert reader["peak_bytes"] > 0
+    assert all(record["wall_time"] >= 0 for record in report.records)
+    summary = report.summary()
+    assert summary.set_index("name").loc["match_computation.normalize_profile", "calls"] == 2
+    assert "pipeline.distance" in report.format()
+
+    report.to_json(tmp_path / "report.json")
+    assert len(json.loads((tmp_path / "report.json").read_text())["records"]) == len(report.records)
+
+    # Nothing is recorded without an active report.
+    pipeline.threshold = 0.5
+    pipeline.run()
+    assert len(report.records) == len(names)
+
+def test_cli_profile(tmp_path):
+
+    cli.main(["compare", "TCGA_code/tests/input1.csv", "TCGA_code/tests/input2.csv", "--profile", str(tmp_path / "report.json")])
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert "pipeline.distance" in [row["name"] for row in report["summary"]]
+    assert report["trace_memory"] is False
@@ -0,0 +1,45 @@
+from TCGA_code import match_computation as m
+import io
+import os
+import numpy as np
+
+def test_load_expression_file_csv(tmp_path):
+
+    file_name = tmp_path / "profile.csv"
+    file_name.write_text("symbol;value\ngene2;3\ngene1;1\ngene2;5\n")
+
+    # Duplicates are averaged, genes are sorted and the levels are float32.
+    profile = m.load_expression_file(file_name)
+    assert profile["symbol"].tolist() == ['gene1', 'gene2']
+    assert profile["value"].tolist() == [1, 4]
+    assert profile["value"].dtype == np.float32
+
+    # Cached results are copies and a changed file is parsed again.
+    profile.iloc[0, 1] = 100
+    assert m.load_expression_file(file_name)["value"].tolist() == [1, 4]
+    file_name.write_text("symbol;value\ngene1;10\n")
+    os.utime(file_name, ns = (0, 10**9))
+    assert m.load_expression_file(file_name)["value"].tolist() == [10]
+
+def test_load_expression_file_gdc(tmp_path):
+
+    file_name = tmp_path / "sample.rna_seq.augmented_star_gene_counts.tsv"
+    file_name.write_text("# gene-model: GENCODE v36\n"
+                         "gene_id\tgene_name\tgene_type\tunstranded\t"
+                         "stranded_first\tstranded_second\ttpm_unstranded\n"
+                         "N_unmapped\t\t\t100\t100\t100\t\n"
+                         "N_multimapping\t\t\t50\t50\t50\t\n"
+                         "ENSG00000000003.15\tTSPAN6\tprotein_coding\t7\t3\t4\t1.5\n"
+                         "ENSG00000000005.6\tTNMD\tprotein_coding\t21\t10\t11\t2.5\n")
+
+    # The GDC file is read directly, without the summary rows.
+    profile = m.read_TCGA_sample(str(file_name))
+    assert profile["symbol"].tolist() == ['TNMD', 'TSPAN6']
+    assert profile["value"].tolist() == [21, 7]
+    assert m.load_expression_file(str(file_name), value_column = "tpm_unstranded")["value"].tolist() == [2.5, 1.5]
+
+def test_load_expression_file_buffer():
+
+    # Buffers are parsed like files, without the parse cache.
+    profile = m.read_expr_profile(io.StringIO("symbol;value\ngene2;4\ngene1;1\ngene1;3\n"))
+    assert profile.values.tolist() == [['gene1', 2.0], ['gene2', 4.0]]
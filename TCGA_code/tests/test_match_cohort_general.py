@@ -0,0 +1,26 @@
+from TCGA_code import match_computation as m
+from TCGA_code import cohort as c
+import pandas as pd
+
+def test_match_cohort_gen():
+
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 8], ['gene5', 2]], columns=["symbol", "value"])
+
+    cohort_matrix = pd.DataFrame({"s1": [1, 5, 8, 3], "s2": [8, 5, 1, 0], "s3": [2, 4, 9, 1]},
+                                 index = ['gene1', 'gene2', 'gene3', 'gene4'])
+
+    # The scores must be the pearson correlations compute_distance reports for each
+    # single pair.
+    for add_missing in [False, True]:
+        ranking = c.match_cohort(profile, cohort_matrix, add_missing = add_missing)
+        assert ranking["rank"].tolist() == [1, 2, 3]
+        assert ranking["score"].is_monotonic_decreasing
+
+        for sample, score in zip(ranking["sample"], ranking["score"]):
+            sample_data = cohort_matrix[sample].rename_axis("symbol").reset_index(name = "value")
+            new_profile, new_sample, _ = m.check_TCGA(profile, sample_data, add_missing = add_missing, output = False)
+            new_profile, new_sample, _ = m.check_profile(new_profile, new_sample, add_missing = add_missing, output = False)
+            assert round(score, 4) == m.compute_distance(new_profile, new_sample)
+
+    # s1 holds exactly the profile levels on the shared genes.
+    assert c.match_cohort(profile, cohort_matrix)["sample"][0] == "s1"
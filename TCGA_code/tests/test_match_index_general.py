@@ -0,0 +1,35 @@
+from TCGA_code import cohort as c
+from TCGA_code import match_index as mi
+import numpy as np
+import pandas as pd
+
+def make_cohort():
+    rng = np.random.default_rng(0)
+    genes = [f"gene{i}" for i in range(50)]
+    return c.Cohort(genes, rng.gamma(1, 10, size = (50, 40)).astype(np.float32)), genes
+
+def test_match_index_exact():
+
+    cohort, genes = make_cohort()
+    profile = pd.DataFrame({"symbol": genes, "value": cohort.matrix[:, 7] + 1})
+
+    # The exact top-k are the first k rows of the full ranking.
+    index = mi.MatchIndex(cohort, mode = "exact", block_size = 16)
+    top = index.query(profile, k = 5)
+    full = c.match_cohort(profile, cohort).head(5)
+    assert top["sample"].tolist() == full["sample"].tolist()
+    assert np.allclose(top["score"], full["score"])
+    assert top["sample"][0] == "sample_7"
+
+def test_match_index_approximate():
+
+    cohort, genes = make_cohort()
+    profile = pd.DataFrame({"symbol": genes, "value": cohort.matrix[:, 3] * 2})
+
+    # The best match is found and its score is exact.
+    for mode in ["random", "pca"]:
+        index = mi.MatchIndex(cohort, mode = mode, n_components = 16, oversample = 4)
+        top = index.query(profile, k = 3)
+        assert len(top) == 3
+        assert top["sample"][0] == "sample_3"
+        assert np.isclose(top["score"][0], 1)
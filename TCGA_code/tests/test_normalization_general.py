@@ -0,0 +1,59 @@
+from TCGA_code import normalization as n
+from TCGA_code import match_computation as m
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store as s
+from scipy import stats
+import numpy as np
+import pandas as pd
+
+def test_normalize_matrix_gen():
+
+    matrix = np.array([[1, 8, 2], [5, 5, 2], [8, 1, 9], [3, 0, 4]], dtype = np.float64)
+
+    assert np.allclose(n.normalize_matrix(matrix, "z-score", copy = True), stats.zscore(matrix, axis = 0))
+    assert np.allclose(n.normalize_matrix(matrix, "mean", copy = True), stats.zscore(matrix, axis = 0, ddof = 1))
+    assert np.allclose(n.normalize_matrix(matrix, "min-max", copy = True)[:, 0], [0, 4 / 7, 1, 2 / 7])
+    assert np.allclose(n.normalize_matrix(matrix, "cpm", copy = True).sum(axis = 0), 1e6)
+    assert np.allclose(n.normalize_matrix(matrix, "tpm", copy = True, gene_lengths = [1, 2, 1, 2]).sum(axis = 0), 1e6)
+    assert np.allclose(n.normalize_matrix(matrix, "log1p", copy = True), np.log1p(matrix))
+
+    # Quantile: every column gets the same distribution; the tie in the last column gets
+    # the mean of two targets.
+    quantile = n.normalize_matrix(matrix, "quantile", copy = True)
+    target = np.sort(matrix, axis = 0).mean(axis = 1)
+    assert np.allclose(np.sort(quantile[:, :2], axis = 0), target[:, np.newaxis])
+    assert np.allclose(quantile[:2, 2], (target[0] + target[1]) / 2)
+
+    # In place unless a copy is asked for; integer matrices are always copied.
+    normalized = n.normalize_matrix(matrix, "raw")
+    assert normalized is matrix
+    integers = matrix.astype(int)
+    assert n.normalize_matrix(integers, "z-score").dtype == np.float64
+    assert integers[0, 0] == 1
+
+def test_normalize_profile_copy():
+
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 8]], columns=["symbol", "value"])
+    normalized = m.normalize_profile(profile, "min-max")
+    assert normalized["value"].tolist() == [0, 4 / 7, 1]
+    assert profile["value"].tolist() == [1, 5, 8]
+
+def test_cohort_stats_stored(tmp_path):
+
+    first = c.Cohort(['gene1', 'gene2', 'gene3'], np.array([[1, 2], [3, 4], [2, 9]]), pd.DataFrame({"sample": ["s1", "s2"], "file_id": ["a", "b"]}))
+    s.write_cohort_store(first, tmp_path / "store")
+    stored = s.open_cohort_store(tmp_path / "store")
+    assert np.allclose(stored.sample_stats(), n.sample_stats(first.matrix))
+
+    # The stored statistics follow the updates: a replaced, an appended sample and a new
+    # (zero) gene.
+    second = c.Cohort(['gene1', 'gene4'], np.array([[5, 6], [1, 3]]), pd.DataFrame({"sample": ["s2", "s3"], "file_id": ["b", "c"]}))
+    stored = s.update_cohort_store(second, tmp_path / "store")
+    assert np.allclose(stored.sample_stats(), n.sample_stats(stored.matrix))
+    assert np.allclose(stored.normalized("z-score", columns = slice(1, 3)), stats.zscore(stored.matrix[:, 1:3], axis = 0), atol = 1e-6)
+
+def test_z_score_large_offset():
+
+    levels = 1e8 + np.random.default_rng(0).random((500, 2))
+    normalized = n.normalize_matrix(levels, "z-score", copy = True)
+    assert np.allclose(normalized, stats.zscore(levels, axis = 0), atol = 1e-6)
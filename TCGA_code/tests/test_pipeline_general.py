@@ -0,0 +1,43 @@
+from TCGA_code import match_computation as m
+from TCGA_code.pipeline import MatchPipeline
+import pandas as pd
+
+def test_pipeline_gen():
+
+    pipeline = MatchPipeline("TCGA_code/tests/input1.csv", "TCGA_code/tests/input2.csv", add_missing = True)
+    results = pipeline.run()
+
+    # Same result as the step by step computation.
+    profile, sample, missing_TCGA = m.check_TCGA(m.read_expr_profile("TCGA_code/tests/input1.csv"), m.read_TCGA_sample("TCGA_code/tests/input2.csv"), True, False)
+    profile, sample, missing_reference = m.check_profile(profile, sample, True, False)
+    profile = m.normalize_profile(profile, "z-score")
+    sample = m.normalize_profile(sample, "z-score")
+    assert results["distance"] == m.compute_distance(profile, sample)
+    assert results["missing_TCGA"] == missing_TCGA
+    assert results["missing_reference"] == missing_reference
+    assert pipeline.computed == ["reference", "sample", "reconciled", "normalized", "distance", "expression"]
+
+def test_pipeline_memoized():
+
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 0], ['gene4', 3]], columns=["symbol", "value"])
+    sample_data = pd.DataFrame([['gene1', 1], ['gene2', 10], ['gene3', 0], ['gene5', 0]], columns=["symbol", "value"])
+    pipeline = MatchPipeline(profile, sample_data)
+    pipeline.run()
+
+    # A new threshold only re-runs the expression analysis.
+    pipeline.computed.clear()
+    pipeline.threshold = 0.5
+    pipeline.run()
+    assert pipeline.computed == ["expression"]
+
+    # A new normalization method re-runs the normalization and everything after it.
+    pipeline.computed.clear()
+    pipeline.method = "min-max"
+    pipeline.run()
+    assert pipeline.computed == ["normalized", "distance", "expression"]
+
+    # Changed input data is read again.
+    pipeline.computed.clear()
+    sample_data.iloc[0, 1] = 2
+    pipeline.run()
+    assert pipeline.computed == ["sample", "reconciled", "normalized", "distance", "expression"]
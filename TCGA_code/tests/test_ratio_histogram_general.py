@@ -0,0 +1,28 @@
+from TCGA_code import match_computation as m
+import numpy as np
+import pandas as pd
+
+def test_ratio_histogram_gen():
+
+    gene_ratio = pd.DataFrame({'symbol': ['gene1', 'gene2', 'gene3', 'gene4', 'gene5'], 'ratio': [0.1, 0.2, 1.0, 1.05, np.inf]})
+
+    counts = m.ratio_histogram(gene_ratio)
+
+    # Bins are closed on the right; the input is not changed.
+    assert counts.index.tolist() == m.ratio_bin_labels()
+    assert counts["0.0-0.2"] == 2
+    assert counts["0.8-1.0"] == 1
+    assert counts["1.0-1.2"] == 1
+    assert counts[">2.0"] == 1
+    assert counts.sum() == 5
+    assert gene_ratio.columns.tolist() == ['symbol', 'ratio']
+
+def test_ratio_histogram_batched():
+
+    ratio = np.array([[0.1, 1.0], [1.0, np.nan], [3.0, 3.0]])
+
+    # One column of counts per sample.
+    counts = m.ratio_histogram(ratio, edges = (0.5, 1.5))
+    assert counts.index.tolist() == ["0.0-0.5", "0.5-1.5", ">1.5", "nan"]
+    assert counts[0].tolist() == [1, 1, 1, 0]
+    assert counts[1].tolist() == [0, 1, 1, 1]
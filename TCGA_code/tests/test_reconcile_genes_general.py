@@ -0,0 +1,34 @@
+from TCGA_code import match_computation as m
+import pandas as pd
+
+def test_reconcile_genes_drop():
+
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 8]], columns=["symbol", "value"])
+    sample_data = pd.DataFrame([['gene4', 2], ['gene3', 4], ['gene1', 3]], columns=["symbol", "value"])
+
+    # Only the shared genes are kept, sorted alphabetically.
+    genes, profile_levels, TCGA_levels, missing_TCGA, missing_reference = m.reconcile_genes(profile, sample_data, add_missing = False)
+
+    assert genes.tolist() == ['gene1', 'gene3']
+    assert profile_levels.tolist() == [1, 8]
+    assert TCGA_levels.tolist() == [3, 4]
+    assert missing_TCGA == ['gene2']
+    assert missing_reference == ['gene4']
+
+def test_reconcile_genes_add():
+
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 8]], columns=["symbol", "value"])
+    sample_data = pd.DataFrame([['gene4', 2], ['gene3', 4], ['gene1', 3]], columns=["symbol", "value"])
+
+    # Genes that only exist in one dataset get zero expression levels in the other one.
+    genes, profile_levels, TCGA_levels, missing_TCGA, missing_reference = m.reconcile_genes(profile, sample_data, add_missing = True)
+
+    assert genes.tolist() == ['gene1', 'gene2', 'gene3', 'gene4']
+    assert profile_levels.tolist() == [1, 5, 8, 0]
+    assert TCGA_levels.tolist() == [3, 0, 4, 2]
+
+    # Same result as running check_TCGA and check_profile one after the other.
+    new_profile, new_sample, _ = m.check_TCGA(profile, sample_data, add_missing = True, output = False)
+    new_profile, new_sample, _ = m.check_profile(new_profile, new_sample, add_missing = True, output = False)
+    assert new_profile.iloc[:,0].tolist() == genes.tolist()
+    assert new_sample.iloc[:,1].tolist() == TCGA_levels.tolist()
@@ -0,0 +1,161 @@
+from TCGA_code import cli
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store
+from TCGA_code import gene_dictionary
+from TCGA_code import service
+from TCGA_code import synthetic
+from TCGA_code.client import MatchClient
+import asyncio
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+def test_match_service():
+
+    cohort = synthetic.synthetic_cohort(2000, 30, seed = 0)
+    profile = synthetic.synthetic_profile(2000, seed = 1)
+    match_service = service.MatchService(cohort)
+
+    # Same scores as match_cohort, also for profiles that only cover some cohort genes
+    # (all rows are multiplied).
+    for query, add_missing in [(profile, False), (profile, True), (profile.iloc[:300], False)]:
+        expected = c.match_cohort(query, cohort, add_missing)
+        ranking = match_service.score(query, add_missing = add_missing)
+        assert ranking["sample"].tolist() == expected["sample"].tolist()
+        assert np.allclose(ranking["score"], expected["score"], atol = 1e-6)
+    assert len(match_service.score(profile, k = 5)) == 5
+
+    # Queried symbols are not interned: the gene dictionary does not grow with the
+    # queries.
+    n_symbols = len(gene_dictionary.GENES)
+    unknown = pd.concat([profile, pd.DataFrame({"symbol": ["not-a-gene-1", "not-a-gene-2"], "value": [3.0, 4.0]})])
+    assert np.allclose(match_service.score(unknown)["score"], match_service.score(profile)["score"])
+    assert len(gene_dictionary.GENES) == n_symbols
+
+    # log1p is applied once to the resident cohort and to every profile.
+    log_service = service.MatchService(cohort, normalization = "log1p")
+    log_profile = profile.assign(value = np.log1p(profile["value"]))
+    log_cohort = c.Cohort(cohort.genes, np.log1p(cohort.matrix), cohort.samples)
+    assert np.allclose(log_service.score(profile)["score"], c.match_cohort(log_profile, log_cohort)["score"], atol = 1e-6)
+
+def test_request_coalescing():
+
+    cohort = synthetic.synthetic_cohort(2000, 30, seed = 0)
+    profiles = [synthetic.synthetic_profile(2000, seed = seed) for seed in range(6)]
+    match_service = service.MatchService(cohort)
+
+    # One matrix product for several profiles, same rankings as one query at a time.
+    for ranking, profile in zip(match_service.score_many(profiles, k = 5), profiles):
+        expected = c.match_cohort(profile, cohort).head(5)
+        assert ranking["sample"].tolist() == expected["sample"].tolist()
+        assert np.allclose(ranking["score"], expected["score"], atol = 1e-6)
+
+    # Concurrent queries within the batch window share a batch; every caller gets its
+    # own ranking.
+    requests = [{"profile": {"symbol": profile["symbol"].tolist(), "value": profile["value"].tolist()}, "k": 3} for profile in profiles]
+    requests.append(dict(requests[0], method = "spearman"))
+
+    async def run(batch_window):
+        server = service.MatchServer(match_service, batch_window = batch_window, max_batch = 4)
+        try:
+            return [json.loads(body) for body in await asyncio.gather(*[server.score(request) for request in requests])]
+        finally:
+            await server.close()
+
+    responses = asyncio.run(run(0.5))
+    assert sorted(response["batch_size"] for response in responses[:-1]) == [2, 2, 4, 4, 4, 4]
+    assert responses[-1]["batch_size"] == 1
+    for response, profile in zip(responses, profiles):
+        assert [row["sample"] for row in response["ranking"]] == match_service.score(profile, k = 3)["sample"].tolist()
+    assert all(response["batch_size"] == 1 for response in asyncio.run(run(0)))
+
+    # A bad request fails on its own, the good requests of its batch window are still
+    # answered.
+    bad_requests = [dict(requests[0], k = "3"), dict(requests[1], add_missing = "yes"), dict(requests[2], method = "kendall"),
+                    {"profile": {"symbol": ["gene1", "gene2"], "value": [1.0]}}]
+
+    async def run_mixed():
+        server = service.MatchServer(match_service, batch_window = 0.5, max_batch = 4)
+        try:
+            return await asyncio.gather(*[server.score(request) for request in bad_requests + requests[:3]], return_exceptions = True)
+        finally:
+            await server.close()
+
+    responses = asyncio.run(run_mixed())
+    assert all(isinstance(response, ValueError) for response in responses[:4])
+    for response, profile in zip(responses[4:], profiles):
+        response = json.loads(response)
+        assert response["batch_size"] == 3
+        assert [row["sample"] for row in response["ranking"]] == match_service.score(profile, k = 3)["sample"].tolist()
+
+def test_match_server(tmp_path):
+
+    cohort = synthetic.synthetic_cohort(2000, 30, seed = 0)
+    profile = synthetic.synthetic_profile(2000, seed = 1)
+    synthetic.write_profile(profile, tmp_path / "reference.csv")
+    expected = c.match_cohort(profile, cohort)
+    match_service = service.MatchService(cohort, file_root = tmp_path)
+
+    for server in [service.background(match_service), service.background(match_service, socket_path = str(tmp_path / "match.sock"))]:
+        try:
+            with MatchClient(server.address) as client:
+                assert client.health()["n_samples"] == 30
+                ranking = pd.DataFrame(client.score(profile, k = 3))
+                assert ranking["sample"].tolist() == expected["sample"].tolist()[:3]
+                assert np.allclose(ranking["score"], expected["score"][:3], atol = 1e-6)
+                # A file on the server host is read by the server.
+                assert client.score(tmp_path / "reference.csv", k = 3) == client.score(profile, k = 3)
+                with pytest.raises(RuntimeError, match = "400"):
+                    client.score(tmp_path / "missing.csv")
+                # Files outside the file root are not read.
+                with pytest.raises(RuntimeError, match = "only reads profile files inside"):
+                    client.score(tmp_path / ".." / "reference.csv")
+                # The connection is still usable after an error.
+                assert len(client.score(profile, method = "spearman")) == 30
+        finally:
+            service.stop_background(server)
+
+def test_error_status(monkeypatch):
+
+    cohort = synthetic.synthetic_cohort(500, 10, seed = 0)
+    profile = synthetic.synthetic_profile(500, seed = 1)
+    match_service = service.MatchService(cohort)
+    server = service.background(match_service)
+    try:
+        with MatchClient(server.address) as client:
+            # Invalid requests are client errors, failures of the service are not.
+            for request in [{"k": 3}, {"profile": {"symbol": ["gene1"], "value": [{}]}}, {"file": "reference.csv"}]:
+                with pytest.raises(RuntimeError, match = "400"):
+                    client._request("POST", "/score", request)
+            def fail(genes):
+                raise KeyError("panel cache")
+            monkeypatch.setattr(match_service.cohort, "panel", fail)
+            with pytest.raises(RuntimeError, match = "500"):
+                client.score(profile, panel = profile["symbol"][:10])
+    finally:
+        service.stop_background(server)
+
+def test_cli_query(tmp_path, capsys):
+
+    cohort = synthetic.synthetic_cohort(500, 10, seed = 0)
+    synthetic.write_profile(synthetic.synthetic_profile(500, seed = 1), tmp_path / "reference.csv")
+    server = service.background(service.MatchService(cohort, file_root = tmp_path))
+    try:
+        cli.main(["query", str(tmp_path / "reference.csv"), "--server", server.address, "-k", "4", "-o", str(tmp_path / "top.csv")])
+    finally:
+        service.stop_background(server)
+    assert pd.read_csv(tmp_path / "top.csv")["rank"].tolist() == [1, 2, 3, 4]
+
+def test_cli_serve_file_root(tmp_path, monkeypatch):
+
+    cohort_store.write_cohort_store(synthetic.synthetic_cohort(500, 10, seed = 0), tmp_path / "store")
+    services = []
+    monkeypatch.setattr(service, "serve", lambda match_service, *args, **kwargs: services.append(match_service))
+
+    # File queries are refused unless the server is given a file root.
+    cli.main(["serve", "--cohort", str(tmp_path / "store")])
+    cli.main(["serve", "--cohort", str(tmp_path / "store"), "--file-root", str(tmp_path)])
+    assert services[0].file_root is None
+    assert services[1].file_root == os.path.realpath(tmp_path)
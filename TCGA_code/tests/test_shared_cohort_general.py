@@ -0,0 +1,35 @@
+from TCGA_code import cli
+from TCGA_code import cohort as c
+from TCGA_code import shared_cohort as s
+import numpy as np
+import pandas as pd
+
+def test_shared_cohort():
+
+    cohort_matrix = pd.DataFrame({"s1": [1, 5, 8, 3], "s2": [8, 5, 1, 0], "s3": [0, 0, 2, 0]}, index = ['gene1', 'gene2', 'gene3', 'gene4'])
+    cohort = c.Cohort.from_frame(cohort_matrix)
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 8]], columns = ["symbol", "value"])
+
+    for source in (cohort, cohort.to_sparse()):
+        with s.SharedCohort(source) as shared:
+            attached, segments = s.attach_cohort(shared.handle)
+            assert attached.genes.tolist() == ['gene1', 'gene2', 'gene3', 'gene4']
+            assert np.array_equal(attached.to_frame().to_numpy(), cohort_matrix.to_numpy())
+            assert c.match_cohort(profile, attached)["score"].tolist() == c.match_cohort(profile, source)["score"].tolist()
+            del attached
+            for segment in segments:
+                segment.close()
+
+def test_cli_match_shared(tmp_path):
+
+    (tmp_path / "ref1.csv").write_text("symbol;value\ngene1;1\ngene2;5\ngene3;8\n")
+    (tmp_path / "tcga").mkdir()
+    for i in range(4):
+        (tmp_path / "tcga" / f"s{i}.csv").write_text(f"symbol;value\ngene1;{i}\ngene2;5\ngene3;{8 - i}\ngene4;2\n")
+
+    # Two worker processes attached to the shared cohort give the same correlations as
+    # one.
+    for workers in ("1", "2"):
+        cli.main(["match", str(tmp_path / "ref1.csv"), "--cohort", str(tmp_path / "tcga"), "-o", str(tmp_path / workers),
+                  "--workers", workers, "--block-size", "1", "--quiet"])
+    assert pd.read_csv(tmp_path / "2" / "correlations.csv", index_col = 0).equals(pd.read_csv(tmp_path / "1" / "correlations.csv", index_col = 0))
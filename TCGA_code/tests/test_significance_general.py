@@ -0,0 +1,35 @@
+from TCGA_code import cohort as c
+from TCGA_code import significance as s
+import numpy as np
+import pandas as pd
+
+def test_permutation_test():
+
+    rng = np.random.default_rng(0)
+    genes = [f"gene{i:03d}" for i in range(300)]
+    reference = rng.random(300)
+    matrix = rng.random((300, 20))
+    matrix[:, 0] = reference + 0.1 * rng.random(300)
+    cohort = c.Cohort(genes, matrix)
+    profile = pd.DataFrame({"symbol": genes, "value": reference})
+
+    ranking = s.permutation_test(profile, cohort, n_permutations = 500, seed = 1)
+    assert np.allclose(ranking["score"], c.match_cohort(profile, cohort)["score"])
+    assert ranking.loc[0, "sample"] == "sample_0"
+    assert ranking.loc[0, "p_value"] == 1 / 501 and ranking.loc[0, "n_permutations"] == 500
+    assert ranking.loc[0, "adjusted_score"] > 10
+    # Samples that are clearly not significant stop early; the same seed gives the same
+    # table.
+    assert ranking["n_permutations"].min() < 500
+    assert ranking.equals(s.permutation_test(profile, cohort, n_permutations = 500, seed = 1))
+
+def test_bootstrap_and_fdr():
+
+    rng = np.random.default_rng(0)
+    genes = [f"gene{i:03d}" for i in range(200)]
+    cohort = c.Cohort(genes, rng.random((200, 5)))
+    profile = pd.DataFrame({"symbol": genes, "value": rng.random(200)})
+    ranking = s.bootstrap_scores(profile, cohort, n_resamples = 200, seed = 0)
+    assert ((ranking["ci_low"] <= ranking["score"]) & (ranking["score"] <= ranking["ci_high"])).all()
+
+    assert np.allclose(s.fdr([0.01, 0.04, 0.03, np.nan, 0.5]), [0.04, 0.16 / 3, 0.16 / 3, np.nan, 0.5], equal_nan = True)
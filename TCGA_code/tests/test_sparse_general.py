@@ -0,0 +1,33 @@
+from TCGA_code import cohort as c
+from TCGA_code import correlation
+from TCGA_code import sparse
+import numpy as np
+import pandas as pd
+
+def test_sparse_cohort():
+
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(3, (200, 12)) * (rng.random((200, 12)) < 0.2)
+    genes = [f"gene{i:03d}" for i in range(200)]
+    cohort = c.Cohort(genes, counts.astype(np.float32))
+    sparse_cohort = cohort.to_sparse()
+
+    # Counts are stored as uint32, only the non-zero levels take memory.
+    assert sparse.issparse(sparse_cohort.matrix)
+    assert sparse_cohort.matrix.dtype == np.uint32
+    assert sparse_cohort.nbytes < cohort.nbytes / 2
+    assert np.array_equal(sparse_cohort.to_frame().to_numpy(), cohort.to_frame().to_numpy())
+
+    # Same scores as the dense cohort, with and without dropped genes.
+    profile = pd.DataFrame({"symbol": genes[:150], "value": rng.random(150)})
+    for add_missing in (False, True):
+        expected = c.match_cohort(profile, cohort, add_missing)
+        ranking = c.match_cohort(profile, sparse_cohort, add_missing)
+        assert np.allclose(ranking["score"], expected["score"], atol = 1e-6)
+    assert np.allclose(c.match_cohort(profile, sparse_cohort, method = "spearman")["score"], c.match_cohort(profile, cohort, method = "spearman")["score"])
+    assert np.allclose(sparse_cohort.sample_stats(), c.Cohort(genes, counts.astype(np.float32)).sample_stats())
+
+    # The kernels take a sparse matrix as y.
+    x = rng.random(200)
+    assert np.allclose(correlation.pearson(x, sparse_cohort.matrix), correlation.pearson(x, counts))
+    assert np.allclose(correlation.cosine(x, sparse_cohort.matrix), correlation.cosine(x, counts))
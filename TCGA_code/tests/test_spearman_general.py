@@ -0,0 +1,40 @@
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store as s
+from scipy import stats
+import numpy as np
+import pandas as pd
+
+def test_spearman_gen(tmp_path):
+
+    cohort_matrix = pd.DataFrame({"s1": [1, 5, 8, 3, 0], "s2": [8, 5, 1, 0, 0], "s3": [2, 2, 9, 4, 1]}, index = ['gene1', 'gene2', 'gene3', 'gene4', 'gene5'])
+    cohort = c.Cohort.from_frame(cohort_matrix)
+    profile = pd.DataFrame([['gene1', 1], ['gene2', 5], ['gene3', 7], ['gene4', 3], ['gene6', 2]], columns=["symbol", "value"])
+
+    # Spearman over the cohort genes: gene6 is left out and the missing gene5 counts as
+    # zero.
+    ranking = c.match_cohort(profile, cohort, method = "spearman")
+    x = [1, 5, 7, 3, 0]
+    for sample, score in zip(ranking["sample"], ranking["score"]):
+        assert np.isclose(score, stats.spearmanr(x, cohort_matrix[sample])[0])
+
+    # The store keeps the ranks of every sample and gives the same scores.
+    s.write_cohort_store(cohort, tmp_path / "store")
+    stored = s.open_cohort_store(tmp_path / "store")
+    assert isinstance(stored.ranks(), np.memmap)
+    assert np.array_equal(stored.ranks(), cohort.ranks())
+    assert c.match_cohort(profile, stored, method = "spearman")["score"].tolist() == ranking["score"].tolist()
+
+def test_spearman_update(tmp_path):
+
+    first = c.Cohort(['gene1', 'gene2', 'gene3'], np.array([[1, 2], [3, 4], [0, 9]]), pd.DataFrame({"sample": ["s1", "s2"], "file_id": ["a", "b"]}))
+    s.write_cohort_store(first, tmp_path / "store")
+
+    # Replaced and appended samples get their ranks, a new gene re-ranks every sample.
+    second = c.Cohort(['gene1', 'gene2'], np.array([[5, 6], [1, 0]]), pd.DataFrame({"sample": ["s2", "s3"], "file_id": ["b", "c"]}))
+    stored = s.update_cohort_store(second, tmp_path / "store")
+    assert np.array_equal(stored.ranks(), c.rank_columns(stored.matrix))
+
+    third = c.Cohort(['gene0'], np.array([[7]]), pd.DataFrame({"sample": ["s4"], "file_id": ["d"]}))
+    stored = s.update_cohort_store(third, tmp_path / "store")
+    assert stored.n_genes == 4
+    assert np.array_equal(stored.ranks(), c.rank_columns(stored.matrix))
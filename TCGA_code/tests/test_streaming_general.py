@@ -0,0 +1,28 @@
+from TCGA_code import cohort as c
+from TCGA_code import cohort_store as s
+from TCGA_code import streaming
+import numpy as np
+import pandas as pd
+
+def test_stream_match_gen(tmp_path):
+
+    rng = np.random.default_rng(0)
+    (tmp_path / "tcga").mkdir()
+    for i in range(7):
+        genes = [f"gene{j}" for j in range(10) if j != i]
+        values = rng.integers(0, 20, len(genes))
+        (tmp_path / "tcga" / f"s{i}.csv").write_text("symbol;value\n" + "".join(f"{g};{v}\n" for g, v in zip(genes, values)))
+    profile = pd.DataFrame({"symbol": [f"gene{j}" for j in range(12)], "value": rng.integers(0, 20, 12).astype(float)})
+
+    expected = c.match_cohort(profile, s.ingest_cohort_store([tmp_path / "tcga"], tmp_path / "store", output = False))
+
+    # Sample files and the store, in blocks of 2 samples: the same top 3 and summary as
+    # the whole cohort.
+    for source in [str(tmp_path / "tcga"), str(tmp_path / "store")]:
+        ranking, summary = streaming.stream_match(profile, source, k = 3, block_size = 2)
+        assert ranking["sample"].tolist() == expected["sample"][:3].tolist()
+        assert np.allclose(ranking["score"], expected["score"][:3])
+        assert summary["n_samples"] == 7
+        assert np.isclose(summary["mean"], expected["score"].mean())
+        assert np.isclose(summary["std"], expected["score"].std(ddof = 0))
+        assert np.isclose(summary["max"], expected["score"].max())
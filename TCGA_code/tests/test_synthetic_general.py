@@ -0,0 +1,15 @@
+from TCGA_code import synthetic as s
+import numpy as np
+
+def test_synthetic_data():
+
+    profile = s.synthetic_profile(2000, zero_fraction = 0.4, duplicate_fraction = 0.05, seed = 0)
+    assert profile.columns.tolist() == ["symbol", "value"] and len(profile) == 2000
+    assert profile["symbol"].duplicated().sum() > 0
+    assert (profile["value"] == 0).mean() >= 0.4
+    assert profile.equals(s.synthetic_profile(2000, zero_fraction = 0.4, duplicate_fraction = 0.05, seed = 0))
+
+    # Cohorts share the unique symbols of profiles of the same size.
+    cohort = s.synthetic_cohort(2000, 3, seed = 1)
+    assert cohort.genes.is_monotonic_increasing and cohort.matrix.dtype == np.float32
+    assert profile["symbol"].isin(cohort.genes).mean() > 0.9
@@ -2,11 +2,20 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import *
 from tkinter import filedialog
-import pandas as pd
 import numpy as np
 from functools import partial
 import csv
-import match_computation as m
+import queue
+import threading
+from contextlib import nullcontext
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from TCGA_code import match_computation as m  # noqa: E402
+from TCGA_code import pipeline as p  # noqa: E402
+from TCGA_code import instrumentation  # noqa: E402
 
 
 # START WINDOW EVENT LOOP:
@@ -22,8 +31,11 @@ missing_values_var = tk.StringVar()
 method_var = tk.StringVar()
 show_output_var = tk.StringVar()
 threshold_var = tk.StringVar()
+profile_var = tk.StringVar()
 output_text1 = tk.StringVar()
 output_text2 = tk.StringVar()
+stage_text = tk.StringVar()
+queue_text = tk.StringVar()
 
 
 def browseFiles_reference():
@@ -49,87 +61,188 @@ def browseFiles_output():
     ent_output_path.insert(0, filename)
 
 
-def analysis():
-    
-    # IF INPUT PATHS ARE EMPTY RETURN MESSAGE TO THE OUTPUT WINDOW!
-
-
-    # Pre-process data:
-    #input_profile = m.read_expr_profile(input_profile_path)
-    path = input_ref_profile_var.get()
-    input_profile = pd.read_csv(path, sep = ";", encoding="UTF-8")
-    # Average the duplicate values
-    input_profile = input_profile.groupby('symbol', as_index=False).mean()
+# Stages of one comparison (the pipeline stages and writing the output file), reported
+# to the progress bar.
+STAGE_KEYS = p.STAGES + ["output"]
+STAGES = ["Reading reference profile", "Reading TCGA profile", "Checking genes", "Normalizing",
+          "Computing distance", "Expression analysis", "Writing output"]
 
-    #input_sample_data = m.read_TCGA_sample(input_sample_data_path)
-    path = input_tcga_profile_var.get()
-    input_sample_data = pd.read_csv(path, sep = ";", encoding="UTF-8")
-    # Average the duplicate values
-    input_sample_data = input_sample_data.groupby('symbol', as_index=False).mean()
 
-    # Clean data:
-    profile, sample, missing_TCGA = m.check_TCGA(input_profile, input_sample_data, missing_values_var.get() == "True", show_output_var.get() == "True")
-    profile, sample, missing_reference = m.check_profile(profile, sample, missing_values_var.get() == "True", show_output_var.get() == "True")
+class Cancelled(Exception):
+    pass
 
-    # Normalize data sets
-    profile = m.normalize_profile(profile, method_var.get())
-    sample = m.normalize_profile(sample, method_var.get())
 
-    # "profile" and "sample" are now pre-processed and clean.
+# Comparisons wait in jobs and run one after the other in a worker thread. The worker
+# never touches the widgets: it puts its progress and results into events, which the Tk
+# event loop polls (window.after).
+jobs = queue.Queue()
+events = queue.Queue()
+cancel_event = threading.Event()
+pipeline = p.MatchPipeline()
 
-    # MAYBE: YOU SHOULD CHECK FOR ISNAN OR ISINF HERE FOR profile, input_tcga_profile_df
 
-    # ACTUAL ANALYSIS STEP:
-    # (1) Compute distance:
-    distance = m.compute_distance(profile, sample)
-    file_path = output_path_var.get() + "/OUTPUT_TEST.csv"
+def analysis():
+    # Queue a comparison with the current inputs and parameters. The window stays
+    # responsive while it runs.
+    job = {
+        "reference": input_ref_profile_var.get(),
+        "tcga": input_tcga_profile_var.get(),
+        "output_path": output_path_var.get(),
+        "add_missing": missing_values_var.get() == "True",
+        "show_output": show_output_var.get() == "True",
+        "method": method_var.get(),
+        "threshold": threshold_var.get(),
+        "profile": profile_var.get(),
+    }
+    jobs.put(job)
+    update_queue_label()
+
+
+def cancel_analysis():
+    # Cancel the running comparison (at the end of its current stage) and drop the
+    # queued ones.
+    while not jobs.empty():
+        try:
+            jobs.get_nowait()
+        except queue.Empty:
+            break
+    cancel_event.set()
+    update_queue_label()
+
+
+def run_analysis(job):
+    # Runs in the worker thread. Returns the results that the event loop shows.
+
+    def stage(name):
+        if cancel_event.is_set():
+            raise Cancelled()
+        events.put(("stage", STAGE_KEYS.index(name)))
+
+    # The pipeline is kept between comparisons: only the stages whose inputs or
+    # parameters changed are run again (e.g. a new threshold only re-runs the expression
+    # analysis).
+    pipeline.reference = job["reference"]
+    pipeline.sample = job["tcga"]
+    pipeline.add_missing = job["add_missing"]
+    pipeline.output = job["show_output"]
+    pipeline.method = job["method"]
+    try:
+        pipeline.threshold = float(job["threshold"])
+    except ValueError:
+        pipeline.threshold = 0.05
+    pipeline.on_stage = stage
+
+    # Opt-in run report of the stages ("True": times, "Memory": times and memory peaks),
+    # shown in the summary.
+    profile = job["profile"] in ("True", "Memory")
+    with instrumentation.profiling(job["profile"] == "Memory") if profile else nullcontext() as report:
+        results = pipeline.run()
+    results["report"] = report
+
+    stage("output")
+    file_path = job["output_path"] + "/OUTPUT_TEST.csv"
     with open(file_path, 'w+', newline = '') as csvfile:
         my_writer = csv.writer(csvfile, delimiter = ' ')
         text = ""
         text += "Missing Genes reference profile are:\n" #+ missing_TCGA
-        for gene in missing_reference:
+        for gene in results["missing_reference"]:
             text += f"\n{gene}"
 
         text += "\nMissing Genes TCGA profile are:" #+ missing_reference
-        for gene in missing_TCGA:
+        for gene in results["missing_TCGA"]:
             text += f"\n{gene}"
 
         my_writer.writerow("Hellloo")
         my_writer.writerow(text)
 
-        # TEST DOES IT WORK AT ALL?
-        print("HELLLLLLLOOOOO")
-
-    if show_output_var.get() == "True":
+    if job["show_output"]:
         print(text)
 
+    return results
+
+
+def worker():
+    # Worker thread: run the queued comparisons one after the other.
+    while True:
+        job = jobs.get()
+        cancel_event.clear()
+        events.put(("start", job))
+        try:
+            events.put(("done", job, run_analysis(job)))
+        except Cancelled:
+            events.put(("cancelled", job))
+        except Exception as error:
+            events.put(("error", job, error))
+
+
+def poll_events():
+    # Runs in the Tk event loop: show the progress and results of the worker.
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+
+        if event[0] == "start":
+            progress["value"] = 0
+            stage_text.set(f"Started: {event[1]['reference']} vs. {event[1]['tcga']}")
+        elif event[0] == "stage":
+            progress["value"] = event[1]
+            stage_text.set(f"{STAGES[event[1]]} ({event[1] + 1}/{len(STAGES)})")
+        elif event[0] == "done":
+            progress["value"] = len(STAGES)
+            stage_text.set("Done.")
+            show_results(event[1], event[2])
+        elif event[0] == "cancelled":
+            progress["value"] = 0
+            stage_text.set("Cancelled.")
+        elif event[0] == "error":
+            progress["value"] = 0
+            stage_text.set(f"Failed: {event[2]}")
+        update_queue_label()
+
+    window.after(100, poll_events)
+
+
+def update_queue_label():
+    queue_text.set(f"Queued comparisons: {jobs.qsize()}")
+
+
+def show_results(job, results):
     # Parameter and setting output:
-    if show_output_var.get() == "True":
+    if job["show_output"]:
         text = ""
         text += f"Function output is shown in the Terminal."
     else:
         text = ""
         text += f"Function output is not shown in the Terminal."
 
-    if missing_values_var.get() == "True":
+    if job["add_missing"]:
         text += f"\nMissing genes were added with zero expression values. No genes were dropped from the dataset."
     else:
         text += f"\nMissing genes were dropped from the dataset."
 
-    text += f"\nThe threshold sensitivity that determines similiarity between gene expression levels is {threshold_var.get()}."
-    text += f"\nThe chosen normalization method is {method_var.get()}."
+    text += ("\nThe threshold sensitivity that determines similiarity between gene "
+             f"expression levels is {job['threshold']}.")
+    text += f"\nThe chosen normalization method is {job['method']}."
     text += f"\nIf any genes are missing, they are collected in an external file."
+    if results["report"] is not None:
+        # Stages reused from the previous comparison are not in the report.
+        text += "\n\nRun report (stages computed for this comparison):\n" + results["report"].format()
     output_text1.set(text)
 
     # Analysis output:
     text = ""
-    text += f"The input expression levels have a pearson correlation coefficient of: {distance}."
+    text += ("The input expression levels have a pearson correlation coefficient of: "
+             f"{results['distance']}.")
     text += f"\nGenes with similiar expression levels threshold are collected in an external file."
     output_text2.set(text)
 
     # (2) Bar Chart:
-    gene_ratio, sim_genes = m.expression_analysis(profile, sample)
-    m.gene_bar_chart(gene_ratio)
+    chart_figure.clear()
+    m.gene_bar_chart(results["gene_ratio"], ax = chart_figure.add_subplot())
+    chart_figure.tight_layout()
+    chart_canvas.draw_idle()
 
 
 
@@ -214,12 +327,27 @@ ent_distance = tk.Entry(master=frm_param, width=30, textvariable = threshold_var
 lbl_distance.grid(row=3, column=0, sticky="e")
 ent_distance.grid(row=3, column=1)
 
+lbl_profile = tk.Label(master=frm_param, text="Profile Stages (True/Memory):")
+ent_profile = tk.Entry(master=frm_param, width=30, textvariable = profile_var)
+lbl_profile.grid(row=4, column=0, sticky="e")
+ent_profile.grid(row=4, column=1)
+
 
 # Analysis Button Frame
 frm_Analysis = tk.Frame()
 frm_Analysis.pack(fill=tk.X, ipadx=5, ipady=5)
 btn_Analysis = tk.Button(master=frm_Analysis, text="Start Analysis", command=analysis)
 btn_Analysis.pack(side=tk.LEFT, ipadx=10)
+btn_Cancel = tk.Button(master=frm_Analysis, text="Cancel", command=cancel_analysis)
+btn_Cancel.pack(side=tk.LEFT, ipadx=10)
+
+# Progress of the running comparison
+progress = ttk.Progressbar(master=frm_Analysis, maximum=len(STAGES), length=250, mode="determinate")
+progress.pack(side=tk.LEFT, padx=10)
+lbl_stage = tk.Label(master=frm_Analysis, textvariable=stage_text)
+lbl_stage.pack(side=tk.LEFT)
+lbl_queue = tk.Label(master=frm_Analysis, textvariable=queue_text)
+lbl_queue.pack(side=tk.RIGHT)
 
 
 
@@ -233,6 +361,7 @@ lbl_output_window1 = tk.Label(
     bg="white",
     relief=tk.SUNKEN, 
     borderwidth=1,
+    font=("Courier", 10),
     #anchor='w', 
     #justify='left'
 )
@@ -250,6 +379,12 @@ lbl_output_window2 = tk.Label(
 )
 lbl_output_window2.pack(fill=tk.X, ipadx=30, ipady=30)
 
+# Bar chart of the last comparison, embedded in the window
+chart_figure = Figure(figsize=(7, 4))
+chart_canvas = FigureCanvasTkAgg(chart_figure, master=window)
+chart_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+
 
 
 
@@ -259,5 +394,8 @@ lbl_output_window2.pack(fill=tk.X, ipadx=30, ipady=30)
 
 
 
+threading.Thread(target=worker, daemon=True).start()
+window.after(100, poll_events)
+update_queue_label()
 
 window.mainloop()
@@ -5,7 +5,11 @@ from tkinter import filedialog
 import pandas as pd
 import numpy as np
 from functools import partial
-import match_computation as m
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from TCGA_code import match_computation as m  # noqa: E402
+from TCGA_code.pipeline import MatchPipeline  # noqa: E402
 
 # START WINDOW EVENT LOOP:
 window = tk.Tk()
@@ -21,6 +25,7 @@ show_output_var = tk.StringVar()
 info_text = tk.StringVar()
 output_text = tk.StringVar()
 window_text = ""
+pipeline = MatchPipeline()
 
 def browseFiles_reference():
     # Change the default to "/" and allow user input. 
@@ -58,37 +63,21 @@ def analysis():
     # IF INPUT PATHS ARE EMPTY RETURN MESSAGE TO THE OUTPUT WINDOW!
 
 
-    # Pre-process data:
-    #input_profile = m.read_expr_profile(input_profile_path)
-    path = input_ref_profile_var.get()
-    input_profile = pd.read_csv(path, sep = ";", encoding="UTF-8")
-    # Average the duplicate values
-    input_profile = input_profile.groupby('symbol', as_index=False).mean()
-
-    #input_sample_data = m.read_TCGA_sample(input_sample_data_path)
-    path = input_tcga_profile_var.get()
-    input_sample_data = pd.read_csv(path, sep = ";", encoding="UTF-8")
-    # Average the duplicate values
-    input_sample_data = input_sample_data.groupby('symbol', as_index=False).mean()
+    # Read, clean and normalize the data sets, then compare them. The pipeline keeps the
+    # results of every stage, so running the analysis again only re-runs the stages
+    # whose inputs or parameters changed.
+    pipeline.reference = input_ref_profile_var.get()
+    pipeline.sample = input_tcga_profile_var.get()
+    pipeline.add_missing = missing_values_var.get() == "True"
+    pipeline.output = show_output_var.get() == "True"
+    pipeline.method = method_var.get()
 
-    # Clean data:
-    profile, sample, missing_TCGA = m.check_TCGA(input_profile, input_sample_data, missing_values_var.get() == "True", show_output_var.get() == "True")
-    profile, sample, missing_reference = m.check_profile(profile, sample, missing_values_var.get() == "True", show_output_var.get() == "True")
-
-    # Normalize data sets
-    profile = m.normalize_profile(profile, method_var.get())
-    sample = m.normalize_profile(sample, method_var.get())
-
-    # "profile" and "sample" are now pre-processed and clean.
-
-    # MAYBE: YOU SHOULD CHECK FOR ISNAN OR ISINF HERE FOR profile, input_tcga_profile_df
-
-    
-    gene_ratio, sim_genes = m.expression_analysis(profile, sample)
+    gene_ratio, sim_genes = pipeline.expression()
     m.gene_bar_chart(gene_ratio)
 
     # Compute distance:
-    distance = m.compute_distance(profile, sample)
+    distance = pipeline.distance()
+    _, _, missing_TCGA, missing_reference = pipeline.reconciled()
 
     if show_output_var.get() == "True":
         text = ""
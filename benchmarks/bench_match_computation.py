@@ -0,0 +1,147 @@
+'''
+Benchmarks of the match_computation hot paths on synthetic GENCODE sized data (see
+TCGA_code.synthetic).
+
+Every benchmark runs at several gene counts and reports the median wall time and the
+tracemalloc peak. Results can be saved as a baseline and compared against one; the
+comparison fails (exit code 1) if a benchmark got slower than the baseline by more than
+the tolerance factor.
+
+    python benchmarks/bench_match_computation.py                      # run and print
+    python benchmarks/bench_match_computation.py --save baseline.json
+    python benchmarks/bench_match_computation.py --compare benchmarks/baselines.json
+
+The file is not named test_*.py, so pytest does not collect it. Baselines depend on the
+machine: regenerate them with --save on the machine that compares against them.
+'''
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import matplotlib  # noqa: E402
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+from TCGA_code import match_computation as m  # noqa: E402
+from TCGA_code import synthetic  # noqa: E402
+
+
+SIZES = [1000, 10000, synthetic.GENCODE_GENES]
+
+
+def _data(n_genes, directory):
+    # Reference profile and TCGA sample of one size, as dataframes and as files.
+    reference = synthetic.synthetic_profile(n_genes, seed = 0)
+    sample = synthetic.synthetic_profile(n_genes, seed = 1)
+    files = {"reference": Path(directory) / f"reference_{n_genes}.csv", "sample": Path(directory) / f"sample_{n_genes}.csv"}
+    synthetic.write_profile(reference, files["reference"])
+    synthetic.write_profile(sample, files["sample"])
+    reference = m.read_expr_profile(files["reference"])
+    sample = m.read_TCGA_sample(files["sample"])
+    checked_reference, checked_sample, _ = m.check_profile(reference, sample, output = False)
+    checked_reference, checked_sample, _ = m.check_TCGA(checked_reference, checked_sample, output = False)
+    gene_ratio = m.expression_analysis(checked_reference, checked_sample)[0]
+    return {"files": files, "reference": reference, "sample": sample, "checked": (checked_reference, checked_sample), "gene_ratio": gene_ratio}
+
+
+def _bar_chart(gene_ratio):
+    figure, ax = plt.subplots()
+    m.gene_bar_chart(gene_ratio, ax = ax)
+    plt.close(figure)
+
+
+# name -> function of the prepared data. The readers bypass the parse cache, they time
+# the parsing itself.
+BENCHMARKS = {
+    "read_expr_profile": lambda data: m.load_expression_file(data["files"]["reference"], cache = False),
+    "read_TCGA_sample": lambda data: m.load_expression_file(data["files"]["sample"], cache = False),
+    "check_profile": lambda data: m.check_profile(data["reference"], data["sample"], output = False),
+    "check_TCGA": lambda data: m.check_TCGA(data["reference"], data["sample"], output = False),
+    "normalize_profile": lambda data: m.normalize_profile(data["reference"], "z-score"),
+    "compute_distance": lambda data: m.compute_distance(*data["checked"]),
+    "expression_analysis": lambda data: m.expression_analysis(*data["checked"]),
+    "gene_bar_chart": lambda data: _bar_chart(data["gene_ratio"]),
+}
+
+
+def measure(function, data, repeat = 5):
+    '''
+    Median wall time (seconds) of repeat runs and the tracemalloc peak (bytes) of one
+    extra run.
+    '''
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(data)
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    function(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"time": statistics.median(times), "peak_bytes": peak}
+
+
+def run(sizes = SIZES, names = None, repeat = 5, output = True):
+    '''
+    Run the benchmarks. Returns {name: {size: {"time": seconds, "peak_bytes": bytes}}}
+    (sizes as strings, like in the baseline files).
+    '''
+    names = list(BENCHMARKS) if names is None else names
+    results = {name: {} for name in names}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_genes in sizes:
+            data = _data(n_genes, directory)
+            for name in names:
+                results[name][str(n_genes)] = measure(BENCHMARKS[name], data, repeat)
+                if output:
+                    result = results[name][str(n_genes)]
+                    milliseconds, megabytes = result["time"] * 1000, result["peak_bytes"] / 2**20
+                    print(f"{name:<22}{n_genes:>8} genes",
+                          f"{milliseconds:>10.2f} ms {megabytes:>9.2f} MB", flush = True)
+    return results
+
+
+def compare(results, baseline, tolerance = 1.5):
+    '''
+    Benchmarks that take more than tolerance times their baseline time. Returns a list
+    of (name, size, time, baseline).
+    '''
+    regressions = []
+    for name, sizes in results.items():
+        for size, result in sizes.items():
+            reference = baseline.get(name, {}).get(size)
+            if reference is not None and result["time"] > tolerance * reference["time"]:
+                regressions.append((name, size, result["time"], reference["time"]))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the match_computation hot paths on synthetic data.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = SIZES, help = "gene counts (default: 1000 10000 60660)")
+    parser.add_argument("--only", nargs = "+", choices = list(BENCHMARKS), help = "run only these benchmarks")
+    parser.add_argument("--repeat", type = int, default = 5, help = "runs per benchmark (default 5)")
+    parser.add_argument("--save", help = "write the results to this .json baseline file")
+    parser.add_argument("--compare", help = "compare the results with this .json baseline file")
+    parser.add_argument("--tolerance", type = float, default = 1.5, help = "allowed slowdown factor against the baseline (default 1.5)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.only, args.repeat)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent = 2) + "\n")
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for name, size, seconds, baseline in regressions:
+            print(f"REGRESSION {name} ({size} genes): {seconds * 1000:.2f} ms, "
+                  f"baseline {baseline * 1000:.2f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
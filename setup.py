@@ -2,4 +2,5 @@ from setuptools import setup
 
 setup(name = "TCGA_Matchmaker",
 	version = "0.1.0",
-	packages = ["TCGA_code"])
\ No newline at end of file
+	packages = ["TCGA_code"],
+	entry_points = {"console_scripts": ["tcga-matchmaker = TCGA_code.cli:main"]})
\ No newline at end of file